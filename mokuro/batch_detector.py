@@ -0,0 +1,98 @@
+import cv2
+import numpy as np
+import torch
+from comic_text_detector.inference import postprocess_mask, postprocess_yolo
+from comic_text_detector.utils.textblock import group_output
+from comic_text_detector.utils.textmask import REFINEMASK_ANNOTATION, refine_mask, refine_undetected_mask
+
+from mokuro.tracing import span
+
+
+class BatchTextDetector:
+    """Runs comic_text_detector's TextDetector on multiple pages with one forward pass.
+
+    Pages are resized and padded (letterboxed) directly into a preallocated input batch, which is reused across
+    calls. Outputs are mapped back to each page's original coordinates with the same post-processing as
+    TextDetector.__call__, so the results are the same as when pages are detected one by one.
+    """
+
+    def __init__(self, text_detector, max_batch_size):
+        self.text_detector = text_detector
+        self.max_batch_size = max_batch_size
+        input_w, input_h = text_detector.input_size
+        self._batch = np.zeros((max_batch_size, 3, input_h, input_w), dtype=np.float32)
+
+    @torch.no_grad()
+    def __call__(self, imgs, refine_mode=REFINEMASK_ANNOTATION, keep_undetected_mask=True):
+        """Detect text on a list of BGR pages. Returns a list of (mask, mask_refined, blk_list), one for each page."""
+        results = []
+        for i in range(0, len(imgs), self.max_batch_size):
+            results.extend(self._detect_batch(imgs[i : i + self.max_batch_size], refine_mode, keep_undetected_mask))
+        return results
+
+    def _detect_batch(self, imgs, refine_mode, keep_undetected_mask):
+        detector = self.text_detector
+        batch = self._batch[: len(imgs)]
+        paddings = [self._letterbox(img, out) for img, out in zip(imgs, batch, strict=True)]
+
+        batch_in = torch.from_numpy(batch).to(detector.device)
+        if detector.half:
+            batch_in = batch_in.half()
+        blks, masks, lines_maps = detector.net(batch_in)
+
+        results = []
+        for i, (img, (dw, dh)) in enumerate(zip(imgs, paddings, strict=True)):
+            # post-processing modifies its inputs in place, so each page gets its own copy instead of a view
+            blks_i, mask_i, lines_map_i = (output[i : i + 1].clone() for output in (blks, masks, lines_maps))
+            results.append(
+                self._postprocess(img, blks_i, mask_i, lines_map_i, dw, dh, refine_mode, keep_undetected_mask)
+            )
+        return results
+
+    def _letterbox(self, img, out):
+        """Same as letterbox in TextDetector's preprocessing, but written into `out` (3, H, W), scaled to 0..1."""
+        input_w, input_h = self.text_detector.input_size
+        h, w = img.shape[:2]
+        r = min(input_h / h, input_w / w)
+        new_w, new_h = round(w * r), round(h * r)
+
+        if (w, h) != (new_w, new_h):
+            img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+
+        out[:, new_h:, :] = 0
+        out[:, :new_h, new_w:] = 0
+        np.divide(img.transpose(2, 0, 1), np.float32(255), out=out[:, :new_h, :new_w])
+        return input_w - new_w, input_h - new_h
+
+    def _postprocess(self, img, blks, mask, lines_map, dw, dh, refine_mode, keep_undetected_mask):
+        """Post-processing of one page, as in TextDetector.__call__."""
+        detector = self.text_detector
+        input_w, input_h = detector.input_size
+        im_h, im_w = img.shape[:2]
+
+        resize_ratio = (im_w / (input_w - dw), im_h / (input_h - dh))
+        blks = postprocess_yolo(blks, detector.conf_thresh, detector.nms_thresh, resize_ratio)
+        mask = postprocess_mask(mask)
+
+        lines, scores = detector.seg_rep(detector.input_size, lines_map)
+        box_thresh = 0.6
+        idx = np.where(scores[0] > box_thresh)
+        lines, scores = lines[0][idx], scores[0][idx]
+
+        mask = mask[: mask.shape[0] - dh, : mask.shape[1] - dw]
+        mask = cv2.resize(mask, (im_w, im_h), interpolation=cv2.INTER_LINEAR)
+        if lines.size == 0:
+            lines = []
+        else:
+            lines = lines.astype(np.float64)
+            lines[..., 0] *= resize_ratio[0]
+            lines[..., 1] *= resize_ratio[1]
+            lines = lines.astype(np.int32)
+
+        blk_list = group_output(blks, lines, im_w, im_h, mask)
+        with span("refine", num_blocks=len(blk_list)):
+            mask_refined = refine_mask(img, mask, blk_list, refine_mode=refine_mode)
+            if keep_undetected_mask:
+                mask_refined = refine_undetected_mask(img, mask, mask_refined, blk_list, refine_mode=refine_mode)
+
+        return mask, mask_refined, blk_list
@@ -0,0 +1,276 @@
+import io
+import json
+import platform
+import sys
+import time
+from collections import Counter
+from itertools import pairwise
+from pathlib import Path
+
+import fire
+import numpy as np
+from loguru import logger
+from natsort import natsorted
+from PIL import Image, ImageDraw, ImageFont
+
+from mokuro import __version__
+from mokuro.tracing import record_spans, span
+from mokuro.utils import NumpyEncoder, PageImage, dump_json, imdecode, load_json
+
+STAGES = ("decode", "detect", "refine", "crop_split", "recognize", "serialize")
+
+# characters for synthetic text, which can be drawn with PIL's default font
+SYNTHETIC_CHARS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789!?"
+
+
+def make_synthetic_page(width=1654, height=2339, text_density=0.15, vertical_fraction=0.8, seed=0):
+    """Generate a manga-like page with panels, line art and speech bubbles with text, encoded as JPEG.
+
+    Args:
+        width: Page width in pixels.
+        height: Page height in pixels.
+        text_density: Approximate fraction of the page area covered by speech bubbles.
+        vertical_fraction: Fraction of bubbles with vertical text; the rest have horizontal text.
+        seed: Random seed, the same seed gives the same page.
+    """
+    rng = np.random.default_rng(seed)
+    img = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(img)
+    margin = width // 20
+
+    # panels with line art
+    num_rows = int(rng.integers(2, 5))
+    row_edges = np.linspace(margin, height - margin, num_rows + 1).astype(int)
+    for y0, y1 in pairwise(row_edges):
+        num_cols = int(rng.integers(1, 4))
+        col_edges = np.linspace(margin, width - margin, num_cols + 1).astype(int)
+        for x0, x1 in pairwise(col_edges):
+            box = (x0 + 8, y0 + 8, x1 - 8, y1 - 8)
+            draw.rectangle(box, outline=0, width=4)
+            for _ in range(int(rng.integers(5, 30))):
+                points = [(rng.integers(box[0], box[2]), rng.integers(box[1], box[3])) for _ in range(2)]
+                draw.line(points, fill=int(rng.integers(0, 160)), width=int(rng.integers(1, 6)))
+
+    # speech bubbles, until they cover text_density of the page
+    font_size = max(12, width // 50)
+    font = ImageFont.load_default(size=font_size)
+    bubbles_area = 0
+    while bubbles_area < text_density * width * height:
+        vertical = rng.random() < vertical_fraction
+        num_lines = int(rng.integers(1, 6))
+        line_length = int(rng.integers(2, 12))
+        text_w, text_h = num_lines * font_size * 1.4, line_length * font_size * 1.1
+        if not vertical:
+            text_w, text_h = line_length * font_size * 0.8, num_lines * font_size * 1.4
+        bubble_w, bubble_h = int(text_w * 1.5 + font_size), int(text_h * 1.4 + font_size)
+        if bubble_w >= width - 2 * margin or bubble_h >= height - 2 * margin:
+            break
+
+        x0 = int(rng.integers(margin, width - margin - bubble_w))
+        y0 = int(rng.integers(margin, height - margin - bubble_h))
+        draw.ellipse((x0, y0, x0 + bubble_w, y0 + bubble_h), fill=255, outline=0, width=3)
+        bubbles_area += bubble_w * bubble_h
+
+        tx0, ty0 = x0 + (bubble_w - text_w) / 2, y0 + (bubble_h - text_h) / 2
+        for line_idx in range(num_lines):
+            chars = rng.choice(list(SYNTHETIC_CHARS), line_length)
+            if vertical:
+                # lines of vertical text go right to left
+                x = tx0 + text_w - (line_idx + 1) * font_size * 1.4
+                for char_idx, char in enumerate(chars):
+                    draw.text((x, ty0 + char_idx * font_size * 1.1), char, fill=0, font=font)
+            else:
+                draw.text((tx0, ty0 + line_idx * font_size * 1.4), "".join(chars), fill=0, font=font)
+
+    buf = io.BytesIO()
+    img.convert("RGB").save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def get_peak_rss_mb():
+    """Peak resident set size of this process in MB, or None if it's not available on this platform."""
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return max_rss / 1e6 if sys.platform == "darwin" else max_rss / 1e3
+
+
+def get_stage_times(events):
+    """Total time in seconds of each stage, from the spans recorded while the pages were processed.
+
+    Spans of detect, refine, crop_split and recognize are recorded by MangaPageOcr and the batch detector.
+    """
+    times = Counter()
+    for event in events:
+        if event["ph"] == "X":
+            times[event["name"]] += event["dur"] / 1e6
+
+    # refinement runs inside detection
+    times["detect"] -= times["refine"]
+    return {stage: times[stage] for stage in STAGES}
+
+
+def run_benchmark(pages, mpocr, warmup=True):
+    """Process pages one by one with a MangaPageOcr and measure the time of each stage.
+
+    pages is a list of (name, image file content). Returns a dict with results.
+    """
+    if not pages:
+        raise ValueError("No pages to benchmark")
+
+    def decode(data, name):
+        if mpocr.reduced_decode:
+            return PageImage(data, mpocr.detector_input_size, name)
+        return imdecode(data, name)
+
+    with record_spans() as tracer:
+        if warmup:
+            img = decode(pages[0][1], pages[0][0])
+            mpocr.recognize_page(img, mpocr.detect(img))
+            tracer.events.clear()
+
+        start = time.perf_counter()
+        for name, data in pages:
+            with span("decode"):
+                img = decode(data, name)
+            detection = mpocr.detect(img, name=name)
+            result = mpocr.recognize_page(img, detection)
+            with span("serialize"):
+                json.dumps(result, ensure_ascii=False, cls=NumpyEncoder)
+        total_time = time.perf_counter() - start
+
+    num_pages = len(pages)
+    stage_times = get_stage_times(tracer.events)
+    return {
+        "num_pages": num_pages,
+        "total_time": total_time,
+        "pages_per_sec": num_pages / total_time,
+        "stages_ms_per_page": {stage: 1000 * stage_time / num_pages for stage, stage_time in stage_times.items()},
+        "peak_rss_mb": get_peak_rss_mb(),
+    }
+
+
+def compare_results(results, baseline, tolerance=0.1):
+    """Compare benchmark results with a baseline. Returns a list of (metric, baseline value, value, relative change,
+    regressed), where regressed means worse than the baseline by more than tolerance.
+    """
+    metrics = [("pages_per_sec", results.get("pages_per_sec"), baseline.get("pages_per_sec"), True)]
+    metrics.extend(
+        (
+            f"{stage}_ms_per_page",
+            results.get("stages_ms_per_page", {}).get(stage),
+            baseline.get("stages_ms_per_page", {}).get(stage),
+            False,
+        )
+        for stage in STAGES
+    )
+    metrics.append(("peak_rss_mb", results.get("peak_rss_mb"), baseline.get("peak_rss_mb"), False))
+
+    comparison = []
+    for metric, value, baseline_value, higher_is_better in metrics:
+        if value is None or not baseline_value:
+            continue
+        change = (value - baseline_value) / baseline_value
+        regressed = change < -tolerance if higher_is_better else change > tolerance
+        comparison.append((metric, baseline_value, value, change, regressed))
+    return comparison
+
+
+def benchmark(
+    *paths,
+    num_synthetic_pages=10,
+    width=1654,
+    height=2339,
+    text_density=0.15,
+    vertical_fraction=0.8,
+    seed=0,
+    output=None,
+    baseline=None,
+    tolerance=0.1,
+    **mpocr_kwargs,
+):
+    """Measure OCR throughput, per-stage time and peak memory, offline, e.g. on synthetic pages and the test pages:
+
+    python -m mokuro.benchmark tests/data/input --output benchmark.json --baseline baseline.json
+
+    Pages are processed one by one, so that stage times add up. Stages: decode, detect (text detection without
+    mask refinement), refine, crop_split (line crops), recognize (OCR), serialize (JSON). Stage times are taken
+    from the tracing spans of the pipeline (see mokuro.tracing); comic_text_detector's own detector, which detects
+    single pages, records no refinement span, so for it refinement is a part of detect.
+
+    Args:
+        paths: Page images, or directories which are searched for page images recursively.
+        num_synthetic_pages: Number of generated pages, processed after the pages from paths.
+        width: Width of synthetic pages.
+        height: Height of synthetic pages.
+        text_density: Approximate fraction of synthetic page area covered by speech bubbles.
+        vertical_fraction: Fraction of speech bubbles with vertical text on synthetic pages.
+        seed: Random seed of synthetic pages.
+        output: Path to save the results to, as JSON.
+        baseline: Path to results of a previous run, to compare with.
+        tolerance: Relative change of a metric, over which it's reported as a regression.
+        mpocr_kwargs: Options of MangaPageOcr, e.g. --force_cpu, --detector_backend onnxruntime, --quantize_ocr.
+    """
+    from mokuro.manga_page_ocr import MangaPageOcr
+    from mokuro.volume import IMG_SUFFIXES
+
+    img_paths = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            img_paths.extend(natsorted(p for p in path.rglob("*") if p.suffix.lower() in IMG_SUFFIXES))
+        else:
+            img_paths.append(path)
+
+    pages = [(str(img_path), img_path.read_bytes()) for img_path in img_paths]
+    synthetic_config = {
+        "width": width,
+        "height": height,
+        "text_density": text_density,
+        "vertical_fraction": vertical_fraction,
+    }
+    pages.extend(
+        (f"synthetic_{i}", make_synthetic_page(**synthetic_config, seed=seed + i)) for i in range(num_synthetic_pages)
+    )
+
+    mpocr = MangaPageOcr(**mpocr_kwargs)
+    logger.info(f"Benchmarking on {len(pages)} pages")
+    results = {
+        "version": __version__,
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "config": {
+            "paths": [str(path) for path in paths],
+            "num_synthetic_pages": num_synthetic_pages,
+            **synthetic_config,
+            "seed": seed,
+            "mpocr_kwargs": mpocr_kwargs,
+        },
+        **run_benchmark(pages, mpocr),
+    }
+
+    logger.info(f"{results['pages_per_sec']:.2f} pages/s, peak RSS {results['peak_rss_mb']} MB")
+    for stage, ms in results["stages_ms_per_page"].items():
+        logger.info(f"{stage}: {ms:.1f} ms/page")
+
+    if output is not None:
+        dump_json(results, output)
+        logger.info(f"Saved results to {output}")
+
+    if baseline is not None:
+        comparison = compare_results(results, load_json(baseline), tolerance=tolerance)
+        for metric, baseline_value, value, change, regressed in comparison:
+            logger.info(
+                f"{metric}: {baseline_value:.2f} -> {value:.2f} ({change:+.1%}){' REGRESSION' if regressed else ''}"
+            )
+        if any(regressed for *_, regressed in comparison):
+            logger.warning(f"Regressions over {tolerance:.0%} compared to {baseline}")
+
+    return results
+
+
+if __name__ == "__main__":
+    fire.Fire(benchmark)
@@ -7,8 +7,8 @@ from loguru import logger
 
 class cache:
     def __init__(self):
+        # the directory is created when something is saved in it, not on import
         self.root = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "manga-ocr"
-        self.root.mkdir(parents=True, exist_ok=True)
 
     @property
     def comic_text_detector(self):
@@ -21,6 +21,7 @@ class cache:
     def _download_if_needed(self, path, url):
         if not path.is_file():
             logger.info(f"Downloading {url}")
+            path.parent.mkdir(parents=True, exist_ok=True)
             r = requests.get(url, stream=True, verify=True)
             if r.status_code != 200:
                 raise RuntimeError(f"Failed downloading {url}")
@@ -0,0 +1,96 @@
+import json
+import os
+from pathlib import Path
+
+from mokuro import __version__
+from mokuro.utils import dump_json, get_file_signature, load_json, load_json_header
+
+# metadata which must be in the header of every .mokuro file
+REQUIRED_HEADER_KEYS = ("volume_uuid", "title_uuid")
+
+
+def read_mokuro_header(path_mokuro):
+    """Metadata of a .mokuro file (everything but the pages), read without parsing the pages.
+
+    mokuro writes the pages last; a file with pages before the metadata (e.g. saved by another tool, with sorted
+    keys) is parsed fully.
+    """
+    header = load_json_header(path_mokuro, stop_key="pages")
+    if not all(key in header for key in REQUIRED_HEADER_KEYS):
+        header = load_json(path_mokuro)
+        header.pop("pages", None)
+    return header
+
+
+class TitleCatalog:
+    """Metadata of all .mokuro files of a title, stored in <title dir>/_ocr/catalog.json
+
+    For each .mokuro file, the catalog records its uuids, mokuro version, number of pages, and whether it's
+    partial, along with the size and mtime of the file. Entries of unchanged files are used as they are, entries
+    of changed files are refreshed with a header-only read (number of pages is then unknown, until the file is
+    written by mokuro again).
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.volumes = {}
+        self._modified = False
+
+    @classmethod
+    def load(cls, path):
+        """Load a catalog; a missing or unreadable catalog is treated as empty."""
+        catalog = cls(path)
+        try:
+            data = load_json(path)
+        except (FileNotFoundError, json.JSONDecodeError, UnicodeDecodeError):
+            return catalog
+
+        if data.get("version") == __version__:
+            catalog.volumes = data.get("volumes", {})
+        return catalog
+
+    def save(self):
+        if not self._modified:
+            return
+
+        data = {
+            "version": __version__,
+            "volumes": self.volumes,
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        path_tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        dump_json(data, path_tmp)
+        os.replace(path_tmp, self.path)
+        self._modified = False
+
+    def get(self, path_mokuro):
+        """Catalog entry of a .mokuro file, refreshed if the file changed since it was recorded."""
+        path_mokuro = Path(path_mokuro)
+        entry = self.volumes.get(path_mokuro.name)
+        if entry is not None and tuple(entry["signature"]) == get_file_signature(path_mokuro):
+            return entry
+
+        return self.update(path_mokuro, read_mokuro_header(path_mokuro))
+
+    def update(self, path_mokuro, header, num_pages=None):
+        """Record a .mokuro file, after it was written with the given header."""
+        path_mokuro = Path(path_mokuro)
+        entry = {
+            "signature": get_file_signature(path_mokuro),
+            "mokuro_version": header.get("version"),
+            "title_uuid": header.get("title_uuid"),
+            "volume_uuid": header.get("volume_uuid"),
+            "num_pages": num_pages,
+            "partial": header.get("partial", False),
+        }
+        self.volumes[path_mokuro.name] = entry
+        self._modified = True
+        return entry
+
+    def prune(self, paths_mokuro):
+        """Remove entries of .mokuro files other than the given ones, e.g. deleted volumes."""
+        names = {Path(path_mokuro).name for path_mokuro in paths_mokuro}
+        for name in list(self.volumes):
+            if name not in names:
+                del self.volumes[name]
+                self._modified = True
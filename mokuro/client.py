@@ -0,0 +1,97 @@
+import http.client
+import json
+import socket
+from urllib.parse import urlsplit
+
+from tqdm import tqdm
+
+from mokuro.events import EventEmitter
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a Unix socket."""
+
+    def __init__(self, path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.unix_path)
+
+
+def connect(server, timeout=None):
+    """Connection to a mokuro server, given as http://host:port or unix:<socket path>."""
+    if server.startswith("unix:"):
+        return UnixHTTPConnection(server.removeprefix("unix:"), timeout=timeout)
+
+    url = urlsplit(server if "://" in server else f"http://{server}")
+    if url.scheme != "http":
+        raise ValueError(f"Unsupported server address {server}, expected http://host:port or unix:<socket path>")
+    return http.client.HTTPConnection(url.hostname, url.port, timeout=timeout)
+
+
+def get_status(server):
+    conn = connect(server, timeout=10)
+    try:
+        conn.request("GET", "/status")
+        return _read_json_response(conn.getresponse())
+    finally:
+        conn.close()
+
+
+def submit_job(server, job_type, path, priority=0, **options):
+    """Submit a "volume" or "page" job to a mokuro server (see mokuro.server) and yield its events as they arrive,
+    ending with "job_finish". Page jobs have the OCR result in a "page_result" event.
+    """
+    request = {"type": job_type, "path": str(path), "priority": priority, "options": options}
+    conn = connect(server)
+    try:
+        conn.request("POST", "/jobs", body=json.dumps(request), headers={"Content-Type": "application/json"})
+        response = conn.getresponse()
+        if response.status != 200:
+            _read_json_response(response)
+
+        for line in response:
+            event = json.loads(line)
+            yield event
+            if event["event"] == "job_finish":
+                return
+    finally:
+        conn.close()
+
+    raise ConnectionError(f"Server closed the connection before the job finished: {job_type} {path}")
+
+
+def process_volumes_on_server(server, volumes, priority=0, event_callback=None, **options):
+    """Process volumes with a mokuro server, one job after another. Yields (volume, error) tuples like
+    MokuroGenerator.process_volumes, and passes all events of the jobs to event_callback.
+    """
+    events = EventEmitter(event_callback)
+    for volume in volumes:
+        pbar = None
+        error = None
+        try:
+            for event in submit_job(server, "volume", volume.path_in, priority=priority, **options):
+                events.forward(event)
+                if event["event"] == "volume_start":
+                    pbar = tqdm(desc="Processing pages...", total=event["num_pages"], initial=event["num_cached"])
+                elif event["event"] == "page_done" and pbar is not None:
+                    pbar.update()
+                elif event["event"] == "job_finish" and event["error"] is not None:
+                    error = RuntimeError(f"Job failed on the server: {event['error']}")
+        # connection, protocol and server errors fail only this volume
+        except (OSError, http.client.HTTPException, ValueError, RuntimeError) as e:
+            error = e
+        finally:
+            if pbar is not None:
+                pbar.close()
+
+        yield volume, error
+
+
+def _read_json_response(response):
+    data = json.loads(response.read())
+    if response.status != 200:
+        raise RuntimeError(f"Server error {response.status}: {data.get('error')}")
+    return data
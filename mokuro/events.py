@@ -0,0 +1,158 @@
+import json
+import threading
+import time
+from collections import Counter, deque
+from pathlib import Path
+
+from loguru import logger
+
+# pages/sec is computed over this many most recently finished pages
+ROLLING_WINDOW = 20
+
+
+class ThroughputMeter:
+    """Rolling pages/sec over the last `window` pages, and ETA of the remaining pages."""
+
+    def __init__(self, window=ROLLING_WINDOW):
+        self.num_total = 0
+        self.num_done = 0
+        self._times = deque(maxlen=window + 1)
+
+    def add_pages(self, num):
+        if not self._times:
+            self._times.append(time.perf_counter())
+        self.num_total += num
+
+    def page_done(self):
+        self.num_done += 1
+        self._times.append(time.perf_counter())
+
+    def get_progress(self):
+        elapsed = self._times[-1] - self._times[0] if self._times else 0
+        pages_per_sec = (len(self._times) - 1) / elapsed if elapsed > 0 else None
+        num_remaining = max(0, self.num_total - self.num_done)
+        return {
+            "pages_done": self.num_done,
+            "pages_total": self.num_total,
+            "pages_per_sec": pages_per_sec,
+            "eta_sec": num_remaining / pages_per_sec if pages_per_sec else None,
+        }
+
+
+class EventEmitter:
+    """Emits progress events, as dicts passed to a callback, which can be used to monitor processing
+    (e.g. by an orchestrator, with JsonlEventSink). Every event has "event" (type) and "time" (unix time) fields.
+
+    Event types:
+        run_start: num_volumes
+        volume_start: volume, num_pages, num_cached (pages with up to date results, which aren't processed again),
+            num_to_process
+        page_done: volume, page, error (repr, None on success), ocr_store_hit, timings (seconds of "read", "detect"
+            and "recognize" stages; detection time of a batch of pages is split between them evenly)
+        progress: pages_done, pages_total, pages_per_sec (rolling), eta_sec; pages_total includes pages of volumes
+            started so far; emitted after each page_done
+        volume_finish: volume, error, duration, num_processed, num_errors, num_cached, ocr_store_hits,
+            ocr_store_misses
+        run_finish: num_volumes, num_successful
+
+    Errors in the callback are logged and don't interrupt processing. With callback=None, nothing is emitted.
+    """
+
+    def __init__(self, callback=None, window=ROLLING_WINDOW):
+        self.callback = callback
+        self.throughput = ThroughputMeter(window)
+        self._volumes = {}
+
+    def emit(self, event, **fields):
+        if self.callback is None:
+            return
+
+        self.forward({"event": event, "time": time.time(), **fields})
+
+    def forward(self, event):
+        """Pass an event emitted elsewhere, e.g. received from a server, to the callback."""
+        if self.callback is None:
+            return
+
+        # a failing callback (which can be any user function) must not stop processing
+        try:
+            self.callback(event)
+        except Exception:  # noqa: BLE001
+            logger.exception(f"Error in event callback, event {event.get('event')}")
+
+    def volume_start(self, volume, num_pages, num_cached):
+        num_to_process = num_pages - num_cached
+        self._volumes[volume] = {"start": time.perf_counter(), "stats": Counter(num_cached=num_cached)}
+        self.throughput.add_pages(num_to_process)
+        self.emit(
+            "volume_start", volume=volume, num_pages=num_pages, num_cached=num_cached, num_to_process=num_to_process
+        )
+
+    def page_done(self, volume, page, error=None, ocr_store_hit=None, timings=None):
+        stats = self._volumes.setdefault(volume, {"start": time.perf_counter(), "stats": Counter()})["stats"]
+        stats["num_processed"] += 1
+        stats["num_errors"] += error is not None
+        if ocr_store_hit is not None:
+            stats["ocr_store_hits" if ocr_store_hit else "ocr_store_misses"] += 1
+
+        self.throughput.page_done()
+        if self.callback is None:
+            return
+
+        self.emit(
+            "page_done",
+            volume=volume,
+            page=page,
+            error=repr(error) if error is not None else None,
+            ocr_store_hit=ocr_store_hit,
+            timings=timings or {},
+        )
+        self.emit("progress", **self.throughput.get_progress())
+
+    def volume_finish(self, volume, error=None):
+        state = self._volumes.pop(volume, None)
+        duration = time.perf_counter() - state["start"] if state is not None else None
+        stats = state["stats"] if state is not None else Counter()
+        self.emit(
+            "volume_finish",
+            volume=volume,
+            error=repr(error) if error is not None else None,
+            duration=duration,
+            **{
+                key: stats[key]
+                for key in ["num_processed", "num_errors", "num_cached", "ocr_store_hits", "ocr_store_misses"]
+            },
+        )
+
+
+class JsonlEventSink:
+    """Event callback which appends events to a file, one JSON object per line, written as each event comes,
+    so that the file can be followed by another process while mokuro is running.
+
+    The file is opened for each event, so no handle is held between events, and the file can be rotated.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        line = json.dumps(event, ensure_ascii=False, default=str)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def combine_callbacks(*callbacks):
+    """A callback which calls all given callbacks; None if there are none."""
+    callbacks = [callback for callback in callbacks if callback is not None]
+    if not callbacks:
+        return None
+    if len(callbacks) == 1:
+        return callbacks[0]
+
+    def callback(event):
+        for cb in callbacks:
+            cb(event)
+
+    return callback
@@ -8,7 +8,6 @@ from yattag import Doc
 
 from mokuro import __version__
 from mokuro.env import ASSETS_PATH
-from mokuro.utils import load_json
 from mokuro.volume import Volume
 
 SCRIPT_PATH = Path(__file__).parent / "script.js"
@@ -57,9 +56,8 @@ def generate_legacy_html(volume: Volume, as_one_file=True, is_demo=False, ignore
 
     for img_path_rel in img_paths.values():
         try:
-            json_path = (volume.path_ocr_cache / img_path_rel).with_suffix(".json")
-            assert json_path.is_file(), f"missing {json_path}"
-            result = load_json(json_path)
+            result = volume.page_cache.get(img_path_rel.with_suffix(""))
+            assert result is not None, f"missing OCR result for {img_path_rel}"
             page_html = get_page_html(result, volume.path_in.name / img_path_rel)
             page_htmls.append(page_html)
         except Exception as e:
@@ -0,0 +1,151 @@
+import contextlib
+import json
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from loguru import logger
+from natsort import natsorted
+
+from mokuro.utils import dump_json, load_json
+from mokuro.volume import IMG_SUFFIXES
+
+ARCHIVE_SUFFIXES = (".zip", ".cbz")
+
+
+def scan_parent_dir(parent_dir, recursive=False, threads=8, cache_path=None):
+    """Find volumes in a parent directory.
+
+    Without recursive, every subdirectory (except _ocr) and every zip/cbz file in parent_dir is a volume.
+    With recursive, the whole tree is scanned: every zip/cbz file and every directory which directly contains
+    images is a volume; other directories are searched further. A directory with no images of its own, e.g. a volume
+    split into chapter directories, is therefore not a volume, its chapters are.
+
+    Directories are listed in parallel, with `threads` threads. If cache_path is set, directory listings are
+    persisted there and reused on the next scan for directories whose mtime didn't change, so only changed
+    directories are listed again.
+    """
+    parent_dir = Path(parent_dir)
+    scan_cache = _ScanCache.load(cache_path) if cache_path is not None else None
+
+    volumes = []
+    lock = threading.Lock()
+
+    def visit(dir_path, is_root):
+        listing = _list_dir(dir_path, scan_cache)
+        subdirs = []
+
+        with lock:
+            volumes.extend(dir_path / name for name in listing["archives"])
+
+        for name in listing["dirs"]:
+            if name == "_ocr":
+                continue
+            if is_root and not recursive:
+                with lock:
+                    volumes.append(dir_path / name)
+            else:
+                subdirs.append(dir_path / name)
+
+        if not is_root and listing["has_images"]:
+            with lock:
+                volumes.append(dir_path)
+            return []
+
+        return subdirs
+
+    with ThreadPoolExecutor(threads) as pool:
+        pending = {pool.submit(visit, parent_dir, True)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for subdir in future.result():
+                    pending.add(pool.submit(visit, subdir, False))
+
+    if scan_cache is not None:
+        scan_cache.prune(parent_dir)
+        scan_cache.save()
+
+    return natsorted(volumes)
+
+
+def _list_dir(dir_path, scan_cache=None):
+    """Names of subdirectories and archives in a directory, and whether it contains images; with os.scandir,
+    which gets file types from the directory listing, without stat calls for each entry.
+    """
+    mtime = os.stat(dir_path).st_mtime_ns
+
+    if scan_cache is not None:
+        listing = scan_cache.get(dir_path, mtime)
+        if listing is not None:
+            return listing
+
+    listing = {"mtime": mtime, "dirs": [], "archives": [], "has_images": False}
+    with os.scandir(dir_path) as entries:
+        for entry in entries:
+            suffix = os.path.splitext(entry.name)[1].lower()
+            if entry.is_dir():
+                listing["dirs"].append(entry.name)
+            elif suffix in ARCHIVE_SUFFIXES and entry.is_file():
+                listing["archives"].append(entry.name)
+            elif suffix in IMG_SUFFIXES:
+                listing["has_images"] = True
+
+    if scan_cache is not None:
+        scan_cache.put(dir_path, listing)
+    return listing
+
+
+class _ScanCache:
+    """Directory listings from previous scans, keyed by absolute path, valid as long as the directory mtime
+    doesn't change (adding, removing or renaming an entry updates the mtime of its directory).
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.listings = {}
+        self._used = set()
+        self._modified = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        scan_cache = cls(path)
+        with contextlib.suppress(FileNotFoundError, json.JSONDecodeError, UnicodeDecodeError):
+            scan_cache.listings = load_json(path)
+        return scan_cache
+
+    def get(self, dir_path, mtime):
+        with self._lock:
+            self._used.add(str(dir_path))
+            listing = self.listings.get(str(dir_path))
+        if listing is not None and listing["mtime"] == mtime:
+            return listing
+        return None
+
+    def put(self, dir_path, listing):
+        with self._lock:
+            self._used.add(str(dir_path))
+            self.listings[str(dir_path)] = listing
+            self._modified = True
+
+    def prune(self, root):
+        """Remove listings of directories inside root which weren't visited in this scan, e.g. deleted ones."""
+        prefix = os.path.join(str(root), "")
+        for key in list(self.listings):
+            if key.startswith(prefix) and key not in self._used:
+                del self.listings[key]
+                self._modified = True
+
+    def save(self):
+        if not self._modified:
+            return
+
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            path_tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+            dump_json(self.listings, path_tmp)
+            os.replace(path_tmp, self.path)
+        except OSError as e:
+            logger.warning(f"Failed to save library scan cache: {e}")
@@ -0,0 +1,182 @@
+from functools import lru_cache
+
+import numpy as np
+
+# cv2 and scipy are imported when line crops are computed, so that importing this module (with MangaPageOcr) is cheap
+
+
+@lru_cache(maxsize=16)
+def get_density_kernel(textheight):
+    """Kernel which smooths the text density along a line, when looking for places to split it."""
+    from scipy.signal.windows import gaussian
+
+    kernel = gaussian(textheight * 2, textheight / 8)
+    kernel.flags.writeable = False
+    return kernel
+
+
+def get_line_crops(img, mask_refined, blk_list, textheight, max_ratio_vert=16, max_ratio_hor=8, anchor_window=2):
+    """Crops of all text lines on a page, as passed to the OCR model.
+
+    Equivalent to TextBlock.get_transformed_region for each line, followed by splitting lines longer than max_ratio
+    times their height into chunks, at the points of lowest text density (in mask_refined) around evenly spaced
+    anchors. Geometry and homographies of all lines are computed together, and each line is warped once
+    (vertical lines are not rotated, they are returned top to bottom, the same as manga-ocr expects them).
+    mask_refined is warped only for lines which are split; it can have a lower resolution than img
+    (see PageImage), blk_list is in img coordinates.
+
+    Returns a list of (blk_idx, line_idx, chunks).
+    """
+    import cv2
+
+    im_h, im_w = img.shape[:2]
+    line_ids, src_pts, vertical = _get_line_quads(blk_list, im_w, im_h)
+    if not line_ids:
+        return []
+
+    sizes = _get_line_sizes(src_pts, vertical, textheight)
+    homographies = _get_homographies(src_pts, sizes)
+
+    results = []
+    long_lines = []
+    for (blk_idx, line_idx), is_vertical, (w, h), M in zip(line_ids, vertical, sizes, homographies, strict=True):
+        if M is None or w < 1 or h < 1:
+            results.append((blk_idx, line_idx, []))
+            continue
+
+        region = cv2.warpPerspective(img, M, (int(w), int(h)))
+        results.append((blk_idx, line_idx, [region]))
+
+        # length along the text direction, and height across it
+        length, height = (h, w) if is_vertical else (w, h)
+        max_ratio = max_ratio_vert if is_vertical else max_ratio_hor
+        if length / height > max_ratio:
+            long_lines.append((len(results) - 1, M, is_vertical, length, height, max_ratio))
+
+    if long_lines:
+        _split_long_lines(results, long_lines, mask_refined, im_w, textheight, anchor_window)
+
+    return results
+
+
+def _get_line_quads(blk_list, im_w, im_h):
+    """Line ids, source quadrilaterals (N, 4, 2) and vertical flags of all lines, with horizontal lines expanded
+    by a third of font size, as in TextBlock.get_transformed_region.
+    """
+    line_ids = []
+    quads = []
+    vertical = []
+    for blk_idx, blk in enumerate(blk_list):
+        lines = blk.lines_array()
+        if lines.size == 0:
+            continue
+
+        if blk.language == "eng" or (blk.language == "unknown" and not blk.vertical):
+            e_size = blk.font_size / 3
+            lines[..., 0] += np.array([-e_size, e_size, e_size, -e_size])
+            lines[..., 1] += np.array([-e_size, -e_size, e_size, e_size])
+            lines[..., 0] = np.clip(lines[..., 0], 0, im_w)
+            lines[..., 1] = np.clip(lines[..., 1], 0, im_h)
+
+        line_ids.extend((blk_idx, line_idx) for line_idx in range(len(lines)))
+        quads.append(lines)
+        vertical.extend([blk.vertical] * len(lines))
+
+    if not quads:
+        return [], None, None
+    return line_ids, np.concatenate(quads), np.array(vertical, dtype=bool)
+
+
+def _get_line_sizes(src_pts, vertical, textheight):
+    """(w, h) of the warped region of each line, before rotation."""
+    middle_pnt = (src_pts[:, [1, 2, 3, 0]] + src_pts) / 2
+    vec_v = middle_pnt[:, 2] - middle_pnt[:, 0]
+    vec_h = middle_pnt[:, 1] - middle_pnt[:, 3]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.linalg.norm(vec_v, axis=1) / np.linalg.norm(vec_h, axis=1)
+        length = np.where(vertical, textheight * ratio, textheight / ratio)
+
+    # degenerate lines get size 0, and are skipped
+    length = np.where(np.isfinite(length), np.round(length), 0).astype(np.int64)
+    thickness = np.full_like(length, int(textheight))
+    return np.where(vertical[:, None], np.stack([thickness, length], 1), np.stack([length, thickness], 1))
+
+
+def _get_homographies(src_pts, sizes):
+    """Perspective transforms from each line quadrilateral to its region, solved for all lines at once."""
+    w, h = sizes[:, 0].astype(np.float64), sizes[:, 1].astype(np.float64)
+    dst_pts = np.zeros_like(src_pts)
+    dst_pts[:, [1, 2], 0] = (w - 1)[:, None]
+    dst_pts[:, [2, 3], 1] = (h - 1)[:, None]
+
+    n = len(src_pts)
+    x, y = src_pts[..., 0], src_pts[..., 1]
+    u, v = dst_pts[..., 0], dst_pts[..., 1]
+    A = np.zeros((n, 8, 8))
+    A[:, 0::2, 0] = x
+    A[:, 0::2, 1] = y
+    A[:, 0::2, 2] = 1
+    A[:, 0::2, 6] = -u * x
+    A[:, 0::2, 7] = -u * y
+    A[:, 1::2, 3] = x
+    A[:, 1::2, 4] = y
+    A[:, 1::2, 5] = 1
+    A[:, 1::2, 6] = -v * x
+    A[:, 1::2, 7] = -v * y
+    b = np.stack([u, v], axis=2).reshape(n, 8)
+
+    try:
+        params = np.linalg.solve(A, b[..., None])[..., 0]
+    except np.linalg.LinAlgError:
+        # a degenerate line; transforms are found one by one, as in TextBlock.get_transformed_region
+        import cv2
+
+        return [cv2.findHomography(src, dst, cv2.RANSAC, 5.0)[0] for src, dst in zip(src_pts, dst_pts, strict=True)]
+
+    return list(np.concatenate([params, np.ones((n, 1))], axis=1).reshape(n, 3, 3))
+
+
+def _split_long_lines(results, long_lines, mask_refined, im_w, textheight, anchor_window):
+    """Split regions of long lines in place. Text density of every line is computed first, and then cut points
+    around all anchors of all lines are found in one pass.
+    """
+    import cv2
+
+    kernel = get_density_kernel(textheight)
+    mask_scale = mask_refined.shape[1] / im_w
+    # maps mask coordinates to image coordinates, so that image homographies apply to the mask
+    mask_to_img = np.diag([1 / mask_scale, 1 / mask_scale, 1])
+
+    densities = []
+    anchors = []
+    anchor_lines = []
+    window = anchor_window * textheight
+    for i, (_, M, is_vertical, length, height, max_ratio) in enumerate(long_lines):
+        w, h = (height, length) if is_vertical else (length, height)
+        line_mask = cv2.warpPerspective(mask_refined, M if mask_scale == 1 else M @ mask_to_img, (int(w), int(h)))
+        densities.append(np.convolve(line_mask.sum(axis=1 if is_vertical else 0), kernel, "same"))
+
+        num_chunks = int(np.ceil(length / height / max_ratio))
+        line_anchors = np.linspace(0, length, num_chunks + 1)[1:-1].astype(np.int64)
+        anchors.append(line_anchors)
+        anchor_lines.append(np.full(len(line_anchors), i))
+
+    anchors = np.concatenate(anchors)
+    anchor_lines = np.concatenate(anchor_lines)
+    lengths = np.array([length for result_idx, M, is_vertical, length, height, max_ratio in long_lines])
+    offsets = np.cumsum([0] + [len(density) for density in densities[:-1]])
+    density = np.concatenate(densities)
+
+    # for each anchor, search the window around it, clipped to its line
+    n0 = np.clip(anchors - window // 2, 0, lengths[anchor_lines])
+    n1 = np.clip(anchors + window // 2, 0, lengths[anchor_lines])
+    idx = n0[:, None] + np.arange(max(1, (n1 - n0).max()))
+    values = np.where(
+        idx < n1[:, None], density[np.minimum(idx + offsets[anchor_lines][:, None], len(density) - 1)], np.inf
+    )
+    cut_points = n0 + values.argmin(axis=1)
+
+    for i, (result_idx, _, is_vertical, *_) in enumerate(long_lines):
+        blk_idx, line_idx, (region,) = results[result_idx]
+        chunks = np.split(region, cut_points[anchor_lines == i], axis=0 if is_vertical else 1)
+        results[result_idx] = (blk_idx, line_idx, chunks)
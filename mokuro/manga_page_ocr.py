@@ -1,18 +1,48 @@
-import cv2
+import copy
+import hashlib
+import inspect
+import json
+import time
+from pathlib import Path
+
 import numpy as np
-from PIL import Image
 from loguru import logger
-from scipy.signal.windows import gaussian
+from PIL import Image
 
-from comic_text_detector.inference import TextDetector
-from manga_ocr import MangaOcr
 from mokuro import __version__
 from mokuro.cache import cache
-from mokuro.utils import imread
-import torch
+from mokuro.line_geometry import get_line_crops
+from mokuro.page_filter import SkippedPage
+from mokuro.tracing import span, traced
+from mokuro.utils import ImageSize, PageImage, imread, read_bytes, read_image_size
+
+# torch, the models and other heavy dependencies are imported only when the models are initialized, so that
+# commands which don't run OCR (--disable_ocr, regenerating outputs from cached results, --version) start quickly
+
+DETECTOR_BACKENDS = ("torch", "onnxruntime")
+
+# seconds between saves of the OCR memo while volumes are processed; it's always saved at the end of a run
+OCR_MEMO_SAVE_INTERVAL = 300
 
 
 class MangaPageOcr:
+    # parameters which affect the OCR results
+    result_params = (
+        "pretrained_model_name_or_path",
+        "detector_input_size",
+        "detector_backend",
+        "quantize_ocr",
+        "reduced_decode",
+        "page_filter",
+        "page_filter_min_ink",
+        "page_filter_max_color_fraction",
+        "text_height",
+        "max_ratio_vert",
+        "max_ratio_hor",
+        "anchor_window",
+        "disable_ocr",
+    )
+
     def __init__(
         self,
         pretrained_model_name_or_path="kha-white/manga-ocr-base",
@@ -22,108 +52,307 @@ class MangaPageOcr:
         max_ratio_vert=16,
         max_ratio_hor=8,
         anchor_window=2,
+        ocr_batch_size=16,
+        detector_backend="torch",
+        detector_threads=None,
+        detector_batch_size=1,
+        quantize_ocr=False,
+        reduced_decode=False,
+        model_snapshots=False,
+        ocr_memo=False,
+        ocr_memo_max_entries=100_000,
+        ocr_memo_max_mb=64,
+        page_filter="off",
+        page_filter_min_ink=0.002,
+        page_filter_max_color_fraction=0.5,
         disable_ocr=False,
     ):
         self.text_height = text_height
         self.max_ratio_vert = max_ratio_vert
         self.max_ratio_hor = max_ratio_hor
         self.anchor_window = anchor_window
+        self.ocr_batch_size = ocr_batch_size
+        self.detector_input_size = detector_input_size
+        self.reduced_decode = reduced_decode
         self.disable_ocr = disable_ocr
+        self.ocr_memo = None
+        self.page_filter = None
 
         if not self.disable_ocr:
+            import torch
+            from comic_text_detector.inference import TextDetector
+            from manga_ocr import MangaOcr
+
+            from mokuro.batch_detector import BatchTextDetector
+            from mokuro.ocr_memo import LineOcrMemo
+            from mokuro.onnx_detector import use_onnxruntime
+            from mokuro.page_filter import PageFilter
+            from mokuro.quantization import quantize_ocr_model
+
             if not force_cpu and torch.cuda.is_available():
                 device = "cuda"
             elif not force_cpu and torch.backends.mps.is_available():
                 device = "mps"
             else:
                 device = "cpu"
-            logger.info(f"Initializing text detector, using device {device}")
-            self.text_detector = TextDetector(
-                model_path=cache.comic_text_detector, input_size=detector_input_size, device=device, act="leaky"
-            )
-            self.mocr = MangaOcr(pretrained_model_name_or_path, force_cpu)
-
-    def __call__(self, img_path):
-        img = imread(img_path)
-        H, W, *_ = img.shape
-        result = {"version": __version__, "img_width": W, "img_height": H, "blocks": []}
+            if detector_backend not in DETECTOR_BACKENDS:
+                raise ValueError(
+                    f"Unknown detector backend {detector_backend}, expected one of: {', '.join(DETECTOR_BACKENDS)}"
+                )
+
+            # with onnxruntime, torch model is loaded on CPU only to be exported, inference runs in ONNX Runtime
+            detector_device = "cpu" if detector_backend == "onnxruntime" else device
+
+            def create_text_detector():
+                return TextDetector(
+                    model_path=cache.comic_text_detector,
+                    input_size=detector_input_size,
+                    device=detector_device,
+                    act="leaky",
+                )
+
+            def create_ocr():
+                mocr = MangaOcr(pretrained_model_name_or_path, force_cpu)
+                if quantize_ocr:
+                    quantize_ocr_model(mocr, pretrained_model_name_or_path)
+                return mocr
+
+            logger.info(f"Initializing text detector, using {detector_backend} on device {device}")
+            if model_snapshots:
+                from mokuro.model_snapshot import load_or_create
+
+                self.text_detector = load_or_create(
+                    create_text_detector, "comictextdetector", [detector_input_size, detector_device]
+                )
+                self.mocr = load_or_create(
+                    create_ocr,
+                    str(pretrained_model_name_or_path),
+                    [pretrained_model_name_or_path, quantize_ocr, device],
+                )
+            else:
+                self.text_detector = create_text_detector()
+                self.mocr = create_ocr()
+
+            if detector_backend == "onnxruntime":
+                use_onnxruntime(
+                    self.text_detector, cache.comic_text_detector, device=device, num_threads=detector_threads
+                )
+            self.text_detector.net = traced("detector_forward", self.text_detector.net)
+            self.batch_text_detector = BatchTextDetector(self.text_detector, detector_batch_size)
+            if page_filter != "off":
+                self.page_filter = PageFilter(
+                    page_filter, min_ink=page_filter_min_ink, max_color_fraction=page_filter_max_color_fraction
+                )
+            if ocr_memo:
+                self.ocr_memo = LineOcrMemo(
+                    json.dumps([str(pretrained_model_name_or_path), quantize_ocr]),
+                    path=None if ocr_memo is True else Path(ocr_memo).expanduser(),
+                    max_entries=ocr_memo_max_entries,
+                    max_bytes=ocr_memo_max_mb * 1e6,
+                )
+
+    @classmethod
+    def config_fingerprint(cls, **kwargs):
+        """Short hash of the parameters which affect the OCR results, and of mokuro version."""
+        params = inspect.signature(cls).bind(**kwargs)
+        params.apply_defaults()
+        config = {name: params.arguments[name] for name in cls.result_params}
+        config["version"] = __version__
+        return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+    def __call__(self, img_path, timings=None):
+        """Process a page image file. If timings is a dict, the time of "read", "detect" and "recognize" stages
+        in seconds is stored in it.
+        """
+        timings = {} if timings is None else timings
+        with span("page", path=img_path):
+            start = time.perf_counter()
+            with span("imread", path=img_path):
+                if self.disable_ocr:
+                    # only the size of the page is needed
+                    img = read_image_size(read_bytes(img_path), img_path)
+                elif self.reduced_decode:
+                    img = PageImage(read_bytes(img_path), self.detector_input_size, img_path)
+                else:
+                    img = imread(img_path)
+            timings["read"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            detection = self.detect(img, name=img_path)
+            timings["detect"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            result = self.recognize_page(img, detection)
+            timings["recognize"] = time.perf_counter() - start
+            return result
+
+    def detect(self, img, name=None):
+        """Run text detection on a page, given as an array or a PageImage.
 
+        Returns (mask_refined, blk_list), None if OCR is disabled, or SkippedPage if the page filter skips the page.
+        For a PageImage, text blocks are in full resolution coordinates, and mask_refined is in the reduced
+        resolution. name is used only in page filter reports.
+        """
+        return self.detect_batch([img], names=[name])[0]
+
+    def detect_batch(self, imgs, names=None):
+        """Run text detection on multiple pages, with up to `detector_batch_size` pages per forward pass.
+        Returns a list of detections, one for each page, the same as returned by `detect`.
+        """
         if self.disable_ocr:
+            return [None] * len(imgs)
+
+        names = names or [None] * len(imgs)
+        detection_imgs = [img.reduced if isinstance(img, PageImage) else img for img in imgs]
+        skip_reasons = [None] * len(imgs)
+        if self.page_filter is not None:
+            skip_reasons = [self.page_filter.check(img) for img in detection_imgs]
+
+        if self.page_filter is not None and self.page_filter.mode == "skip":
+            idxs = [i for i, reason in enumerate(skip_reasons) if reason is None]
+        else:
+            idxs = list(range(len(imgs)))
+
+        with span("detect", paths=[names[i] for i in idxs]) as span_args:
+            if len(idxs) == 1:
+                results = [self.text_detector(detection_imgs[idxs[0]], refine_mode=1, keep_undetected_mask=True)]
+            else:
+                results = self.batch_text_detector(
+                    [detection_imgs[i] for i in idxs], refine_mode=1, keep_undetected_mask=True
+                )
+            span_args["num_blocks"] = [len(blk_list) for mask, mask_refined, blk_list in results]
+
+        detections = [SkippedPage(reason) for reason in skip_reasons]
+        for i, (_mask, mask_refined, blk_list) in zip(idxs, results, strict=True):
+            detections[i] = self._to_full_resolution(imgs[i], (mask_refined, blk_list))
+            if self.page_filter is not None:
+                self.page_filter.report(skip_reasons[i], blk_list, names[i])
+        return detections
+
+    def report(self):
+        """Log statistics of the page filter and OCR memo, and save the OCR memo if it wasn't saved for a while."""
+        if self.page_filter is not None:
+            self.page_filter.log_stats()
+        if self.ocr_memo is not None:
+            self.ocr_memo.log_stats()
+            self.ocr_memo.save(min_interval=OCR_MEMO_SAVE_INTERVAL)
+
+    def save(self):
+        """Save the OCR memo, at the end of a run."""
+        if self.ocr_memo is not None:
+            self.ocr_memo.save()
+
+    @staticmethod
+    def _to_full_resolution(img, detection):
+        mask_refined, blk_list = detection
+        if isinstance(img, PageImage) and img.scale != 1:
+            blk_list = [scale_text_block(blk, img.scale) for blk in blk_list]
+        return mask_refined, blk_list
+
+    def recognize_page(self, img, detection):
+        """Recognize text in the lines found by `detect` and build the page result."""
+        if isinstance(img, (PageImage, ImageSize)):
+            H, W = img.height, img.width
+        else:
+            H, W, *_ = img.shape
+        result = {"version": __version__, "img_width": W, "img_height": H, "blocks": []}
+
+        if detection is None:
+            return result
+
+        if isinstance(detection, SkippedPage):
+            result["skipped"] = detection.reason
             return result
 
-        mask, mask_refined, blk_list = self.text_detector(img, refine_mode=1, keep_undetected_mask=True)
-        for blk_idx, blk in enumerate(blk_list):
+        mask_refined, blk_list = detection
+        if blk_list and isinstance(img, PageImage):
+            # full resolution is decoded only for pages with text
+            img = img.full
+
+        for blk in blk_list:
+            lines_coords = blk.lines_array().tolist()
             result_blk = {
                 "box": list(blk.xyxy),
                 "vertical": blk.vertical,
                 "font_size": blk.font_size,
-                "lines_coords": [],
-                "lines": [],
+                "lines_coords": lines_coords,
+                "lines": [""] * len(lines_coords),
             }
-
-            for line_idx, line in enumerate(blk.lines_array()):
-                if blk.vertical:
-                    max_ratio = self.max_ratio_vert
-                else:
-                    max_ratio = self.max_ratio_hor
-
-                line_crops, cut_points = self.split_into_chunks(
-                    img,
-                    mask_refined,
-                    blk,
-                    line_idx,
-                    textheight=self.text_height,
-                    max_ratio=max_ratio,
-                    anchor_window=self.anchor_window,
-                )
-
-                line_text = ""
-                for line_crop in line_crops:
-                    if blk.vertical:
-                        line_crop = cv2.rotate(line_crop, cv2.ROTATE_90_CLOCKWISE)
-                    line_text += self.mocr(Image.fromarray(line_crop))
-
-                result_blk["lines_coords"].append(line.tolist())
-                result_blk["lines"].append(line_text)
-
             result["blocks"].append(result_blk)
 
-        return result
+        # line crops from the whole page are collected first and recognized together in batches;
+        # each crop remembers which line it belongs to, so the text can be put back together afterwards
+        crops = []
+        crop_line_ids = []
+        with span("crop_split", num_blocks=len(blk_list)) as span_args:
+            for blk_idx, line_idx, line_crops in get_line_crops(
+                img,
+                mask_refined,
+                blk_list,
+                textheight=self.text_height,
+                max_ratio_vert=self.max_ratio_vert,
+                max_ratio_hor=self.max_ratio_hor,
+                anchor_window=self.anchor_window,
+            ):
+                crops.extend(line_crops)
+                crop_line_ids.extend([(blk_idx, line_idx)] * len(line_crops))
+            span_args["num_lines"] = len(set(crop_line_ids))
+            span_args["num_crops"] = len(crops)
 
-    @staticmethod
-    def split_into_chunks(img, mask_refined, blk, line_idx, textheight, max_ratio=16, anchor_window=2):
-        line_crop = blk.get_transformed_region(img, line_idx, textheight)
+        for (blk_idx, line_idx), text in zip(crop_line_ids, self.recognize(crops), strict=True):
+            result["blocks"][blk_idx]["lines"][line_idx] += text
 
-        h, w, *_ = line_crop.shape
-        ratio = w / h
-
-        if ratio <= max_ratio:
-            return [line_crop], []
+        return result
 
-        else:
-            k = gaussian(textheight * 2, textheight / 8)
+    def recognize(self, crops):
+        """Run manga-ocr on a list of line crops, ``ocr_batch_size`` crops per generate call.
 
-            line_mask = blk.get_transformed_region(mask_refined, line_idx, textheight)
-            num_chunks = int(np.ceil(ratio / max_ratio))
+        With ocr_memo, crops found in the memo, and repeated crops, are not passed to the model.
+        """
+        if self.ocr_memo is None:
+            return self._recognize(crops)
 
-            anchors = np.linspace(0, w, num_chunks + 1)[1:-1]
+        texts = [None] * len(crops)
+        missing = {}
+        for i, crop in enumerate(crops):
+            key = self.ocr_memo.key(crop)
+            if key in missing:
+                missing[key].append(i)
+                continue
+            texts[i] = self.ocr_memo.get(key)
+            if texts[i] is None:
+                missing[key] = [i]
 
-            line_density = line_mask.sum(axis=0)
-            line_density = np.convolve(line_density, k, "same")
-            line_density /= line_density.max()
+        new_texts = self._recognize([crops[idxs[0]] for idxs in missing.values()])
+        for (key, idxs), text in zip(missing.items(), new_texts, strict=True):
+            self.ocr_memo.put(key, text)
+            for i in idxs:
+                texts[i] = text
 
-            anchor_window *= textheight
+        return texts
 
-            cut_points = []
-            for anchor in anchors:
-                anchor = int(anchor)
+    def _recognize(self, crops):
+        from manga_ocr.ocr import post_process
 
-                n0 = np.clip(anchor - anchor_window // 2, 0, w)
-                n1 = np.clip(anchor + anchor_window // 2, 0, w)
+        texts = []
+        for i in range(0, len(crops), self.ocr_batch_size):
+            with span("recognize", num_crops=len(crops[i : i + self.ocr_batch_size])):
+                batch = [
+                    Image.fromarray(crop).convert("L").convert("RGB") for crop in crops[i : i + self.ocr_batch_size]
+                ]
+                pixel_values = self.mocr.processor(batch, return_tensors="pt").pixel_values
+                # generate pads finished sequences and stops once every sequence in the batch has ended
+                token_ids = self.mocr.model.generate(pixel_values.to(self.mocr.model.device), max_length=300).cpu()
+                batch_texts = self.mocr.tokenizer.batch_decode(token_ids, skip_special_tokens=True)
+                texts.extend(post_process(text) for text in batch_texts)
 
-                p = line_density[n0:n1].argmin()
-                p += n0
+        return texts
 
-                cut_points.append(p)
 
-            return np.split(line_crop, cut_points, axis=1), cut_points
+def scale_text_block(blk, scale):
+    """Copy of a TextBlock with coordinates and font size multiplied by scale."""
+    blk = copy.copy(blk)
+    blk.xyxy = [round(x * scale) for x in blk.xyxy]
+    blk.lines = np.round(blk.lines_array() * scale).astype(np.int32).tolist()
+    blk.font_size = blk.font_size * scale
+    return blk
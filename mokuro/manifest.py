@@ -0,0 +1,85 @@
+import json
+import os
+from pathlib import Path
+
+from mokuro import __version__
+from mokuro.utils import dump_json, get_file_signature, load_json
+
+
+class VolumeManifest:
+    """Record of what has already been done for a volume, stored next to its page cache: _ocr/<volume>.manifest.json
+
+    For each page, the manifest stores a signature of the source image (see Volume.get_img_signatures) from the time
+    its OCR result was cached. It also stores the size and mtime of the .mokuro file at the time it was generated,
+    and the pages it was generated with.
+    This allows to check which pages need processing and whether the .mokuro file is up to date, without reading
+    any cached page results.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.pages = {}
+        self.mokuro_file = None
+        self.mokuro_pages = None
+
+    @classmethod
+    def load(cls, path):
+        """Load a manifest; a missing or unreadable manifest is treated as empty."""
+        manifest = cls(path)
+        try:
+            data = load_json(path)
+        except (FileNotFoundError, json.JSONDecodeError, UnicodeDecodeError):
+            return manifest
+
+        if data.get("version") == __version__:
+            manifest.pages = {key: tuple(signature) for key, signature in data.get("pages", {}).items()}
+            if data.get("mokuro_file") is not None:
+                manifest.mokuro_file = tuple(data["mokuro_file"])
+                manifest.mokuro_pages = data.get("mokuro_pages")
+        return manifest
+
+    def save(self):
+        data = {
+            "version": __version__,
+            "pages": self.pages,
+            "mokuro_file": self.mokuro_file,
+            "mokuro_pages": self.mokuro_pages,
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        path_tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        dump_json(data, path_tmp)
+        os.replace(path_tmp, self.path)
+
+    def get_page_state(self, key, signature):
+        """Returns one of:
+        "done" - the page result was cached for the same source image,
+        "changed" - the source image changed since the page result was cached,
+        "unknown" - the page is not in the manifest, or its source is of a different kind (e.g. the volume
+            was extracted from an archive since).
+        """
+        recorded_signature = self.pages.get(Path(key).as_posix())
+        if recorded_signature is None or recorded_signature[0] != signature[0]:
+            return "unknown"
+        if recorded_signature == tuple(signature):
+            return "done"
+        return "changed"
+
+    def set_page_done(self, key, signature):
+        self.pages[Path(key).as_posix()] = tuple(signature)
+        self.mokuro_file = None
+
+    def set_mokuro_file(self, path_mokuro, page_keys):
+        """Record the .mokuro file generated with the given pages."""
+        self.mokuro_file = get_file_signature(path_mokuro)
+        self.mokuro_pages = sorted(Path(key).as_posix() for key in page_keys)
+
+    def is_mokuro_file_current(self, path_mokuro, page_keys=None):
+        """True if the .mokuro file exists and wasn't modified since it was generated, and, if page_keys are
+        given, it was generated with exactly these pages (e.g. not before a page was deleted from the volume).
+        """
+        if page_keys is not None and self.mokuro_pages != sorted(Path(key).as_posix() for key in page_keys):
+            return False
+        try:
+            return self.mokuro_file is not None and self.mokuro_file == get_file_signature(path_mokuro)
+        except FileNotFoundError:
+            return False
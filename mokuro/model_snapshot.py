@@ -0,0 +1,69 @@
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import re
+
+import torch
+import transformers
+from loguru import logger
+
+from mokuro import __version__
+from mokuro.cache import cache
+
+
+def get_snapshot_path(name, key):
+    """Path of a model snapshot in the cache directory. Snapshots are pickled, so torch, transformers and mokuro
+    versions are part of the key, in addition to `key` - a list of everything else which affects the model.
+    """
+    key = json.dumps([*map(str, key), torch.__version__, transformers.__version__, __version__])
+    key_hash = hashlib.sha256(key.encode()).hexdigest()[:12]
+    name = re.sub(r"[^\w.-]+", "_", name).strip("_")[-64:]
+    return cache.root / "snapshots" / f"{name}_{key_hash}.pt"
+
+
+def load_snapshot(path):
+    """Load a snapshot, with its tensors memory-mapped from the file (torch>=2.1), so that weights are read lazily
+    and pages of the file are shared between processes which load it. Returns None if it doesn't exist or can't
+    be loaded.
+    """
+    if not path.is_file():
+        return None
+
+    params = inspect.signature(torch.load).parameters
+    kwargs = {"weights_only": False} if "weights_only" in params else {}
+    if "mmap" in params:
+        kwargs["mmap"] = True
+
+    logger.info(f"Loading model snapshot {path}")
+    try:
+        return torch.load(path, **kwargs)
+    # a truncated or corrupted file, or a snapshot of classes which changed since it was saved
+    except (OSError, EOFError, RuntimeError, pickle.UnpicklingError, AttributeError, ImportError) as e:
+        logger.warning(f"Failed to load model snapshot {path}, creating it again: {e!r}")
+        return None
+
+
+def save_snapshot(obj, path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path_tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    torch.save(obj, path_tmp)
+    os.replace(path_tmp, path)
+    logger.info(f"Saved model snapshot to {path}")
+
+
+def load_or_create(create, name, key):
+    """Return a model (or an object holding models, e.g. TextDetector, MangaOcr) loaded from its snapshot, or
+    created with create() and saved as a snapshot, if there is none yet.
+
+    The snapshot is taken of the ready-to-run model, after any fusion or quantization done by create(), which is
+    then not repeated on later loads. Tensors are restored to the device they were on, so the device must be part of
+    the key.
+    """
+    path = get_snapshot_path(name, key)
+    obj = load_snapshot(path)
+    if obj is None:
+        obj = create()
+        save_snapshot(obj, path)
+    return obj
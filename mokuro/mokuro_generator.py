@@ -1,95 +1,482 @@
-from json import JSONDecodeError
+import functools
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor, as_completed
+from pathlib import Path
 
 from loguru import logger
 from tqdm import tqdm
 
 from mokuro import __version__
+from mokuro.cache import cache
+from mokuro.events import EventEmitter
 from mokuro.manga_page_ocr import MangaPageOcr
-from mokuro.utils import dump_json, load_json
+from mokuro.mokuro_writer import MokuroFileWriter
+from mokuro.ocr_store import OcrStore
+from mokuro.pipeline import run_page_pipeline
+from mokuro.tracing import span
+from mokuro.utils import PageImage, get_file_size, imdecode, read_bytes, read_image_size
 from mokuro.volume import Volume
+from mokuro.worker_pool import create_worker_pool, process_page
 
 
 class MokuroGenerator:
     def __init__(
-        self, pretrained_model_name_or_path="kha-white/manga-ocr-base", force_cpu=False, disable_ocr=False, **kwargs
+        self,
+        pretrained_model_name_or_path="kha-white/manga-ocr-base",
+        force_cpu=False,
+        disable_ocr=False,
+        io_threads=4,
+        max_pending_pages=2,
+        detector_batch_size=1,
+        reduced_decode=False,
+        workers=1,
+        ocr_store=None,
+        ocr_store_max_size=None,
+        event_callback=None,
+        **kwargs,
     ):
         self.pretrained_model_name_or_path = pretrained_model_name_or_path
         self.force_cpu = force_cpu
         self.disable_ocr = disable_ocr
+        self.io_threads = io_threads
+        self.max_pending_pages = max_pending_pages
+        self.detector_batch_size = detector_batch_size
+        self.reduced_decode = reduced_decode
+        self.workers = workers
         self.kwargs = kwargs
         self.mpocr = None
+        self.events = EventEmitter(event_callback)
+
+        if ocr_store:
+            ocr_store_root = cache.root / "ocr_store" if ocr_store is True else Path(ocr_store).expanduser()
+            self.ocr_store = OcrStore(
+                ocr_store_root, MangaPageOcr.config_fingerprint(**self.mpocr_kwargs), max_size=ocr_store_max_size
+            )
+        else:
+            self.ocr_store = None
+
+    @property
+    def mpocr_kwargs(self):
+        return dict(
+            pretrained_model_name_or_path=self.pretrained_model_name_or_path,
+            force_cpu=self.force_cpu,
+            disable_ocr=self.disable_ocr,
+            detector_batch_size=self.detector_batch_size,
+            reduced_decode=self.reduced_decode,
+            **self.kwargs,
+        )
 
     def init_models(self):
         if self.mpocr is None:
-            self.mpocr = MangaPageOcr(
-                self.pretrained_model_name_or_path,
-                force_cpu=self.force_cpu,
-                disable_ocr=self.disable_ocr,
-                **self.kwargs,
-            )
+            self.mpocr = MangaPageOcr(**self.mpocr_kwargs)
 
-    def process_volume(self, volume: Volume, ignore_errors=False, no_cache=False):
-        volume.path_ocr_cache.mkdir(parents=True, exist_ok=True)
+    def process_volumes(self, volumes, ignore_errors=False, no_cache=False, events=None):
+        """Process multiple volumes, either one by one, or with a pool of worker processes if workers > 1.
 
-        if volume.mokuro_data is not None:
-            for page in volume.mokuro_data["pages"]:
-                json_path = (volume.path_ocr_cache / page["img_path"]).with_suffix(".json")
-                if json_path.is_file():
-                    continue
-                json_path.parent.mkdir(parents=True, exist_ok=True)
-                page = page.copy()
-                page.pop("img_path")
-                dump_json(page, json_path)
+        Yields (volume, error) tuples in the input order, error is None if the volume was processed successfully.
+        Progress events are passed to event_callback, in the thread iterating this generator (see EventEmitter),
+        or to `events` (an EventEmitter), if given for this call.
+        """
+        if events is None:
+            events = self.events
 
-        img_paths = volume.get_img_paths()
+        if self.workers > 1:
+            results = self._process_volumes_parallel(volumes, events, ignore_errors=ignore_errors, no_cache=no_cache)
+        else:
+            results = self._process_volumes_sequential(volumes, events, ignore_errors=ignore_errors, no_cache=no_cache)
+
+        try:
+            for volume, error in results:
+                events.volume_finish(str(volume.path_in), error)
+                yield volume, error
+        finally:
+            if self.mpocr is not None:
+                self.mpocr.save()
+
+    def _process_volumes_sequential(self, volumes, events, ignore_errors=False, no_cache=False):
+        for volume in volumes:
+            try:
+                with span("volume", path=volume.path_in):
+                    self.process_volume(volume, ignore_errors=ignore_errors, no_cache=no_cache, events=events)
+            # any error fails only this volume; it's returned to the caller, which decides whether to go on
+            except Exception as e:  # noqa: BLE001
+                yield volume, e
+            else:
+                yield volume, None
+
+    def process_volume(self, volume: Volume, ignore_errors=False, no_cache=False, events=None):
+        if events is None:
+            events = self.events
+
+        pages, num_pages = self._get_pages_to_process(volume, no_cache=no_cache)
+        mokuro_writer = self._start_mokuro_file(volume, pages)
+        num_cached = num_pages - len(pages)
+        events.volume_start(str(volume.path_in), num_pages, num_cached)
+
+        # timings of each page by img_path_rel, and pages found in the OCR store, reported in page_done events
+        page_timings = {}
+        ocr_store_hits = set()
+
+        def read(page):
+            img_path_rel, _signature = page
+            img_source = volume.get_img_source(img_path_rel)
+            timings = page_timings[img_path_rel] = {}
+            start = time.perf_counter()
+            with span("imread", path=img_source) as span_args:
+                data = read_bytes(img_source)
+                store_key, stored_result = self._lookup_ocr_store(data, no_cache=no_cache)
+                span_args["ocr_store_hit"] = stored_result is not None
+                if stored_result is not None:
+                    ocr_store_hits.add(img_path_rel)
+                    img = None
+                elif self.disable_ocr:
+                    # only the size of the page is needed
+                    img = read_image_size(data, img_source)
+                elif self.reduced_decode:
+                    img = PageImage(data, self.kwargs.get("detector_input_size", 1024), img_source)
+                else:
+                    img = imdecode(data, img_source)
+            timings["read"] = time.perf_counter() - start
+            return img, store_key, stored_result, img_source, timings
+
+        def detect(items):
+            # pages found in the OCR store don't need detection
+            to_detect = [item for item in items if item[2] is None]
+            if to_detect:
+                self.init_models()
+                start = time.perf_counter()
+                detections = self.mpocr.detect_batch(
+                    [item[0] for item in to_detect], names=[item[3] for item in to_detect]
+                )
+                for item in to_detect:
+                    item[4]["detect"] = (time.perf_counter() - start) / len(to_detect)
+                detections = iter(detections)
+            return [None if stored_result is not None else next(detections) for _, _, stored_result, _, _ in items]
+
+        def recognize(item, detection):
+            img, store_key, stored_result, img_source, timings = item
+            if stored_result is not None:
+                return stored_result, None
 
-        for img_path_rel in tqdm(img_paths.values(), desc="Processing pages..."):
+            start = time.perf_counter()
+            with span("recognize_page", path=img_source):
+                result = self.mpocr.recognize_page(img, detection)
+            timings["recognize"] = time.perf_counter() - start
+            return result, store_key
+
+        def write(page, item):
+            img_path_rel, _signature = page
+            result, store_key = item
+            with span("write_page", path=img_path_rel):
+                volume.page_cache.put(img_path_rel.with_suffix(""), result)
+                if store_key is not None:
+                    self.ocr_store.put(store_key, result)
+
+        results = run_page_pipeline(
+            pages,
+            read=read,
+            detect=detect,
+            recognize=recognize,
+            write=write,
+            io_threads=self.io_threads,
+            max_pending=self.max_pending_pages,
+            detect_batch_size=self.detector_batch_size,
+        )
+
+        try:
+            for (img_path_rel, signature), error in tqdm(
+                results, desc="Processing pages...", total=num_pages, initial=num_cached
+            ):
+                events.page_done(
+                    str(volume.path_in),
+                    str(img_path_rel),
+                    error,
+                    ocr_store_hit=None if self.ocr_store is None else img_path_rel in ocr_store_hits,
+                    timings=page_timings.pop(img_path_rel, {}),
+                )
+                if error is None:
+                    volume.manifest.set_page_done(img_path_rel.with_suffix(""), signature)
+                elif ignore_errors:
+                    logger.error(error)
+                else:
+                    raise error
+                mokuro_writer.add_page(img_path_rel.with_suffix(""))
+        finally:
+            volume.manifest.save()
+
+        self._log_ocr_store_stats()
+        if self.mpocr is not None:
+            self.mpocr.report()
+        self._update_mokuro_file(volume, mokuro_writer, ignore_errors=ignore_errors)
+
+    def ocr_page(self, img_path, no_cache=False):
+        """OCR of a single page image, looked up in and added to the OCR store, if it's used.
+
+        Returns (result, timings, ocr_store_hit); timings are empty for a result from the OCR store, ocr_store_hit
+        is None if the OCR store is not used.
+        """
+        store_key, result = self._lookup_ocr_store(read_bytes(img_path), no_cache=no_cache)
+        ocr_store_hit = None if store_key is None else result is not None
+        timings = {}
+        if result is None:
+            self.init_models()
+            result = self.mpocr(img_path, timings=timings)
+            if store_key is not None:
+                self.ocr_store.put(store_key, result)
+        return result, timings, ocr_store_hit
+
+    def _start_mokuro_file(self, volume: Volume, pages):
+        """Return a writer, which streams the .mokuro file while the given pages are processed; None if there
+        are no pages to process. Pages which don't need processing are written right away.
+        """
+        if not pages:
+            return None
+
+        mokuro_writer = self.get_mokuro_writer(volume)
+        keys_to_process = {img_path_rel.with_suffix("") for img_path_rel, signature in pages}
+        for key in mokuro_writer.img_paths:
+            if key not in keys_to_process:
+                mokuro_writer.add_page(key)
+        return mokuro_writer
+
+    def _update_mokuro_file(self, volume: Volume, mokuro_writer=None, ignore_errors=False):
+        """Write the final .mokuro file, unless no pages were processed and it's up to date already."""
+        if mokuro_writer is None:
+            if volume.manifest.is_mokuro_file_current(volume.path_mokuro, volume.get_img_paths()):
+                logger.info(f"{volume.path_mokuro} is up to date")
+                return
+            mokuro_writer = self.get_mokuro_writer(volume)
+
+        num_pages = mokuro_writer.finish(ignore_errors=ignore_errors)
+        volume.manifest.set_mokuro_file(volume.path_mokuro, mokuro_writer.img_paths)
+        volume.manifest.save()
+        volume.title.catalog.update(volume.path_mokuro, mokuro_writer.header, num_pages=num_pages)
+        volume.title.catalog.save()
+
+    def _lookup_ocr_store(self, img_bytes, no_cache=False):
+        """Return (key, stored result or None) for an image; (None, None) if OCR store is not used."""
+        if self.ocr_store is None:
+            return None, None
+
+        key = self.ocr_store.key(img_bytes)
+        if no_cache:
+            return key, None
+
+        return key, self.ocr_store.get(key)
+
+    def _log_ocr_store_stats(self):
+        if self.ocr_store is not None:
+            logger.info(f"OCR store: {self.ocr_store.num_hits} hits, {self.ocr_store.num_misses} misses")
+
+    def _process_volumes_parallel(self, volumes, events, ignore_errors=False, no_cache=False):
+        volumes = list(volumes)
+        volume_pages = []
+        volume_errors = [None] * len(volumes)
+        mokuro_writers = [None] * len(volumes)
+        tasks = []
+
+        for volume_idx, volume in enumerate(volumes):
             try:
-                json_path = (volume.path_ocr_cache / img_path_rel).with_suffix(".json")
-
-                try:
-                    load_json(json_path)
-                    already_processed = True
-                except (FileNotFoundError, JSONDecodeError, UnicodeDecodeError):
-                    already_processed = False
-
-                if no_cache or not already_processed:
-                    self.init_models()
-                    result = self.mpocr(volume.path_in / img_path_rel)
-                    json_path.parent.mkdir(parents=True, exist_ok=True)
-                    dump_json(result, json_path)
-            except Exception as e:
-                if ignore_errors:
-                    logger.error(e)
+                pages, num_pages = self._get_pages_to_process(volume, no_cache=no_cache)
+                img_paths = [volume.get_img_source(img_path_rel) for img_path_rel, signature in pages]
+                sizes = [get_file_size(img_path) for img_path in img_paths]
+                mokuro_writers[volume_idx] = self._start_mokuro_file(volume, pages)
+            # as in the sequential mode, any error fails only this volume
+            except Exception as e:  # noqa: BLE001
+                pages = img_paths = sizes = []
+                volume_errors[volume_idx] = e
+            else:
+                events.volume_start(str(volume.path_in), num_pages, num_pages - len(pages))
+
+            volume_pages.append(pages)
+            for page_idx, (img_path, size) in enumerate(zip(img_paths, sizes, strict=True)):
+                tasks.append((size, volume_idx, page_idx, img_path, None))
+
+        # results are buffered, so that JSONs and .mokuro files are written in a deterministic order;
+        # page_results[volume_idx][page_idx] is a (result, store_key) tuple, or None if processing the page failed
+        page_results = [{} for _ in volumes]
+        num_written = [0] * len(volumes)
+
+        if self.ocr_store is not None:
+            # pages found in the OCR store are not sent to the workers
+            def lookup(task):
+                return task, *self._lookup_ocr_store(read_bytes(task[3]), no_cache=no_cache)
+
+            with ThreadPoolExecutor(self.io_threads) as io_pool:
+                lookups = list(io_pool.map(lookup, tasks))
+
+            tasks = []
+            for (size, volume_idx, page_idx, img_path, _), store_key, stored_result in lookups:
+                if stored_result is not None:
+                    page_results[volume_idx][page_idx] = stored_result, None
+                    img_path_rel, _signature = volume_pages[volume_idx][page_idx]
+                    events.page_done(str(volumes[volume_idx].path_in), str(img_path_rel), ocr_store_hit=True)
+                else:
+                    tasks.append((size, volume_idx, page_idx, img_path, store_key))
+
+        num_unfinished = [0] * len(volumes)
+        for _, volume_idx, _, _, _ in tasks:
+            num_unfinished[volume_idx] += 1
+
+        def write_ready_pages(volume_idx):
+            results = page_results[volume_idx]
+            while num_written[volume_idx] in results:
+                page_idx = num_written[volume_idx]
+                item = results.pop(page_idx)
+                img_path_rel, signature = volume_pages[volume_idx][page_idx]
+                if item is not None:
+                    result, store_key = item
+                    with span("write_page", path=img_path_rel):
+                        volumes[volume_idx].page_cache.put(img_path_rel.with_suffix(""), result)
+                        volumes[volume_idx].manifest.set_page_done(img_path_rel.with_suffix(""), signature)
+                        if store_key is not None:
+                            self.ocr_store.put(store_key, result)
+                mokuro_writers[volume_idx].add_page(img_path_rel.with_suffix(""))
+                num_written[volume_idx] += 1
+
+        next_volume_idx = 0
+
+        def finished_volumes():
+            nonlocal next_volume_idx
+            while next_volume_idx < len(volumes) and num_unfinished[next_volume_idx] == 0:
+                if volume_errors[next_volume_idx] is None:
+                    write_ready_pages(next_volume_idx)
+                yield self._finish_volume(
+                    volumes[next_volume_idx],
+                    mokuro_writers[next_volume_idx],
+                    volume_errors[next_volume_idx],
+                    ignore_errors,
+                )
+                next_volume_idx += 1
+
+        # longest job first, with file size as a proxy for processing time
+        tasks.sort(key=lambda task: task[0], reverse=True)
+
+        with create_worker_pool(self.workers, self.mpocr_kwargs) as pool:
+            futures = {}
+            volume_futures = [[] for _ in volumes]
+            for _, volume_idx, page_idx, img_path, store_key in tasks:
+                future = pool.submit(process_page, img_path)
+                futures[future] = volume_idx, page_idx, store_key
+                volume_futures[volume_idx].append(future)
+
+            yield from finished_volumes()
+
+            for future in tqdm(as_completed(futures), desc="Processing pages...", total=len(futures)):
+                volume_idx, page_idx, store_key = futures[future]
+                num_unfinished[volume_idx] -= 1
+                img_path_rel, _signature = volume_pages[volume_idx][page_idx]
+                page_done = functools.partial(
+                    events.page_done,
+                    str(volumes[volume_idx].path_in),
+                    str(img_path_rel),
+                    ocr_store_hit=None if self.ocr_store is None else False,
+                )
+
+                error = CancelledError() if future.cancelled() else future.exception()
+                if isinstance(error, CancelledError):
+                    # pages of a volume which already failed; they are still reported, so that every page
+                    # announced in volume_start gets a page_done event
+                    page_done(error=error)
+                # any error of a page in a worker fails only the page, or its volume
+                elif error is not None:
+                    page_results[volume_idx][page_idx] = None
+                    page_done(error=error)
+                    if ignore_errors:
+                        logger.error(error)
+                    elif volume_errors[volume_idx] is None:
+                        volume_errors[volume_idx] = error
+                        for volume_future in volume_futures[volume_idx]:
+                            volume_future.cancel()
                 else:
-                    raise e
+                    result, timings = future.result()
+                    page_results[volume_idx][page_idx] = result, store_key
+                    page_done(timings=timings)
+
+                if volume_errors[volume_idx] is None:
+                    write_ready_pages(volume_idx)
+
+                yield from finished_volumes()
+
+        self._log_ocr_store_stats()
+
+    def _finish_volume(self, volume, mokuro_writer, error, ignore_errors):
+        try:
+            volume.manifest.save()
+            if error is None:
+                self._update_mokuro_file(volume, mokuro_writer, ignore_errors=ignore_errors)
+        # any error fails only this volume, the other volumes are still finished
+        except Exception as e:  # noqa: BLE001
+            error = error or e
 
-        self.generate_mokuro_file(volume, ignore_errors=ignore_errors)
+        return volume, error
 
     @staticmethod
-    def generate_mokuro_file(volume: Volume, ignore_errors=False):
-        json_paths = volume.get_json_paths()
+    def _get_pages_to_process(volume: Volume, no_cache=False):
+        """Return a list of (img_path_rel, signature) of pages which need processing, and the total number of pages.
+
+        A page needs processing if it has no cached result, or if its source image changed since it was processed.
+        """
         img_paths = volume.get_img_paths()
+        signatures = volume.get_img_signatures(img_paths)
+
+        if no_cache:
+            return [(img_path_rel, signatures[key]) for key, img_path_rel in img_paths.items()], len(img_paths)
+
+        page_cache = volume.page_cache
+        page_states = {key: volume.manifest.get_page_state(key, signatures[key]) for key in img_paths}
+
+        # while the .mokuro file is current, the manifest is trusted without listing the page cache; otherwise the
+        # .mokuro file is generated from the page cache, so a page is done only while its cached result exists,
+        # and it's restored or processed again below if it doesn't
+        cached_keys = None
+        if "done" in page_states.values() and not volume.manifest.is_mokuro_file_current(volume.path_mokuro, img_paths):
+            cached_keys = page_cache.keys()
+            page_states = {
+                key: "unknown" if state == "done" and key not in cached_keys else state
+                for key, state in page_states.items()
+            }
+        if all(state == "done" for state in page_states.values()):
+            return [], len(img_paths)
+
+        mokuro_data = volume.load_mokuro_data()
+        if mokuro_data is not None:
+            if cached_keys is None:
+                cached_keys = page_cache.keys()
+            restored_pages = []
+            for page in mokuro_data["pages"]:
+                key = Path(page["img_path"]).with_suffix("")
+                if key in cached_keys:
+                    continue
+                page = page.copy()
+                page.pop("img_path")
+                restored_pages.append((key, page))
+            page_cache.put_many(restored_pages)
 
-        out = {
+        # pages missing from the manifest are done if they have a valid cached result
+        cached_keys = {key for key, _result in page_cache.items()} if "unknown" in page_states.values() else set()
+
+        pages = []
+        for key, img_path_rel in img_paths.items():
+            if page_states[key] == "unknown" and key in cached_keys:
+                volume.manifest.set_page_done(key, signatures[key])
+            elif page_states[key] != "done":
+                pages.append((img_path_rel, signatures[key]))
+
+        return pages, len(img_paths)
+
+    @staticmethod
+    def get_mokuro_writer(volume: Volume):
+        header = {
             "version": __version__,
             "title": volume.title.name,
             "title_uuid": volume.title.uuid,
             "volume": volume.name,
             "volume_uuid": volume.uuid,
-            "pages": [],
         }
+        return MokuroFileWriter(volume.path_mokuro, header, volume.get_img_paths(), volume.page_cache)
 
-        for key, json_path_rel in json_paths.items():
-            try:
-                img_path_rel = img_paths[key]
-                page_json = load_json(volume.path_ocr_cache / json_path_rel)
-                page_json["img_path"] = str(img_path_rel).replace("\\", "/")
-                out["pages"].append(page_json)
-            except Exception as e:
-                if ignore_errors:
-                    logger.error(e)
-                else:
-                    raise e
-
-        dump_json(out, volume.path_mokuro)
+    @staticmethod
+    def generate_mokuro_file(volume: Volume, ignore_errors=False):
+        """Write the .mokuro file with all pages from the page cache; return the number of pages."""
+        return MokuroGenerator.get_mokuro_writer(volume).finish(ignore_errors=ignore_errors)
@@ -0,0 +1,111 @@
+import json
+import os
+from pathlib import Path
+
+from loguru import logger
+from natsort import natsorted
+
+from mokuro.tracing import span
+from mokuro.utils import NumpyEncoder
+
+# a .mokuro file ends with the closing brackets of the pages list and the top-level object
+_TAIL = b"]}"
+
+
+class MokuroFileWriter:
+    """Writes a volume's .mokuro file incrementally, while its pages are being processed.
+
+    Pages are appended in natural sort order, each as soon as all pages before it are done. After each append
+    the file on disk is a valid .mokuro file marked with "partial": true, so the volume can be opened before
+    it's fully processed. finish() writes the complete file without the marker, atomically replacing the
+    partial one. If the volume already has a .mokuro file, e.g. when it's processed again, the pages are
+    appended to a temporary file next to it instead, so that an interruption never destroys the previous file.
+
+    Page results are read from the page cache one at a time, so they are never all held in memory.
+    """
+
+    def __init__(self, path, header, img_paths, page_cache):
+        self.path = Path(path)
+        self.header = header
+        self.img_paths = img_paths
+        self.page_cache = page_cache
+        self._keys = natsorted(img_paths)
+        self._done = set()
+        self._next_idx = 0
+        self._num_written = 0
+        self._path_partial = None
+
+    def add_page(self, key):
+        """Mark a page as done; its result is read from the page cache. Pages without a result are skipped."""
+        self._done.add(key)
+        while self._next_idx < len(self._keys) and self._keys[self._next_idx] in self._done:
+            page = self._get_page(self._keys[self._next_idx])
+            if page is not None:
+                with span("append_mokuro_page", path=self.path, page=page["img_path"]):
+                    self._append(page)
+            self._next_idx += 1
+
+    def finish(self, ignore_errors=False):
+        """Write the complete .mokuro file, with all pages from the page cache; return the number of pages."""
+        path_tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with span("write_mokuro", path=self.path) as span_args, open(path_tmp, "wb") as f:
+            f.write(self._header_bytes(partial=False))
+            num_written = 0
+            for key in self._keys:
+                try:
+                    page = self._get_page(key)
+                    if page is None:
+                        continue
+                    f.write((b", " if num_written else b"") + _dumps(page))
+                    num_written += 1
+                except Exception as e:
+                    if ignore_errors:
+                        logger.error(e)
+                    else:
+                        raise e
+            f.write(_TAIL)
+            span_args["num_pages"] = num_written
+
+        os.replace(path_tmp, self.path)
+        if self._path_partial is not None and self._path_partial != self.path:
+            self._path_partial.unlink(missing_ok=True)
+        return num_written
+
+    def _get_page(self, key):
+        result = self.page_cache.get(key)
+        if result is None:
+            return None
+
+        page = dict(result)
+        page["img_path"] = str(self.img_paths[key]).replace("\\", "/")
+        return page
+
+    def _append(self, page):
+        if self._num_written == 0:
+            if self.path.exists():
+                self._path_partial = self.path.with_name(f"{self.path.name}.{os.getpid()}.partial.tmp")
+            else:
+                self._path_partial = self.path
+            with open(self._path_partial, "wb") as f:
+                f.write(self._header_bytes(partial=True) + _dumps(page) + _TAIL)
+        else:
+            # overwrite the closing brackets, so the file stays valid JSON after every page
+            with open(self._path_partial, "r+b") as f:
+                f.seek(-len(_TAIL), os.SEEK_END)
+                f.write(b", " + _dumps(page) + _TAIL)
+        self._num_written += 1
+
+    def _header_bytes(self, partial):
+        """Everything up to the opening bracket of the pages list."""
+        header = dict(self.header)
+        if partial:
+            header["partial"] = True
+        header["pages"] = []
+
+        data = _dumps(header)
+        assert data.endswith(b"[]}")
+        return data[: -len(_TAIL)]
+
+
+def _dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, cls=NumpyEncoder).encode("utf-8")
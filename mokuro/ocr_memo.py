@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import cv2
+from loguru import logger
+
+from mokuro.utils import dump_json, load_json
+
+# manga-ocr resizes every line crop to its encoder input size, ignoring the aspect ratio,
+# so crops which are the same at this size look the same to the model
+FINGERPRINT_SIZE = (224, 224)
+
+
+class LineOcrMemo:
+    """Memo of recognized text of line crops, so that repeated text images (SFX, chapter headers, credits, the same
+    pages in re-scans...) are recognized only once.
+
+    Crops are keyed by a hash of their grayscale version, resized to the OCR model input size, and the model id.
+    Up to max_entries texts, taking up to max_bytes, are kept in memory; least recently used ones are evicted first.
+    If path is set, the memo is loaded from it and saved to it with save().
+    """
+
+    def __init__(self, model_id, path=None, max_entries=100_000, max_bytes=64_000_000):
+        self.model_id = hashlib.sha256(str(model_id).encode()).hexdigest()[:16]
+        self.path = Path(path) if path is not None else None
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.num_hits = 0
+        self.num_misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._modified = False
+        self._last_save = time.monotonic()
+        self._lock = threading.Lock()
+
+        if self.path is not None:
+            for key, text in self._load_entries():
+                self._set(key, text)
+
+    def key(self, crop):
+        """Fingerprint of a line crop, as passed to the OCR model (BGR or grayscale array)."""
+        if crop.ndim == 3:
+            crop = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        crop = cv2.resize(crop, FINGERPRINT_SIZE, interpolation=cv2.INTER_AREA)
+        return f"{self.model_id}_{hashlib.blake2b(crop.tobytes(), digest_size=16).hexdigest()}"
+
+    def get(self, key):
+        """Return the memoized text for key, or None if there is none."""
+        with self._lock:
+            text = self._entries.get(key)
+            if text is None:
+                self.num_misses += 1
+            else:
+                self.num_hits += 1
+                self._entries.move_to_end(key)
+            return text
+
+    def put(self, key, text):
+        with self._lock:
+            self._set(key, text)
+            self._modified = True
+
+    def __len__(self):
+        return len(self._entries)
+
+    def log_stats(self):
+        total = self.num_hits + self.num_misses
+        if total:
+            logger.info(
+                f"OCR memo: {self.num_hits} hits, {self.num_misses} misses, "
+                f"hit rate {self.num_hits / total:.1%}, {len(self)} entries"
+            )
+
+    def save(self, min_interval=0):
+        """Save the memo to path, merged with entries saved there in the meantime, e.g. by other processes.
+
+        With min_interval (seconds), it's saved only if it wasn't saved for that long, so that it can be called
+        after every volume without writing the whole memo each time.
+        """
+        if self.path is None or not self._modified or time.monotonic() - self._last_save < min_interval:
+            return
+
+        with self._lock:
+            entries = self._entries
+            self._entries = OrderedDict()
+            self._size = 0
+            # entries on disk which are not in memory are older than the ones in memory
+            for key, text in self._load_entries():
+                if key not in entries:
+                    self._set(key, text)
+            for key, text in entries.items():
+                self._set(key, text)
+
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                path_tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+                dump_json(list(self._entries.items()), path_tmp)
+                os.replace(path_tmp, self.path)
+                self._modified = False
+                self._last_save = time.monotonic()
+            except OSError as e:
+                logger.warning(f"Failed to save OCR memo: {e}")
+
+    def _set(self, key, text):
+        old_text = self._entries.pop(key, None)
+        if old_text is not None:
+            self._size -= _entry_size(key, old_text)
+
+        self._entries[key] = text
+        self._size += _entry_size(key, text)
+
+        while self._entries and (len(self._entries) > self.max_entries or self._size > self.max_bytes):
+            old_key, old_text = self._entries.popitem(last=False)
+            self._size -= _entry_size(old_key, old_text)
+
+    def _load_entries(self):
+        try:
+            return load_json(self.path)
+        except (FileNotFoundError, json.JSONDecodeError, UnicodeDecodeError):
+            return []
+
+
+def _entry_size(key, text):
+    return len(key) + len(text.encode("utf-8"))
@@ -0,0 +1,104 @@
+import contextlib
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+from loguru import logger
+
+from mokuro.utils import dump_json, load_json
+
+
+class OcrStore:
+    """Global content-addressed store of page OCR results.
+
+    Results are keyed by a hash of the image file content and a fingerprint of the OCR config, so an identical
+    page is OCR'd only once, no matter in which volume (or under which name) it appears. Each result is stored
+    as a separate JSON file. If max_size is set, least recently used results are evicted when the store grows
+    larger than max_size bytes.
+    """
+
+    def __init__(self, root, config_fingerprint, max_size=None):
+        self.root = Path(root)
+        self.config_fingerprint = config_fingerprint
+        self.max_size = max_size
+        self.num_hits = 0
+        self.num_misses = 0
+        self._size = None
+        self._lock = threading.Lock()
+
+    def key(self, img_bytes):
+        return f"{hashlib.sha256(img_bytes).hexdigest()}_{self.config_fingerprint}"
+
+    def get(self, key):
+        """Return the stored result for key, or None if there is none."""
+        path = self._path(key)
+        try:
+            result = load_json(path)
+        except (FileNotFoundError, json.JSONDecodeError, UnicodeDecodeError):
+            with self._lock:
+                self.num_misses += 1
+            return None
+
+        # mtime marks the last use, for LRU eviction
+        with contextlib.suppress(OSError):
+            os.utime(path)
+
+        with self._lock:
+            self.num_hits += 1
+        return result
+
+    def put(self, key, result):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # write to a temporary file first, so that other processes never see a partially written result
+        path_tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        dump_json(result, path_tmp)
+        os.replace(path_tmp, path)
+
+        if self.max_size is not None:
+            with self._lock:
+                if self._size is None:
+                    self._size = sum(size for _, size, _ in self._scan())
+                else:
+                    self._size += path.stat().st_size
+
+                if self._size > self.max_size:
+                    self._evict()
+
+    def _path(self, key):
+        return self.root / key[:2] / f"{key}.json"
+
+    def _scan(self):
+        entries = []
+        for subdir in os.scandir(self.root):
+            if not subdir.is_dir():
+                continue
+            for entry in os.scandir(subdir.path):
+                if entry.name.endswith(".json"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue  # removed by another process
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self):
+        # evict down to 90% of max size, so that eviction doesn't run on every put
+        target_size = 0.9 * self.max_size
+
+        entries = sorted(self._scan())
+        self._size = sum(size for _, size, _ in entries)
+        num_evicted = 0
+
+        for _mtime, size, path in entries:
+            if self._size <= target_size:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            self._size -= size
+            num_evicted += 1
+
+        logger.info(f"Evicted {num_evicted} results from OCR store {self.root}")
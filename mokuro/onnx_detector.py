@@ -0,0 +1,87 @@
+import inspect
+import os
+from pathlib import Path
+
+import numpy as np
+import torch
+from loguru import logger
+
+
+def get_onnx_model_path(model_path, input_size):
+    """Path of the ONNX export of detector weights, stored next to them. The export has a fixed input size."""
+    model_path = Path(model_path)
+    return model_path.with_name(f"{model_path.stem}_{input_size[0]}x{input_size[1]}.onnx")
+
+
+def export_onnx(net, path, input_size):
+    """Export a torch TextDetBase to ONNX. The file is written under a temporary name first, so that concurrent
+    exports (e.g. from multiple workers) never leave a partially written model.
+    """
+    logger.info(f"Exporting text detector to ONNX: {path}")
+
+    kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        kwargs["dynamo"] = False
+
+    path_tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    dummy_input = torch.zeros(1, 3, input_size[1], input_size[0])
+    with torch.no_grad():
+        torch.onnx.export(
+            net,
+            dummy_input,
+            str(path_tmp),
+            input_names=["images"],
+            output_names=["blks", "mask", "lines_map"],
+            dynamic_axes={name: {0: "batch"} for name in ["images", "blks", "mask", "lines_map"]},
+            opset_version=13,
+            **kwargs,
+        )
+    os.replace(path_tmp, path)
+
+
+class OnnxTextDetBase:
+    """Drop-in replacement for comic_text_detector's TextDetBase, which runs the exported model with ONNX Runtime.
+
+    Takes and returns torch tensors, like TextDetBase, so TextDetector's pre- and post-processing is unchanged.
+    """
+
+    def __init__(self, onnx_path, device="cpu", num_threads=None):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError(
+                "onnxruntime detector backend requires onnxruntime, install it with: pip install onnxruntime"
+            ) from e
+
+        options = ort.SessionOptions()
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+
+        providers = ["CPUExecutionProvider"]
+        if device == "cuda" and "CUDAExecutionProvider" in ort.get_available_providers():
+            providers.insert(0, "CUDAExecutionProvider")
+
+        self.session = ort.InferenceSession(str(onnx_path), options, providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+        # models exported with a fixed batch size of 1 run batches one page at a time
+        self.dynamic_batch = not isinstance(self.session.get_inputs()[0].shape[0], int)
+
+    def __call__(self, img_in):
+        img_in = img_in.cpu().numpy()
+        if self.dynamic_batch:
+            outputs = self.session.run(None, {self.input_name: img_in})
+        else:
+            outputs = [self.session.run(None, {self.input_name: img_in[i : i + 1]}) for i in range(len(img_in))]
+            outputs = [np.concatenate(output) for output in zip(*outputs, strict=True)]
+        return tuple(torch.from_numpy(output) for output in outputs)
+
+
+def use_onnxruntime(text_detector, model_path, device="cpu", num_threads=None):
+    """Switch a TextDetector created with torch weights on CPU to ONNX Runtime, exporting the model on first use."""
+    onnx_path = get_onnx_model_path(model_path, text_detector.input_size)
+    if not onnx_path.is_file():
+        export_onnx(text_detector.net, onnx_path, text_detector.input_size)
+
+    text_detector.net = OnnxTextDetBase(onnx_path, device=device, num_threads=num_threads)
+    text_detector.device = "cpu"
+    text_detector.half = False
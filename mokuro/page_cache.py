@@ -0,0 +1,181 @@
+import json
+import shutil
+import sqlite3
+import threading
+from pathlib import Path
+
+from loguru import logger
+
+from mokuro.utils import NumpyEncoder, dump_json, load_json
+
+
+class PageCache:
+    """Storage for OCR results of the pages of one volume.
+
+    Results are keyed by page image path relative to the volume, without suffix (the same keys as in
+    Volume.get_img_paths).
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def exists(self):
+        raise NotImplementedError
+
+    def keys(self):
+        """Set of keys of all cached pages."""
+        raise NotImplementedError
+
+    def get(self, key):
+        """Cached result for a page, or None if it's missing or unreadable."""
+        raise NotImplementedError
+
+    def items(self):
+        """Iterate over (key, result) pairs of all cached pages, in no particular order."""
+        raise NotImplementedError
+
+    def put(self, key, result):
+        raise NotImplementedError
+
+    def put_many(self, items):
+        """Store multiple (key, result) pairs at once."""
+        for key, result in items:
+            self.put(key, result)
+
+    def remove(self):
+        raise NotImplementedError
+
+
+class DirPageCache(PageCache):
+    """Each page result is stored in a separate JSON file: <volume dir>/_ocr/<volume>/<page>.json"""
+
+    def exists(self):
+        return self.path.is_dir()
+
+    def keys(self):
+        return {Path(p.relative_to(self.path).as_posix().removesuffix(".json")) for p in self.path.glob("**/*.json")}
+
+    def get(self, key):
+        try:
+            return load_json(self._json_path(key))
+        except (FileNotFoundError, json.JSONDecodeError, UnicodeDecodeError):
+            return None
+
+    def items(self):
+        for key in self.keys():
+            result = self.get(key)
+            if result is not None:
+                yield key, result
+
+    def put(self, key, result):
+        json_path = self._json_path(key)
+        json_path.parent.mkdir(parents=True, exist_ok=True)
+        dump_json(result, json_path)
+
+    def remove(self):
+        shutil.rmtree(self.path)
+
+    def _json_path(self, key):
+        # keys may contain dots, e.g. "ch1.5/p01", so the suffix is appended rather than replacing anything
+        return self.path / f"{Path(key).as_posix()}.json"
+
+
+class SqlitePageCache(PageCache):
+    """All page results are stored in a single SQLite file: <volume dir>/_ocr/<volume>.sqlite
+
+    Writes are atomic, put_many writes all pages in one transaction.
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def exists(self):
+        return self.path.is_file()
+
+    def keys(self):
+        with self._lock:
+            return {Path(key) for (key,) in self._connect().execute("SELECT key FROM pages")}
+
+    def get(self, key):
+        with self._lock:
+            row = self._connect().execute("SELECT result FROM pages WHERE key = ?", (Path(key).as_posix(),)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def items(self):
+        with self._lock:
+            rows = self._connect().execute("SELECT key, result FROM pages").fetchall()
+        for key, result in rows:
+            yield Path(key), json.loads(result)
+
+    def put(self, key, result):
+        self.put_many([(key, result)])
+
+    def put_many(self, items):
+        rows = [
+            (Path(key).as_posix(), json.dumps(result, ensure_ascii=False, cls=NumpyEncoder)) for key, result in items
+        ]
+        with self._lock, self._connect() as connection:
+            connection.executemany("INSERT OR REPLACE INTO pages (key, result) VALUES (?, ?)", rows)
+
+    def remove(self):
+        self.close()
+        for path in (
+            self.path,
+            self.path.with_name(self.path.name + "-wal"),
+            self.path.with_name(self.path.name + "-shm"),
+        ):
+            path.unlink(missing_ok=True)
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _connect(self):
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS pages (key TEXT PRIMARY KEY, result TEXT NOT NULL)")
+        return self._connection
+
+
+PAGE_CACHE_BACKENDS = {
+    "dir": (DirPageCache, ""),
+    "sqlite": (SqlitePageCache, ".sqlite"),
+}
+
+
+def get_page_cache(path_ocr_cache, backend="dir"):
+    """Page cache of a volume with the given backend; path_ocr_cache is the volume's _ocr/<volume> path."""
+    if backend not in PAGE_CACHE_BACKENDS:
+        raise ValueError(f"Unknown page cache backend {backend}, expected one of: {', '.join(PAGE_CACHE_BACKENDS)}")
+
+    cls, suffix = PAGE_CACHE_BACKENDS[backend]
+    return cls(path_ocr_cache.with_name(path_ocr_cache.name + suffix))
+
+
+def find_page_caches(path_ocr_cache):
+    """Existing page caches of a volume, of any backend."""
+    page_caches = (get_page_cache(path_ocr_cache, backend) for backend in PAGE_CACHE_BACKENDS)
+    return [page_cache for page_cache in page_caches if page_cache.exists()]
+
+
+def migrate_page_cache(src: PageCache, dst: PageCache, remove_src=True):
+    """Copy all results from one page cache to another, e.g. to switch a volume to another backend."""
+    logger.info(f"Migrating cached OCR results from {src.path} to {dst.path}")
+    dst.put_many(src.items())
+    if remove_src:
+        src.remove()
+
+
+def open_page_cache(path_ocr_cache, backend="dir"):
+    """Page cache of a volume with the given backend. Results cached with other backends are migrated to it."""
+    page_cache = get_page_cache(path_ocr_cache, backend)
+    for other_page_cache in find_page_caches(path_ocr_cache):
+        if type(other_page_cache) is not type(page_cache):
+            migrate_page_cache(other_page_cache, page_cache)
+    return page_cache
@@ -0,0 +1,103 @@
+import threading
+from collections import Counter
+from typing import NamedTuple
+
+import numpy as np
+from loguru import logger
+
+PAGE_FILTER_MODES = ("off", "skip", "report")
+
+# statistics are computed on a thumbnail with this longer side
+THUMBNAIL_SIZE = 512
+
+# a pixel is ink if it differs from the page background (median) by more than this
+INK_THRESHOLD = 48
+
+# a pixel is colored if its HSV saturation and value are at least these
+MIN_SATURATION = 64
+MIN_VALUE = 48
+
+
+class SkippedPage(NamedTuple):
+    """Detection result of a page skipped by the page filter."""
+
+    reason: str
+
+
+def classify_page(img, min_ink=0.002, max_color_fraction=0.5):
+    """Cheap check whether a page has no text, based on statistics of its thumbnail.
+
+    Returns "blank" if less than min_ink of the page differs from its background (e.g. blank separator pages,
+    possibly with a page number), "color" if more than max_color_fraction of the page is colored (e.g. covers and
+    color illustrations), or None if the page may have text. max_color_fraction=None disables the color check.
+    """
+    import cv2
+
+    h, w = img.shape[:2]
+    scale = THUMBNAIL_SIZE / max(h, w)
+    if scale < 1:
+        img = cv2.resize(img, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+
+    gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    ink = np.abs(gray.astype(np.int16) - int(np.median(gray))) > INK_THRESHOLD
+    if ink.mean() < min_ink:
+        return "blank"
+
+    if max_color_fraction is not None and img.ndim == 3:
+        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+        colored = (hsv[..., 1] >= MIN_SATURATION) & (hsv[..., 2] >= MIN_VALUE)
+        if colored.mean() > max_color_fraction:
+            return "color"
+
+    return None
+
+
+class PageFilter:
+    """Pre-filter which runs before text detection and finds pages without text (see classify_page).
+
+    In "skip" mode, detection and OCR are skipped for these pages. In "report" mode, all pages are processed as
+    usual, and pages which would be skipped are logged, with the number of text blocks the detector found on them,
+    which helps to tune the thresholds.
+    """
+
+    def __init__(self, mode="skip", min_ink=0.002, max_color_fraction=0.5):
+        if mode not in PAGE_FILTER_MODES:
+            raise ValueError(f"Unknown page filter mode {mode}, expected one of: {', '.join(PAGE_FILTER_MODES)}")
+
+        self.mode = mode
+        self.min_ink = min_ink
+        self.max_color_fraction = max_color_fraction
+        self.num_pages = 0
+        self.num_flagged = Counter()
+        self.num_flagged_with_text = 0
+        self._lock = threading.Lock()
+
+    def check(self, img):
+        """Return the reason to skip a page, or None."""
+        reason = classify_page(img, min_ink=self.min_ink, max_color_fraction=self.max_color_fraction)
+        with self._lock:
+            self.num_pages += 1
+            if reason is not None:
+                self.num_flagged[reason] += 1
+        return reason
+
+    def report(self, reason, blk_list, name=None):
+        """In report mode, log a page which would be skipped, given the detected text blocks."""
+        if reason is None:
+            return
+
+        if blk_list:
+            with self._lock:
+                self.num_flagged_with_text += 1
+        logger.info(f"Page filter would skip {name or 'page'} ({reason}), detector found {len(blk_list)} text blocks")
+
+    def log_stats(self):
+        if not self.num_pages:
+            return
+
+        flagged = ", ".join(f"{num} {reason}" for reason, num in sorted(self.num_flagged.items())) or "none"
+        verb = "skipped" if self.mode == "skip" else "would skip"
+        msg = f"Page filter {verb} {sum(self.num_flagged.values())}/{self.num_pages} pages ({flagged})"
+        if self.mode == "report":
+            msg += f", {self.num_flagged_with_text} of them with detected text"
+        logger.info(msg)
@@ -0,0 +1,129 @@
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+_DONE = object()
+
+
+def run_page_pipeline(pages, read, detect, recognize, write, io_threads=4, max_pending=2, detect_batch_size=None):
+    """Process pages with overlapping read -> detect -> recognize -> write stages.
+
+    Reading (image decoding) and writing run in a thread pool, detection runs in a separate thread and recognition
+    runs in the calling thread, so that detection of the next page overlaps recognition of the current one.
+    At most `max_pending` pages are kept between each pair of stages (or `detect_batch_size` pages before detection,
+    if it's larger), which bounds the memory used for decoded images and detection results.
+
+    Args:
+        pages: Sequence of pages; each page is passed as is to the stage functions.
+        read: read(page) -> img
+        detect: detect(img) -> detection, or detect(imgs) -> detections if detect_batch_size is set
+        recognize: recognize(img, detection) -> result
+        write: write(page, result)
+        io_threads: Number of threads used for reading and writing.
+        max_pending: Maximum number of pages buffered between stages.
+        detect_batch_size: If set, up to this many pages are passed to detect together, as a list.
+
+    Yields:
+        (page, error) tuples in the input order, after the page has been written. error is None on success,
+        otherwise it's the exception raised by any of the stages.
+    """
+
+    detected = queue.Queue(maxsize=max_pending)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                detected.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    batch_size = detect_batch_size or 1
+
+    def detect_worker():
+        try:
+            pages_iter = iter(pages)
+            num_prefetched = max(max_pending, batch_size)
+            reading = deque((page, io_pool.submit(read, page)) for page in islice(pages_iter, num_prefetched))
+
+            while reading and not stop.is_set():
+                # (page, img, error) of up to batch_size pages, in the input order
+                batch = []
+                while reading and len(batch) < batch_size:
+                    page, img_future = reading.popleft()
+                    next_page = next(pages_iter, _DONE)
+                    if next_page is not _DONE:
+                        reading.append((next_page, io_pool.submit(read, next_page)))
+
+                    error = img_future.exception()
+                    batch.append((page, img_future.result() if error is None else None, error))
+
+                imgs = [img for page, img, error in batch if error is None]
+                try:
+                    if not imgs:
+                        detections = []
+                    elif detect_batch_size is None:
+                        detections = [detect(imgs[0])]
+                    else:
+                        detections = detect(imgs)
+                # any error of a stage fails only its pages, it's passed to the caller with them
+                except Exception as e:  # noqa: BLE001
+                    batch = [(page, None, error or e) for page, img, error in batch]
+                    detections = []
+
+                detections = iter(detections)
+                for page, img, error in batch:
+                    if error is None:
+                        put((page, img, next(detections), None))
+                    else:
+                        put((page, None, None, error))
+                del batch, imgs, detections
+        finally:
+            put(_DONE)
+
+    with ThreadPoolExecutor(io_threads) as io_pool:
+        detect_thread = threading.Thread(target=detect_worker, daemon=True)
+        detect_thread.start()
+
+        # pages which went through recognition, with either a write future or an error
+        writing = deque()
+
+        try:
+            while True:
+                item = detected.get()
+                if item is _DONE:
+                    break
+
+                page, img, detection, error = item
+                if error is None:
+                    try:
+                        result = recognize(img, detection)
+                        writing.append((page, io_pool.submit(write, page, result)))
+                    except Exception as e:  # noqa: BLE001
+                        writing.append((page, e))
+                else:
+                    writing.append((page, error))
+                del img, detection
+
+                while writing and (len(writing) > max_pending or _is_finished(writing[0][1])):
+                    yield _wait_for_write(*writing.popleft())
+
+            while writing:
+                yield _wait_for_write(*writing.popleft())
+
+        finally:
+            stop.set()
+            detect_thread.join()
+
+
+def _is_finished(write_future_or_error):
+    return isinstance(write_future_or_error, Exception) or write_future_or_error.done()
+
+
+def _wait_for_write(page, write_future_or_error):
+    if isinstance(write_future_or_error, Exception):
+        return page, write_future_or_error
+    return page, write_future_or_error.exception()
@@ -0,0 +1,121 @@
+import hashlib
+import inspect
+import json
+import os
+import re
+from difflib import SequenceMatcher
+from pathlib import Path
+
+import fire
+import torch
+import transformers
+from loguru import logger
+from natsort import natsorted
+
+from mokuro.cache import cache
+from mokuro.utils import imread
+
+# accuracy of the quantized model is acceptable, if on every page at most MAX_TEXT_DIFF_CHARS characters
+# differ from the full precision model, or the texts are at least MIN_TEXT_SIMILARITY similar
+MAX_TEXT_DIFF_CHARS = 2
+MIN_TEXT_SIMILARITY = 0.95
+
+
+def get_quantized_model_path(pretrained_model_name_or_path):
+    """Path of the cached quantized model. Quantized models are pickled, so torch and transformers versions are
+    part of the key.
+    """
+    key = json.dumps([str(pretrained_model_name_or_path), torch.__version__, transformers.__version__])
+    key_hash = hashlib.sha256(key.encode()).hexdigest()[:12]
+    name = re.sub(r"[^\w.-]+", "_", str(pretrained_model_name_or_path)).strip("_")[-64:]
+    return cache.root / "quantized" / f"{name}_{key_hash}_int8.pt"
+
+
+def quantize_ocr_model(mocr, pretrained_model_name_or_path):
+    """Replace the model of a MangaOcr with a version with int8 dynamically quantized linear layers.
+
+    Quantization is done once, the quantized model is stored in the cache directory. Only CPU is supported.
+    """
+    if mocr.model.device.type != "cpu":
+        logger.warning("Quantized OCR is supported only on CPU, using full precision OCR model")
+        return
+
+    path = get_quantized_model_path(pretrained_model_name_or_path)
+    if path.is_file():
+        logger.info(f"Loading quantized OCR model from {path}")
+        kwargs = {"weights_only": False} if "weights_only" in inspect.signature(torch.load).parameters else {}
+        mocr.model = torch.load(path, map_location="cpu", **kwargs)
+    else:
+        logger.info("Quantizing OCR model")
+        mocr.model = torch.quantization.quantize_dynamic(mocr.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path_tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        torch.save(mocr.model, path_tmp)
+        os.replace(path_tmp, path)
+        logger.info(f"Saved quantized OCR model to {path}")
+
+    mocr.model.eval()
+
+
+def text_diff(text, reference_text):
+    """Return (number of differing characters, similarity ratio) of two texts."""
+    matcher = SequenceMatcher(None, text, reference_text)
+    diff = sum(max(i2 - i1, j2 - j1) for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != "equal")
+    return diff, matcher.ratio()
+
+
+def check_quantized_ocr(*paths, pretrained_model_name_or_path="kha-white/manga-ocr-base"):
+    """Compare OCR results of the quantized and full precision models on CPU, e.g. on the test pages:
+
+    python -m mokuro.quantization tests/data/input/test0/vol1
+
+    Text detection is run once per page, and its lines are recognized with both models. Returns True if every page
+    passes the MAX_TEXT_DIFF_CHARS/MIN_TEXT_SIMILARITY criteria.
+
+    Args:
+        paths: Page images, or directories with page images.
+        pretrained_model_name_or_path: Name or path of the manga-ocr model.
+    """
+    from mokuro.manga_page_ocr import MangaPageOcr
+    from mokuro.volume import scan_img_files
+
+    img_paths = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            img_paths.extend(natsorted(path / p for p in scan_img_files(path)))
+        else:
+            img_paths.append(path)
+
+    mpocr = MangaPageOcr(pretrained_model_name_or_path, force_cpu=True)
+
+    pages = []
+    for img_path in img_paths:
+        img = imread(img_path)
+        detection = mpocr.detect(img)
+        pages.append((img_path, img, detection, _page_text(mpocr.recognize_page(img, detection))))
+
+    quantize_ocr_model(mpocr.mocr, pretrained_model_name_or_path)
+
+    passed = True
+    ratios = []
+    for img_path, img, detection, reference_text in pages:
+        text = _page_text(mpocr.recognize_page(img, detection))
+        diff, ratio = text_diff(text, reference_text)
+        ratios.append(ratio)
+        page_passed = diff <= MAX_TEXT_DIFF_CHARS or ratio >= MIN_TEXT_SIMILARITY
+        passed = passed and page_passed
+        logger.info(f"{img_path}: {diff} characters differ, similarity {ratio:.3f}{'' if page_passed else ' FAILED'}")
+
+    if ratios:
+        logger.info(f"Mean similarity {sum(ratios) / len(ratios):.3f}, min {min(ratios):.3f} over {len(ratios)} pages")
+    logger.info("Quantized OCR accuracy check " + ("passed" if passed else "failed"))
+    return passed
+
+
+def _page_text(result):
+    return "".join(line for block in result["blocks"] for line in block["lines"])
+
+
+if __name__ == "__main__":
+    fire.Fire(check_quantized_ocr)
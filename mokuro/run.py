@@ -1,20 +1,27 @@
+import zipfile
 from collections import Counter
+from collections.abc import Callable, Sequence
 from pathlib import Path
-from tempfile import TemporaryDirectory
-from typing import Sequence, Optional, Union
 
 import fire
 from loguru import logger
 
-from mokuro import MokuroGenerator
-from mokuro import __version__
+from mokuro import MokuroGenerator, __version__
+from mokuro.cache import cache
+from mokuro.client import process_volumes_on_server
+from mokuro.events import EventEmitter, JsonlEventSink, combine_callbacks
 from mokuro.legacy.overlay_generator import generate_legacy_html
+from mokuro.library_scan import scan_parent_dir
+from mokuro.tracing import start_tracing, stop_tracing
+from mokuro.utils import close_archives
 from mokuro.volume import VolumeCollection
+from mokuro.watch import watch_library
 
 
 def run(
-    *paths: Optional[Sequence[Union[str, Path]]],
-    parent_dir: Optional[Union[str, Path]] = None,
+    *paths: Sequence[str | Path] | None,
+    parent_dir: str | Path | None = None,
+    recursive: bool = False,
     pretrained_model_name_or_path: str = "kha-white/manga-ocr-base",
     force_cpu: bool = False,
     disable_confirmation: bool = False,
@@ -24,6 +31,32 @@ def run(
     unzip: bool = False,
     legacy_html: bool = True,
     as_one_file: bool = True,
+    ocr_batch_size: int = 16,
+    detector_backend: str = "torch",
+    detector_threads: int | None = None,
+    detector_batch_size: int = 1,
+    quantize_ocr: bool = False,
+    reduced_decode: bool = False,
+    model_snapshots: bool = False,
+    workers: int = 1,
+    ocr_store: bool | str | Path = False,
+    ocr_store_max_gb: float | None = None,
+    ocr_memo: bool | str | Path = False,
+    ocr_memo_max_entries: int = 100_000,
+    ocr_memo_max_mb: float = 64,
+    page_filter: str = "off",
+    page_filter_min_ink: float = 0.002,
+    page_filter_max_color_fraction: float | None = 0.5,
+    page_cache_backend: str = "dir",
+    trace: str | Path | None = None,
+    events: str | Path | None = None,
+    event_callback: Callable | None = None,
+    server: str | None = None,
+    priority: int = 0,
+    watch: bool = False,
+    watch_backend: str = "auto",
+    watch_debounce: float = 30,
+    watch_poll_interval: float = 60,
     version: bool = False,
 ):
     """
@@ -32,15 +65,72 @@ def run(
     Args:
         paths: Paths to manga volumes. Volume can be a directory, a zip file or a cbz file.
         parent_dir: Parent directory to scan for volumes. If provided, all volumes inside this directory will be processed.
+        recursive: Scan parent_dir recursively. Every zip/cbz file and every directory which directly contains images,
+            at any depth, is treated as a volume. A volume split into chapter directories, with no images directly in
+            it, is processed as one volume per chapter.
         pretrained_model_name_or_path: Name or path of the manga-ocr model.
         force_cpu: Force the use of CPU even if CUDA is available.
         disable_confirmation: Disable confirmation prompt. If False, the user will be prompted to confirm the list of volumes to be processed.
         disable_ocr: Disable OCR processing. Generate mokuro/HTML files without OCR results.
         ignore_errors: Continue processing volumes even if an error occurs.
         no_cache: Do not use cached OCR results from previous runs (_ocr directories).
-        unzip: Extract volumes in zip/cbz format in their original location.
+        unzip: Extract volumes in zip/cbz format in their original location. Otherwise, images are read directly from
+            the archives.
         legacy_html: Enable legacy HTML output. If True, acts as if --unzip is True.
         as_one_file: Applies only to legacy HTML. If False, generate separate CSS and JS files instead of embedding them in the HTML file.
+        ocr_batch_size: Number of text line crops recognized together in one OCR model call.
+        detector_backend: Inference backend of the text detector: "torch", or "onnxruntime" (requires onnxruntime
+            package). For onnxruntime, the model is exported to ONNX on first use and cached next to the torch weights.
+        detector_threads: Number of threads used by the text detector with onnxruntime backend. By default, all cores
+            are used.
+        detector_batch_size: Number of pages passed through the text detector together in one forward pass. Doesn't
+            apply with workers > 1.
+        quantize_ocr: Use the OCR model with int8 quantized linear layers, which is faster on CPU, with slightly
+            different results. Quantized model is stored in the cache directory. Applies only to CPU.
+        reduced_decode: Decode JPEG pages at reduced resolution for text detection, and at full resolution (in
+            grayscale) only for pages with text, for OCR. Faster for high resolution scans, with slightly different
+            results.
+        model_snapshots: Save snapshots of the text detector and OCR models, ready to run (after quantization with
+            quantize_ocr), in the cache directory on first use, and load them memory-mapped on later starts. Faster
+            startup and lower memory use of each process, e.g. with many workers.
+        workers: Number of worker processes, each with its own copy of the models. Pages from all volumes are
+            distributed between the workers.
+        ocr_store: Path to a global store of OCR results, keyed by image content and OCR settings, shared between all
+            volumes. If True, a default location in the cache directory is used.
+        ocr_store_max_gb: Maximum size of the OCR store in GB. Least recently used results are removed when it grows
+            larger.
+        ocr_memo: Memoize recognized text of line crops, so that repeated text images (SFX, chapter headers, credits...)
+            are recognized only once. If True, the memo is kept in memory for this run; if a path, it's also saved to
+            this file and reused in later runs.
+        ocr_memo_max_entries: Maximum number of line texts in the OCR memo. Least recently used ones are removed first.
+        ocr_memo_max_mb: Maximum size of the OCR memo in MB.
+        page_filter: Cheap pre-filter which finds pages without text before text detection, from statistics of a page
+            thumbnail: "off", "skip" - skip detection and OCR on blank and full-color pages (e.g. covers, including
+            their title text), their results are empty and marked as skipped, or "report" - process all pages, but log
+            which would be skipped.
+        page_filter_min_ink: A page is blank if less than this fraction of it differs from the background.
+        page_filter_max_color_fraction: A page is a color page (cover, illustration) if more than this fraction of it is
+            colored. If None, color pages are not skipped.
+        page_cache_backend: How OCR results of each page are cached: "dir" - a JSON file per page in _ocr/<volume>/,
+            "sqlite" - one file per volume, _ocr/<volume>.sqlite. Existing results are migrated to the selected backend.
+        trace: Save timing spans of each page and processing stage (reading, detection, mask refinement, line cropping,
+            OCR, writing results) to this file, in Chrome trace format, which can be opened in https://ui.perfetto.dev.
+            Only the last 200000 spans of each process are kept, e.g. with --watch.
+        events: Append machine-readable progress events to this file, one JSON object per line: volume start/finish,
+            page completion with stage timings and errors, cache hits and misses, and rolling pages/sec with ETA (see
+            mokuro.events.EventEmitter).
+        event_callback: Function called with each progress event, as a dict. Only when run is called from Python.
+        server: Address of a mokuro server (python -m mokuro.server), http://host:port or unix:<socket path>, which
+            processes the volumes with models which are already loaded. Options of models and caches (OCR store, OCR
+            memo, page filter...) are those of the server.
+        priority: Priority of jobs sent to the server; jobs with higher priority are processed first.
+        watch: After processing, keep watching parent_dir and process volumes which are added or changed, until
+            interrupted with Ctrl+C.
+        watch_backend: How parent_dir is watched: "inotify" (Linux only), "poll" - scan it every watch_poll_interval
+            seconds, or "auto" - inotify if available, otherwise poll.
+        watch_debounce: A new or changed volume is processed once its files didn't change for this many seconds, so that
+            volumes which are still being copied are not processed.
+        watch_poll_interval: Seconds between scans of parent_dir with watch_backend "poll".
         version: Print the version of mokuro and exit.
     """
 
@@ -48,6 +138,10 @@ def run(
         print(f"{__version__}")
         return
 
+    if watch and parent_dir is None:
+        logger.error("Watch mode requires parent_dir")
+        return
+
     if disable_ocr:
         logger.info("Running with OCR disabled")
 
@@ -80,20 +174,21 @@ def run(
     paths = paths_
 
     if parent_dir is not None:
-        for p in Path(parent_dir).expanduser().absolute().iterdir():
-            if (
-                p not in paths
-                and (p.is_dir() and p.stem != "_ocr")
-                or (p.is_file() and p.suffix.lower() in {".zip", ".cbz"})
-            ):
+        parent_dir = Path(parent_dir).expanduser().absolute()
+        for p in scan_parent_dir(
+            parent_dir,
+            recursive=recursive,
+            cache_path=cache.root / "library_scan.json",
+        ):
+            if p not in paths:
                 paths.append(p)
 
-    vc = VolumeCollection()
+    vc = VolumeCollection(page_cache_backend=page_cache_backend)
 
     for path_in in paths:
         vc.add_path_in(path_in)
 
-    if len(vc) == 0:
+    if len(vc) == 0 and not watch:
         logger.error("Found no paths to process. Did you set the paths correctly?")
         return
 
@@ -116,34 +211,127 @@ def run(
         if inp.lower() not in ("y", "yes"):
             return
 
-    mg = MokuroGenerator(
-        pretrained_model_name_or_path=pretrained_model_name_or_path, force_cpu=force_cpu, disable_ocr=disable_ocr
-    )
-
-    with TemporaryDirectory() as tmp_dir:
-        tmp_dir = Path(tmp_dir)
+    event_sink = JsonlEventSink(Path(events).expanduser()) if events is not None else None
+    event_callback = combine_callbacks(event_callback, event_sink)
+    run_events = EventEmitter(event_callback)
+
+    # directories created by extracting archives, which are not new volumes in watch mode
+    extracted_dirs = set()
+
+    def prepared_volumes(volumes):
+        for i, volume in enumerate(volumes):
+            logger.info(f"Processing {i + 1}/{len(volumes)}: {volume.path_in}")
+
+            # zipped volumes are read directly from the archive, unless unzip == True,
+            # in which case they are extracted in their original location
+            if unzip:
+                path_in = volume.path_in
+                try:
+                    volume.unzip()
+                # RuntimeError for encrypted or unsupported archive members
+                except (OSError, zipfile.BadZipFile, RuntimeError):
+                    logger.exception(f"Error while processing {volume.path_in}")
+                    continue
+                if volume.path_in != path_in:
+                    extracted_dirs.add(volume.path_in)
+
+            yield volume
+
+    if trace is not None:
+        start_tracing(Path(trace).expanduser())
+
+    if server is not None:
+
+        def process_volumes(volumes):
+            return process_volumes_on_server(
+                server,
+                prepared_volumes(volumes),
+                priority=priority,
+                event_callback=event_callback,
+                ignore_errors=ignore_errors,
+                no_cache=no_cache,
+                page_cache_backend=page_cache_backend,
+            )
+    else:
+        mg = MokuroGenerator(
+            pretrained_model_name_or_path=pretrained_model_name_or_path,
+            force_cpu=force_cpu,
+            disable_ocr=disable_ocr,
+            ocr_batch_size=ocr_batch_size,
+            detector_backend=detector_backend,
+            detector_threads=detector_threads,
+            detector_batch_size=detector_batch_size,
+            quantize_ocr=quantize_ocr,
+            reduced_decode=reduced_decode,
+            model_snapshots=model_snapshots,
+            workers=workers,
+            ocr_store=ocr_store,
+            ocr_store_max_size=ocr_store_max_gb * 1e9 if ocr_store_max_gb is not None else None,
+            ocr_memo=ocr_memo,
+            ocr_memo_max_entries=ocr_memo_max_entries,
+            ocr_memo_max_mb=ocr_memo_max_mb,
+            page_filter=page_filter,
+            page_filter_min_ink=page_filter_min_ink,
+            page_filter_max_color_fraction=page_filter_max_color_fraction,
+            event_callback=event_callback,
+        )
 
-        # unzip == True means that zipped volumes will be unzipped in their original location
-        # in that case, we don't use a temporary directory
-        if unzip:
-            tmp_dir = None
+        def process_volumes(volumes):
+            return mg.process_volumes(prepared_volumes(volumes), ignore_errors=ignore_errors, no_cache=no_cache)
 
-        num_sucessful = 0
-        for i, volume in enumerate(vc):
-            logger.info(f"Processing {i + 1}/{len(vc)}: {volume.path_in}")
+    num_sucessful = 0
 
+    def process(volumes):
+        nonlocal num_sucessful
+        num_batch_successful = 0
+        for volume, error in process_volumes(volumes):
             try:
-                volume.unzip(tmp_dir)
-                mg.process_volume(volume, ignore_errors=ignore_errors, no_cache=no_cache)
+                if error is not None:
+                    raise error
                 if legacy_html:
                     generate_legacy_html(volume, as_one_file=as_one_file, ignore_errors=ignore_errors)
 
             except Exception:
                 logger.exception(f"Error while processing {volume.path_in}")
             else:
-                num_sucessful += 1
-
-        logger.info(f"Processed successfully: {num_sucessful}/{len(vc)}")
+                num_batch_successful += 1
+
+        num_sucessful += num_batch_successful
+        logger.info(f"Processed successfully: {num_batch_successful}/{len(volumes)}")
+
+    def process_watched(volume_paths):
+        # archives may have been replaced since they were read
+        close_archives()
+        watched_vc = VolumeCollection(page_cache_backend=page_cache_backend)
+        for volume_path in volume_paths:
+            watched_vc.add_path_in(volume_path)
+        for title in watched_vc.titles.values():
+            title.set_uuid()
+        process(list(watched_vc))
+
+    run_events.emit("run_start", num_volumes=len(vc))
+    try:
+        if watch:
+            # the library is watched from before the initial processing, so that volumes added meanwhile are found
+            try:
+                watch_library(
+                    [parent_dir],
+                    process_watched,
+                    recursive=recursive,
+                    backend=watch_backend,
+                    debounce=watch_debounce,
+                    poll_interval=watch_poll_interval,
+                    cache_path=cache.root / "library_scan.json",
+                    on_start=lambda: process(list(vc)),
+                    is_ignored=lambda path: not extracted_dirs.isdisjoint([path, *path.parents]),
+                )
+            except KeyboardInterrupt:
+                logger.info("Stopped watching")
+        else:
+            process(list(vc))
+    finally:
+        stop_tracing()
+        run_events.emit("run_finish", num_volumes=len(vc), num_successful=num_sucessful)
 
 
 if __name__ == "__main__":
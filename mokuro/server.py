@@ -0,0 +1,310 @@
+import itertools
+import json
+import os
+import queue
+import socketserver
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import fire
+from loguru import logger
+
+from mokuro import __version__
+from mokuro.events import EventEmitter
+from mokuro.mokuro_generator import MokuroGenerator
+from mokuro.utils import NumpyEncoder
+from mokuro.volume import VolumeCollection
+
+DEFAULT_PORT = 8765
+JOB_TYPES = ("volume", "page")
+JOB_OPTIONS = ("ignore_errors", "no_cache", "page_cache_backend")
+
+_END = object()
+
+
+class Job:
+    """A volume or page job. Its events are queued, to be streamed to the client which submitted it."""
+
+    def __init__(self, job_id, job_type, path, priority=0, options=None):
+        self.job_id = job_id
+        self.job_type = job_type
+        self.path = Path(path)
+        self.priority = priority
+        self.options = options or {}
+        self._queue = queue.Queue()
+        self.events = EventEmitter(self._queue.put)
+
+    def iter_events(self):
+        """Yield events of the job as they are emitted, until the job is finished."""
+        while (event := self._queue.get()) is not _END:
+            yield event
+
+    def close(self):
+        self._queue.put(_END)
+
+
+class OcrServer:
+    """Keeps `instances` MokuroGenerators with loaded models, each in its own thread, which process jobs from
+    a priority queue: higher priority first, then in submission order.
+
+    Volume jobs process a volume the same as run() (except for unzipping and legacy HTML, which are up to the
+    client), page jobs return the OCR result of a single image.
+    """
+
+    def __init__(self, instances=1, **generator_kwargs):
+        self._jobs = queue.PriorityQueue()
+        self._job_ids = itertools.count(1)
+        # volumes of the same title share title metadata, so they are not processed concurrently
+        self._title_locks = defaultdict(threading.Lock)
+        self._lock = threading.Lock()
+        self.num_running = 0
+        self.num_done = 0
+
+        self.generators = []
+        for i in range(instances):
+            logger.info(f"Loading models {i + 1}/{instances}")
+            mg = MokuroGenerator(**generator_kwargs)
+            mg.init_models()
+            self.generators.append(mg)
+
+        self._threads = [
+            threading.Thread(target=self._run_instance, args=(mg,), name=f"ocr-instance-{i}", daemon=True)
+            for i, mg in enumerate(self.generators)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, job_type, path, priority=0, options=None):
+        """Queue a job; its events are available with job.iter_events()."""
+        if job_type not in JOB_TYPES:
+            raise ValueError(f"Unknown job type {job_type}, expected one of: {', '.join(JOB_TYPES)}")
+        if path is None:
+            raise ValueError("Job path is missing")
+        unknown_options = set(options or {}) - set(JOB_OPTIONS)
+        if unknown_options:
+            raise ValueError(
+                f"Unknown job options {', '.join(sorted(unknown_options))}, expected: {', '.join(JOB_OPTIONS)}"
+            )
+
+        job = Job(next(self._job_ids), job_type, path, priority=int(priority), options=options)
+        job.events.emit(
+            "job_queued", job_id=job.job_id, job_type=job_type, path=str(job.path), queued=self._jobs.qsize() + 1
+        )
+        self._jobs.put((-job.priority, job.job_id, job))
+        return job
+
+    def status(self):
+        return {
+            "version": __version__,
+            "instances": len(self.generators),
+            "queued": self._jobs.qsize(),
+            "running": self.num_running,
+            "done": self.num_done,
+        }
+
+    def stop(self):
+        """Finish queued jobs and stop the instances."""
+        for _ in self._threads:
+            self._jobs.put((float("inf"), next(self._job_ids), None))
+        for thread in self._threads:
+            thread.join()
+        for mg in self.generators:
+            mg.mpocr.report()
+            mg.mpocr.save()
+
+    def _run_instance(self, mg):
+        while True:
+            _, _, job = self._jobs.get()
+            if job is None:
+                return
+
+            with self._lock:
+                self.num_running += 1
+            start = time.perf_counter()
+            job.events.emit("job_start", job_id=job.job_id)
+            # any error fails only this job, it's reported to the client in job_finish
+            try:
+                self._run_job(mg, job)
+            except Exception as e:  # noqa: BLE001
+                logger.exception(f"Job {job.job_id} failed: {job.job_type} {job.path}")
+                error = e
+            else:
+                error = None
+
+            job.events.emit(
+                "job_finish",
+                job_id=job.job_id,
+                error=repr(error) if error is not None else None,
+                duration=time.perf_counter() - start,
+            )
+            job.close()
+            with self._lock:
+                self.num_running -= 1
+                self.num_done += 1
+
+    def _run_job(self, mg, job):
+        no_cache = job.options.get("no_cache", False)
+
+        if job.job_type == "page":
+            result, timings, ocr_store_hit = mg.ocr_page(job.path, no_cache=no_cache)
+            job.events.emit(
+                "page_result", path=str(job.path), result=result, ocr_store_hit=ocr_store_hit, timings=timings
+            )
+            return
+
+        vc = VolumeCollection(page_cache_backend=job.options.get("page_cache_backend", "dir"))
+        vc.add_path_in(job.path)
+        (volume,) = vc
+        with self._lock:
+            title_lock = self._title_locks[volume.path_title]
+        with title_lock:
+            volume.title.set_uuid()
+            for _, error in mg.process_volumes(
+                [volume], ignore_errors=job.options.get("ignore_errors", False), no_cache=no_cache, events=job.events
+            ):
+                if error is not None:
+                    raise error
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """Job API: POST /jobs with a JSON {"type": "volume" or "page", "path", "priority", "options"} streams events of
+    the job back as JSON lines, until a "job_finish" event; GET /status returns the state of the server.
+
+    Jobs access local files, so POST requests from web pages are rejected: they must have an application/json
+    Content-Type, which a cross-origin page can't send without a CORS preflight (which is not supported), and
+    no Origin header of another site.
+    """
+
+    server_version = f"mokuro/{__version__}"
+
+    def do_GET(self):
+        if self.path != "/status":
+            self._send_json(404, {"error": f"Not found: {self.path}"})
+            return
+
+        self._send_json(200, self.server.ocr_server.status())
+
+    def do_POST(self):
+        if self.path != "/jobs":
+            self._send_json(404, {"error": f"Not found: {self.path}"})
+            return
+
+        content_type = self.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        if content_type != "application/json":
+            self._send_json(415, {"error": "Content-Type must be application/json"})
+            return
+
+        origin = self.headers.get("Origin")
+        if origin is not None and urlsplit(origin).netloc != self.headers.get("Host"):
+            self._send_json(403, {"error": f"Requests from other origins are not allowed: {origin}"})
+            return
+
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            job = self.server.ocr_server.submit(
+                request.get("type"),
+                request.get("path"),
+                priority=request.get("priority", 0),
+                options=request.get("options"),
+            )
+        except (ValueError, TypeError, AttributeError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        for event in job.iter_events():
+            try:
+                self.wfile.write(_dump_line(event))
+                self.wfile.flush()
+            except OSError:
+                logger.warning(f"Client of job {job.job_id} disconnected, the job continues without it")
+                return
+
+    def _send_json(self, status, obj):
+        body = _dump_line(obj)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+class _UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def _dump_line(obj):
+    return (json.dumps(obj, ensure_ascii=False, cls=NumpyEncoder) + "\n").encode("utf-8")
+
+
+def create_http_server(ocr_server, host="127.0.0.1", port=DEFAULT_PORT, unix_socket=None):
+    """HTTP server with the job API of an OcrServer, listening on host and port, or on a Unix socket.
+    Returns the server and its address, for clients.
+    """
+    if unix_socket is not None:
+        unix_socket = Path(unix_socket).expanduser()
+        if unix_socket.is_socket():
+            # left over from a server which didn't exit cleanly
+            os.remove(unix_socket)
+        httpd = _UnixHTTPServer(str(unix_socket), _RequestHandler)
+        address = f"unix:{unix_socket}"
+    else:
+        httpd = ThreadingHTTPServer((host, port), _RequestHandler)
+        address = f"http://{host}:{httpd.server_address[1]}"
+
+    httpd.ocr_server = ocr_server
+    return httpd, address
+
+
+def serve(host="127.0.0.1", port=DEFAULT_PORT, unix_socket=None, instances=1, ocr_store_max_gb=None, **kwargs):
+    """Run a mokuro server, which keeps models loaded between jobs, so that they don't pay the startup time:
+
+    python -m mokuro.server --port 8765 --instances 2
+
+    Jobs are submitted with `mokuro --server http://127.0.0.1:8765 <paths>` (or unix:<path> for a Unix socket),
+    which takes the same options as run(); options of models and caches are those of the server.
+
+    Args:
+        host: Host to listen on. Jobs access local files, so the server should be reachable only from the same host.
+        port: Port to listen on.
+        unix_socket: Path of a Unix socket to listen on, instead of host and port.
+        instances: Number of model instances, each processing one job at a time.
+        ocr_store_max_gb: Maximum size of the OCR store in GB.
+        kwargs: Options of MokuroGenerator, the same as the options of run(), e.g. --force_cpu, --ocr_store,
+            --page_filter skip.
+    """
+    ocr_server = OcrServer(
+        instances=instances,
+        ocr_store_max_size=ocr_store_max_gb * 1e9 if ocr_store_max_gb is not None else None,
+        **kwargs,
+    )
+
+    httpd, address = create_http_server(ocr_server, host=host, port=port, unix_socket=unix_socket)
+    logger.info(f"Serving on {address}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        if unix_socket is not None:
+            Path(unix_socket).expanduser().unlink(missing_ok=True)
+        logger.info("Finishing queued jobs")
+        ocr_server.stop()
+
+
+if __name__ == "__main__":
+    fire.Fire(serve)
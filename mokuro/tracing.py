@@ -0,0 +1,172 @@
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+from loguru import logger
+
+# the active tracer, None when tracing is disabled
+_tracer = None
+
+# spans kept in memory by each process; older ones are dropped, so that a long-running process (e.g. --watch)
+# doesn't run out of memory, roughly 100 bytes per span
+MAX_EVENTS = 200_000
+
+
+class Tracer:
+    """Records timing spans, saved in Chrome trace event format, which can be opened in Perfetto
+    (https://ui.perfetto.dev) or chrome://tracing. Only the last max_events spans are kept.
+    """
+
+    def __init__(self, path=None, run_id=None, max_events=MAX_EVENTS):
+        # None for a tracer which only records spans in memory, see record_spans
+        self.path = Path(path) if path is not None else None
+        # worker processes save their events to part files named with the id of the run, so that leftovers of
+        # interrupted runs are never merged
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.events = deque(maxlen=max_events)
+        self.num_dropped = 0
+        # thread names are kept separately, so that they are never dropped
+        self._thread_events = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, args):
+        start = time.perf_counter_ns()
+        try:
+            yield args
+        except BaseException as e:
+            args["error"] = repr(e)
+            raise
+        finally:
+            end = time.perf_counter_ns()
+            thread = threading.current_thread()
+            event = {
+                "name": name,
+                "ph": "X",
+                "ts": start / 1000,
+                "dur": (end - start) / 1000,
+                "pid": os.getpid(),
+                "tid": thread.native_id,
+                "args": args,
+            }
+            with self._lock:
+                if thread.native_id not in self._thread_events:
+                    self._thread_events[thread.native_id] = _thread_name_event(thread)
+                if len(self.events) == self.events.maxlen:
+                    self.num_dropped += 1
+                self.events.append(event)
+
+    def get_events(self):
+        """Recorded events, with thread names."""
+        with self._lock:
+            return [*self._thread_events.values(), *self.events]
+
+    def save_part(self):
+        """Save the events of this process next to the trace file, to be merged by the main process."""
+        _dump_events(self.get_events(), self.path.with_name(f"{self.path.name}.{self.run_id}.{os.getpid()}.part"))
+
+    def save(self):
+        """Save the trace, with the events of worker processes merged in."""
+        if self.num_dropped:
+            logger.warning(f"Dropped {self.num_dropped} oldest trace events, over the limit of {self.events.maxlen}")
+
+        events = self.get_events()
+        for part_path in self.path.parent.glob(f"{self.path.name}.{self.run_id}.*.part"):
+            try:
+                with open(part_path, encoding="utf-8") as f:
+                    events.extend(json.load(f))
+                os.remove(part_path)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning(f"Failed to merge trace of a worker process {part_path}: {e}")
+
+        _dump_events({"traceEvents": events, "displayTimeUnit": "ms"}, self.path)
+        logger.info(f"Saved trace with {len(events)} events to {self.path}")
+
+
+def start_tracing(path, run_id=None):
+    """Start recording spans, to be saved to path by stop_tracing. Worker processes start tracing with the
+    run_id of the main process (see get_run_id).
+    """
+    global _tracer
+    _tracer = Tracer(path, run_id)
+    _tracer.path.parent.mkdir(parents=True, exist_ok=True)
+
+
+@contextmanager
+def record_spans():
+    """Record spans in memory, e.g. to measure the time of processing stages, while in this context. Yields the
+    Tracer, with the recorded spans in its events. Tracing started with start_tracing is paused meanwhile.
+    """
+    global _tracer
+    tracer, _tracer = _tracer, Tracer()
+    try:
+        yield _tracer
+    finally:
+        _tracer = tracer
+
+
+def stop_tracing():
+    """Stop recording and save the trace."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None:
+        tracer.save()
+
+
+def save_worker_trace():
+    """Save the events recorded in a worker process, to be merged into the trace by the main process."""
+    if _tracer is not None:
+        _tracer.save_part()
+
+
+def get_trace_path():
+    """Path of the trace being recorded, or None if tracing is disabled."""
+    return _tracer.path if _tracer is not None else None
+
+
+def get_run_id():
+    """Id of the run being traced, or None if tracing is disabled."""
+    return _tracer.run_id if _tracer is not None else None
+
+
+def span(name, **args):
+    """Context manager which records a span with the given attributes, and yields the attributes dict, which can
+    be updated inside the span. Costs only a function call when tracing is disabled.
+    """
+    if _tracer is None:
+        return nullcontext(args)
+    return _tracer.span(name, args)
+
+
+def traced(name, func):
+    """Wrap a function, so that each call is recorded as a span."""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _tracer is None:
+            return func(*args, **kwargs)
+        with _tracer.span(name, {}):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def _thread_name_event(thread):
+    return {
+        "name": "thread_name",
+        "ph": "M",
+        "pid": os.getpid(),
+        "tid": thread.native_id,
+        "args": {"name": thread.name},
+    }
+
+
+def _dump_events(obj, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, default=str)
@@ -1,9 +1,13 @@
+import io
 import json
+import os
 import shutil
+import threading
 import zipfile
+from collections import OrderedDict
 from pathlib import Path
+from typing import NamedTuple
 
-import cv2
 import numpy as np
 from PIL import Image, UnidentifiedImageError
 
@@ -32,13 +36,253 @@ def dump_json(obj, path):
         json.dump(obj, f, ensure_ascii=False, cls=NumpyEncoder)
 
 
+def load_json_header(path, stop_key, chunk_size=65536):
+    """Load the top-level items of a JSON object, up to stop_key, without parsing the rest of the file.
+
+    Used to read the metadata from a .mokuro file without parsing all of its pages, which come last.
+    The file is read in chunks, until the header can be parsed.
+    """
+    decoder = json.JSONDecoder()
+    text = ""
+    with open(path, encoding="utf-8") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            text += chunk
+            try:
+                return _parse_json_header(decoder, text, stop_key)
+            except IndexError as e:
+                # the header is incomplete, unless there's nothing left to read
+                if not chunk:
+                    raise json.JSONDecodeError("Unexpected end of data", text, len(text)) from e
+            except json.JSONDecodeError:
+                if not chunk:
+                    raise
+
+
+def _parse_json_header(decoder, text, stop_key):
+    def skip_whitespace(idx):
+        while text[idx] in " \t\n\r":
+            idx += 1
+        return idx
+
+    def expect(idx, char):
+        idx = skip_whitespace(idx)
+        if text[idx] != char:
+            raise json.JSONDecodeError(f"Expecting '{char}'", text, idx)
+        return idx + 1
+
+    header = {}
+    idx = expect(0, "{")
+    while True:
+        idx = skip_whitespace(idx)
+        if text[idx] == "}":
+            return header
+
+        key, idx = decoder.raw_decode(text, idx)
+        idx = expect(idx, ":")
+        if key == stop_key:
+            return header
+
+        header[key], idx = decoder.raw_decode(text, skip_whitespace(idx))
+
+        # the next character is checked even after the last item, so a number cut off by the end of a chunk
+        # is never taken as complete
+        idx = skip_whitespace(idx)
+        if text[idx] == ",":
+            idx += 1
+        elif text[idx] != "}":
+            raise json.JSONDecodeError("Expecting ',' delimiter", text, idx)
+
+
+def get_file_signature(path):
+    """(size, mtime) of a file, used to detect whether it was modified."""
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class ArchiveMember(NamedTuple):
+    """A file inside a zip/cbz archive, which can be read without extracting the archive."""
+
+    archive: Path
+    name: str
+
+    def open(self):
+        return open_archive(self.archive).open(self.name)
+
+    def __str__(self):
+        return f"{self.archive}:{self.name}"
+
+
+# number of archives kept open by open_archive
+MAX_OPEN_ARCHIVES = 8
+
+# path -> (file signature, ZipFile), least recently used first
+_open_archives = OrderedDict()
+_open_archives_lock = threading.Lock()
+
+
+def open_archive(path):
+    """Open a zip archive for reading. Open archives are cached, so the central directory is read only once.
+
+    The cache is keyed by the file signature too, so an archive replaced at the same path is opened again.
+    Archives dropped from the cache are closed once no reader uses them anymore.
+    """
+    path = Path(path)
+    signature = get_file_signature(path)
+    with _open_archives_lock:
+        entry = _open_archives.pop(path, None)
+        if entry is None or entry[0] != signature:
+            entry = signature, zipfile.ZipFile(path, "r")
+        _open_archives[path] = entry
+        while len(_open_archives) > MAX_OPEN_ARCHIVES:
+            _open_archives.popitem(last=False)
+        return entry[1]
+
+
+def close_archives():
+    """Close all archives opened by open_archive."""
+    with _open_archives_lock:
+        for _, zf in _open_archives.values():
+            zf.close()
+        _open_archives.clear()
+
+
+def get_file_size(path):
+    """Size in bytes of a file, or of an uncompressed ArchiveMember."""
+    if isinstance(path, ArchiveMember):
+        return open_archive(path.archive).getinfo(path.name).file_size
+    return Path(path).stat().st_size
+
+
+def read_bytes(path):
+    """Read the whole content of a file or an ArchiveMember."""
+    if isinstance(path, ArchiveMember):
+        with path.open() as f:
+            return f.read()
+    return Path(path).read_bytes()
+
+
 def imread(path):
-    """Read an image as a BGR array. Animated images decode to their first frame."""
+    """Read an image as a BGR array. Animated images decode to their first frame.
+
+    path can be a path to an image file, or an ArchiveMember.
+    """
+    return imdecode(read_bytes(path), path)
+
+
+def imdecode(data, path="<bytes>"):
+    """Decode an image file content as a BGR array. path is used only in error messages.
+
+    The decoder is picked by the format of the data, see IMAGE_DECODERS; other formats (WebP, AVIF, animated
+    images...) and anything the fast decoder rejects are decoded with PIL.
+    """
+    decoder = IMAGE_DECODERS.get(get_image_format(data))
+    if decoder is not None:
+        img = decoder(data)
+        if img is not None:
+            return img
+
+    return imdecode_pil(data, path)
+
+
+def imdecode_pil(data, path="<bytes>"):
+    """Decode an image with PIL, raising InvalidImage if it's corrupted or unsupported."""
+    import cv2
+
     try:
-        with Image.open(path) as img:
+        with Image.open(io.BytesIO(data)) as img:
             return cv2.cvtColor(np.array(img.convert("RGB")), cv2.COLOR_RGB2BGR)
-    except (FileNotFoundError, IsADirectoryError, PermissionError):
-        raise  # not a decoding problem
+    except (UnidentifiedImageError, OSError, ValueError) as e:
+        raise InvalidImage(f"{path}: {e}") from e
+
+
+def imdecode_cv2(data):
+    """Decode an image with OpenCV straight to a BGR array, without intermediate copies. Returns None if it fails.
+
+    EXIF orientation is ignored, the same as with PIL.
+    """
+    import cv2
+
+    buf = np.frombuffer(data, dtype=np.uint8)
+    return cv2.imdecode(buf, cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+
+
+# number of bytes at the end of a JPEG file, in which its end marker is looked for
+JPEG_TAIL_SIZE = 4096
+
+
+def get_image_format(data):
+    """Format of an image file content, for formats with a dedicated decoder, otherwise None."""
+    # OpenCV decodes truncated JPEGs without an error, so those (without an end marker, possibly followed by zero
+    # padding in the last bytes) are left to PIL, which rejects them
+    if data[:3] == b"\xff\xd8\xff" and data[-JPEG_TAIL_SIZE:].rstrip(b"\x00").endswith(b"\xff\xd9"):
+        return "jpeg"
+    # animated PNGs (with an acTL chunk before the image data) are left to PIL
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and b"acTL" not in data[: data.find(b"IDAT")]:
+        return "png"
+    return None
+
+
+# format -> decoder(data) -> BGR array, or None if it can't decode the data
+IMAGE_DECODERS = {
+    "jpeg": imdecode_cv2,
+    "png": imdecode_cv2,
+}
+
+
+class PageImage:
+    """A page decoded at reduced resolution for text detection; full resolution is decoded only when needed for OCR.
+
+    JPEG images are decoded at the reduced resolution directly, with DCT-domain scaling (PIL draft), to the smallest
+    size which still fits detection_size at full detail. The full resolution image is decoded in grayscale, which is
+    all OCR needs. Other formats are decoded once at full resolution, which is used for both.
+    """
+
+    def __init__(self, data, detection_size, path="<bytes>"):
+        import cv2
+
+        self.data = data
+        self.path = path
+
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                self.width, self.height = img.size
+                r = min(detection_size / self.width, detection_size / self.height, 1)
+                img.draft("RGB", (max(1, round(self.width * r)), max(1, round(self.height * r))))
+                self.reduced = cv2.cvtColor(np.array(img.convert("RGB")), cv2.COLOR_RGB2BGR)
+        except (UnidentifiedImageError, OSError, ValueError) as e:
+            raise InvalidImage(f"{path}: {e}") from e
+
+        # full resolution coordinates = reduced resolution coordinates * scale
+        self.scale = self.width / self.reduced.shape[1]
+        self._full = self.reduced if self.reduced.shape[1] == self.width else None
+
+    @property
+    def full(self):
+        """Full resolution image, grayscale if it had to be decoded separately."""
+        if self._full is None:
+            try:
+                with Image.open(io.BytesIO(self.data)) as img:
+                    # JPEG decoder outputs grayscale directly, without color conversion
+                    img.draft("L", img.size)
+                    self._full = np.array(img.convert("L"))
+            except (UnidentifiedImageError, OSError, ValueError) as e:
+                raise InvalidImage(f"{self.path}: {e}") from e
+        return self._full
+
+
+class ImageSize(NamedTuple):
+    """Size of a page which isn't decoded, when OCR is disabled."""
+
+    width: int
+    height: int
+
+
+def read_image_size(data, path="<bytes>"):
+    """Read the size of an image from its header, without decoding it."""
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            return ImageSize(*img.size)
     except (UnidentifiedImageError, OSError, ValueError) as e:
         raise InvalidImage(f"{path}: {e}") from e
 
@@ -50,6 +294,28 @@ def get_path_format(path: Path):
         return path.suffix.lower()
 
 
+def get_archive_img_members(path_src: Path, img_suffixes, correct_duplicated_root=True):
+    """List images inside a zip archive.
+
+    Returns a dict {path relative to the volume root: member name}. Relative paths are the same as they would be
+    after extracting the archive with `unzip`.
+    """
+    infos = open_archive(path_src).infolist()
+
+    prefix = ""
+    if correct_duplicated_root:
+        # same as in unzip: if the archive contains only one directory with the same name as the archive, skip it
+        archive_root = path_src.stem + "/"
+        if len(infos) > 0 and all(info.filename.startswith(archive_root) for info in infos):
+            prefix = archive_root
+
+    return {
+        Path(info.filename[len(prefix) :]): info.filename
+        for info in infos
+        if not info.is_dir() and Path(info.filename).suffix.lower() in img_suffixes
+    }
+
+
 def unzip(path_src: Path, path_dst: Path, correct_duplicated_root=True):
     with zipfile.ZipFile(path_src, "r") as zip_ref:
         zip_ref.extractall(path_dst)
@@ -1,10 +1,26 @@
+import os
 import uuid
 from enum import Enum, auto
+from pathlib import Path
+from typing import NamedTuple
 
 from loguru import logger
 from natsort import natsorted
 
-from mokuro.utils import get_path_format, load_json, dump_json, unzip
+from mokuro.catalog import TitleCatalog, read_mokuro_header
+from mokuro.manifest import VolumeManifest
+from mokuro.page_cache import find_page_caches, open_page_cache
+from mokuro.utils import (
+    ArchiveMember,
+    dump_json,
+    get_archive_img_members,
+    get_path_format,
+    load_json,
+    open_archive,
+    unzip,
+)
+
+IMG_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp", ".avif")
 
 
 class VolumeStatus(Enum):
@@ -24,8 +40,16 @@ class Title:
     def __init__(self, path):
         self.path = path
         self._uuid = None
+        self._catalog = None
         self.name = path.name
 
+    @property
+    def catalog(self):
+        """Metadata of the title's .mokuro files, see mokuro.catalog."""
+        if self._catalog is None:
+            self._catalog = TitleCatalog.load(self.path / "_ocr" / "catalog.json")
+        return self._catalog
+
     @property
     def uuid(self):
         if self._uuid is None:
@@ -34,12 +58,14 @@ class Title:
         return self._uuid
 
     def set_uuid(self, update_existing=True):
-        existing_title_uuids = set()
+        paths_mokuro = sorted(self.path.glob("*.mokuro"))
+        catalog_entries = {path_mokuro: self.catalog.get(path_mokuro) for path_mokuro in paths_mokuro}
+        self.catalog.prune(paths_mokuro)
 
-        for path_mokuro in self.path.glob("*.mokuro"):
-            mokuro_data = load_json(path_mokuro)
+        existing_title_uuids = set()
 
-            title_uuid = mokuro_data.get("title_uuid")
+        for entry in catalog_entries.values():
+            title_uuid = entry["title_uuid"]
             if title_uuid is not None:
                 existing_title_uuids.add(title_uuid)
 
@@ -52,42 +78,73 @@ class Title:
             self._uuid = str(uuid.uuid4())
 
         if update_existing:
-            for path_mokuro in self.path.glob("*.mokuro"):
-                mokuro_data = load_json(path_mokuro)
-
-                if mokuro_data.get("title_uuid") != self._uuid:
+            for path_mokuro, entry in catalog_entries.items():
+                if entry["title_uuid"] != self._uuid:
+                    mokuro_data = load_json(path_mokuro)
                     mokuro_data["title_uuid"] = self._uuid
                     dump_json(mokuro_data, path_mokuro)
+                    self.catalog.update(path_mokuro, mokuro_data, num_pages=len(mokuro_data.get("pages", [])))
+
+        self.catalog.save()
+
+
+class VolumeInventory(NamedTuple):
+    path_in: Path
+    # page key (image path relative to the volume, without suffix) -> image path relative to the volume
+    img_paths: dict
+    # image path relative to the volume -> os.DirEntry of the image file, or name of the archive member
+    sources: dict
 
 
 class Volume:
     format_preference_order = ["", ".cbz", ".zip"]
 
-    def __init__(self, path_in):
+    def __init__(self, path_in, page_cache_backend="dir"):
         self.paths_in = {path_in}
+        self.page_cache_backend = page_cache_backend
+        self._page_cache = None
+        self._manifest = None
         self.path_mokuro = get_path_mokuro(path_in)
 
         if self.path_mokuro.is_file():
-            self.mokuro_data = load_json(self.path_mokuro)
-            self.uuid = self.mokuro_data.get("volume_uuid")
+            self.mokuro_header = read_mokuro_header(self.path_mokuro)
+            self.uuid = self.mokuro_header.get("volume_uuid")
         else:
-            self.mokuro_data = None
+            self.mokuro_header = None
             self.uuid = str(uuid.uuid4())
 
         self.title = None
         self.name = self.path_mokuro.stem
+        self._inventory = None
 
-        if self.path_mokuro.is_file():
-            self.status = VolumeStatus.PROCESSED
-        elif self.path_ocr_cache.is_dir():
+        if not self.path_mokuro.is_file():
+            if find_page_caches(self.path_ocr_cache):
+                self.status = VolumeStatus.PARTIALLY_PROCESSED
+            else:
+                self.status = VolumeStatus.UNPROCESSED
+        elif self.mokuro_header.get("partial", False):
+            # processing was interrupted while the .mokuro file was being written
+            self.status = VolumeStatus.PARTIALLY_PROCESSED
+        elif self.path_manifest.is_file() and not self.manifest.is_mokuro_file_current(self.path_mokuro):
+            # some pages were processed again after the .mokuro file was generated
             self.status = VolumeStatus.PARTIALLY_PROCESSED
         else:
-            self.status = VolumeStatus.UNPROCESSED
+            self.status = VolumeStatus.PROCESSED
+
+    def load_mokuro_data(self):
+        """Full content of the volume's .mokuro file, or None if there's none."""
+        if not self.path_mokuro.is_file():
+            return None
+        return load_json(self.path_mokuro)
 
     @property
     def path_in(self):
         return min(self.paths_in, key=lambda path: Volume.format_preference_order.index(get_path_format(path)))
 
+    @property
+    def is_archive(self):
+        return self.path_in.is_file() and self.path_in.suffix.lower() in {".zip", ".cbz"}
+
     @property
     def path_ocr_cache(self):
         return self.path_mokuro.parent / "_ocr" / self.path_mokuro.stem
@@ -96,20 +153,63 @@ class Volume:
     def path_title(self):
         return self.path_mokuro.parent
 
-    def get_json_paths(self):
-        json_paths = natsorted(p.relative_to(self.path_ocr_cache) for p in self.path_ocr_cache.glob("**/*.json"))
-        json_paths = {p.with_suffix(""): p for p in json_paths}
-        return json_paths
+    @property
+    def path_manifest(self):
+        return self.path_ocr_cache.with_name(self.path_ocr_cache.name + ".manifest.json")
+
+    @property
+    def manifest(self):
+        """Which pages were already processed and from which source images, see mokuro.manifest."""
+        if self._manifest is None:
+            self._manifest = VolumeManifest.load(self.path_manifest)
+        return self._manifest
+
+    @property
+    def page_cache(self):
+        """Cached OCR results of the volume's pages, see mokuro.page_cache."""
+        if self._page_cache is None:
+            self._page_cache = open_page_cache(self.path_ocr_cache, self.page_cache_backend)
+        return self._page_cache
+
+    @property
+    def inventory(self):
+        """Snapshot of the volume's page images, listed once and reused by all processing stages."""
+        if self._inventory is None or self._inventory.path_in != self.path_in:
+            if self.is_archive:
+                sources = get_archive_img_members(self.path_in, IMG_SUFFIXES)
+            else:
+                assert self.path_in.is_dir()
+                sources = scan_img_files(self.path_in)
+            img_paths = {p.with_suffix(""): p for p in natsorted(sources)}
+            self._inventory = VolumeInventory(self.path_in, img_paths, sources)
+        return self._inventory
 
     def get_img_paths(self):
-        assert self.path_in.is_dir()
-        img_paths = natsorted(
-            p.relative_to(self.path_in)
-            for p in self.path_in.glob("**/*")
-            if p.is_file() and p.suffix.lower() in (".jpg", ".jpeg", ".png", ".webp", ".avif")
-        )
-        img_paths = {p.with_suffix(""): p for p in img_paths}
-        return img_paths
+        return dict(self.inventory.img_paths)
+
+    def get_img_source(self, img_path_rel):
+        """Path to a page image, or an ArchiveMember if the volume is read directly from a zip/cbz archive."""
+        if self.is_archive:
+            return ArchiveMember(self.path_in, self.inventory.sources[img_path_rel])
+
+        return self.path_in / img_path_rel
+
+    def get_img_signatures(self, img_paths):
+        """Cheap signatures of page images, used to detect changes: ("file", size, mtime) for image files,
+        ("zip", size, CRC) for archive members, which doesn't require reading anything but the archive index.
+
+        img_paths is a dict returned by get_img_paths, the result is a dict with the same keys.
+        """
+        sources = self.inventory.sources
+        signatures = {}
+        for key, img_path_rel in img_paths.items():
+            if self.is_archive:
+                info = open_archive(self.path_in).getinfo(sources[img_path_rel])
+                signatures[key] = ("zip", info.file_size, info.CRC)
+            else:
+                stat = sources[img_path_rel].stat()
+                signatures[key] = ("file", stat.st_size, stat.st_mtime_ns)
+        return signatures
 
     def unzip(self, tmp_dir=None):
         if self.path_in.is_file() and self.path_in.suffix.lower() in {".zip", ".cbz"}:
@@ -128,7 +228,8 @@ class Volume:
 
 
 class VolumeCollection:
-    def __init__(self):
+    def __init__(self, page_cache_backend="dir"):
+        self.page_cache_backend = page_cache_backend
         self.volumes = {}
         self.titles = {}
 
@@ -144,7 +245,7 @@ class VolumeCollection:
             volume = self.volumes[path_mokuro]
             volume.paths_in.add(path_in)
         else:
-            volume = self.volumes[path_mokuro] = Volume(path_in)
+            volume = self.volumes[path_mokuro] = Volume(path_in, page_cache_backend=self.page_cache_backend)
 
         if volume.path_title in self.titles:
             title = self.titles[volume.path_title]
@@ -154,6 +255,23 @@ class VolumeCollection:
         volume.title = title
 
 
+def scan_img_files(path):
+    """Recursively find image files with os.scandir, which gets file types from the directory listing without
+    separate stat calls. Returns a dict: image path relative to `path` -> os.DirEntry.
+    """
+    img_files = {}
+    dirs = [(Path(path), Path())]
+    while dirs:
+        dir_path, dir_path_rel = dirs.pop()
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    dirs.append((Path(entry.path), dir_path_rel / entry.name))
+                elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMG_SUFFIXES:
+                    img_files[dir_path_rel / entry.name] = entry
+    return img_files
+
+
 def get_path_mokuro(path_in):
     if path_in.is_dir():
         return path_in.parent / (path_in.name + ".mokuro")
@@ -0,0 +1,338 @@
+import contextlib
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+import zipfile
+from pathlib import Path
+
+from loguru import logger
+
+from mokuro.library_scan import ARCHIVE_SUFFIXES, scan_parent_dir
+from mokuro.volume import IMG_SUFFIXES, scan_img_files
+
+WATCH_BACKENDS = ("auto", "inotify", "poll")
+
+# inotify event flags, from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+# file writes are not watched; a file being copied is picked up on create, and its size is then checked by
+# the debouncer until it stops changing
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+# how often pending volumes are checked, in seconds
+CHECK_INTERVAL = 1.0
+
+
+def watch_library(
+    parent_dirs,
+    process,
+    recursive=False,
+    backend="auto",
+    debounce=30,
+    poll_interval=60,
+    cache_path=None,
+    stop=None,
+    on_start=None,
+    is_ignored=None,
+):
+    """Watch library directories and process volumes which are added or changed, until stop (threading.Event)
+    is set, or forever.
+
+    Changes are found with inotify on Linux, or by scanning parent_dirs every poll_interval seconds otherwise
+    (see scan_parent_dir; only volumes whose directory or archive mtime changed are reported). A changed volume
+    is processed once its contents didn't change for `debounce` seconds and, for archives, once it's a complete
+    zip file, so that volumes which are still being copied are not processed. process(volume_paths) is called
+    with a list of volumes which are ready, in the calling thread.
+
+    on_start() is called once the watcher is running, before any changes are processed, e.g. to process the
+    existing volumes; volumes changed meanwhile are processed afterwards. Volumes for which is_ignored(path) is true
+    (e.g. created by processing, like archives extracted next to themselves) are not processed.
+    """
+    parent_dirs = [Path(parent_dir) for parent_dir in parent_dirs]
+    stop = stop or threading.Event()
+    watcher = create_watcher(
+        parent_dirs, recursive=recursive, backend=backend, poll_interval=poll_interval, cache_path=cache_path
+    )
+    debouncer = Debouncer(debounce)
+
+    try:
+        if on_start is not None:
+            on_start()
+        logger.info(f"Watching {', '.join(map(str, parent_dirs))} for new volumes")
+
+        while not stop.is_set():
+            for parent_dir, path in watcher.get_changes():
+                for volume_path in find_volumes(path, parent_dir, recursive=recursive):
+                    if is_ignored is None or not is_ignored(volume_path):
+                        debouncer.touch(volume_path)
+
+            ready = debouncer.pop_ready()
+            if ready:
+                logger.info(f"Found {len(ready)} new or changed volumes")
+                process(ready)
+
+            stop.wait(CHECK_INTERVAL)
+    finally:
+        watcher.stop()
+
+
+def create_watcher(parent_dirs, recursive=False, backend="auto", poll_interval=60, cache_path=None):
+    if backend not in WATCH_BACKENDS:
+        raise ValueError(f"Unknown watch backend {backend}, expected one of: {', '.join(WATCH_BACKENDS)}")
+
+    if backend != "poll":
+        try:
+            return InotifyWatcher(parent_dirs)
+        except OSError as e:
+            if backend == "inotify":
+                raise
+            logger.warning(f"inotify is not available ({e}), falling back to polling every {poll_interval}s")
+
+    return PollingWatcher(parent_dirs, recursive=recursive, poll_interval=poll_interval, cache_path=cache_path)
+
+
+def find_volumes(path, parent_dir, recursive=False):
+    """Volumes affected by a change of path inside parent_dir, with the same rules as scan_parent_dir.
+    Changes of mokuro's own output (_ocr directories, .mokuro and .html files) and of hidden files are ignored.
+    """
+    rel_parts = path.relative_to(parent_dir).parts
+    if not rel_parts:
+        return scan_parent_dir(parent_dir, recursive=recursive)
+    if "_ocr" in rel_parts or any(part.startswith(".") for part in rel_parts):
+        return []
+
+    if not recursive:
+        top = parent_dir / rel_parts[0]
+        if top.is_dir() or (len(rel_parts) == 1 and top.suffix.lower() in ARCHIVE_SUFFIXES):
+            return [top]
+        return []
+
+    suffix = path.suffix.lower()
+    if suffix in ARCHIVE_SUFFIXES:
+        return [path]
+    if suffix in IMG_SUFFIXES:
+        return [path.parent]
+    if path.is_dir():
+        volumes = scan_parent_dir(path, recursive=True)
+        if any(p.suffix.lower() in IMG_SUFFIXES and p.is_file() for p in path.iterdir()):
+            volumes.append(path)
+        return volumes
+    return []
+
+
+def get_volume_signature(path):
+    """Summary of a volume's files, which changes while they are being copied. Returns None for a volume
+    which doesn't exist or has no images, and (size, mtime, complete) for archives.
+    """
+    try:
+        if path.is_dir():
+            img_files = scan_img_files(path)
+            if not img_files:
+                return None
+            return tuple(
+                sorted((str(rel), entry.stat().st_size, entry.stat().st_mtime_ns) for rel, entry in img_files.items())
+            )
+
+        stat = path.stat()
+        return stat.st_size, stat.st_mtime_ns, zipfile.is_zipfile(path)
+    except OSError:
+        return None
+
+
+class Debouncer:
+    """Volumes waiting until their files stop changing."""
+
+    def __init__(self, debounce=30):
+        self.debounce = debounce
+        # volume path -> (signature, time of the last change)
+        self.pending = {}
+
+    def touch(self, path):
+        signature = self.pending[path][0] if path in self.pending else None
+        self.pending[path] = signature, time.monotonic()
+
+    def pop_ready(self):
+        """Return volumes which didn't change for debounce seconds; forget volumes which were removed."""
+        now = time.monotonic()
+        ready = []
+        for path, (signature, last_change) in list(self.pending.items()):
+            new_signature = get_volume_signature(path)
+            if new_signature is None:
+                del self.pending[path]
+            elif new_signature != signature:
+                self.pending[path] = new_signature, now
+            elif now - last_change >= self.debounce and (path.is_dir() or signature[2]):
+                ready.append(path)
+                del self.pending[path]
+        return sorted(ready)
+
+
+class InotifyWatcher:
+    """Watches all directories in parent_dirs with inotify, in a background thread. Raises OSError if inotify
+    is not available, or if the limit of watches (fs.inotify.max_user_watches) is too low for the library.
+    """
+
+    def __init__(self, parent_dirs):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is available only on Linux")
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("libc has no inotify support")
+
+        self._libc = libc
+        self._fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self._fd < 0:
+            raise _errno_error()
+
+        # watch descriptor -> (parent_dir, watched directory)
+        self._watches = {}
+        self._changes = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.parent_dirs = list(parent_dirs)
+        try:
+            for parent_dir in self.parent_dirs:
+                self._add_tree(parent_dir, parent_dir)
+        except OSError:
+            os.close(self._fd)
+            raise
+
+        logger.info(f"Watching {len(self._watches)} directories with inotify")
+        self._thread = threading.Thread(target=self._read_events, name="inotify", daemon=True)
+        self._thread.start()
+
+    def get_changes(self):
+        """Return (parent_dir, path) of paths which changed since the last call."""
+        with self._lock:
+            changes, self._changes = self._changes, set()
+        return changes
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        os.close(self._fd)
+
+    def _add_tree(self, parent_dir, path):
+        self._add_watch(parent_dir, path)
+        for dir_path, dir_names, _file_names in os.walk(path):
+            dir_names[:] = [name for name in dir_names if name != "_ocr" and not name.startswith(".")]
+            for name in dir_names:
+                self._add_watch(parent_dir, Path(dir_path) / name)
+
+    def _add_watch(self, parent_dir, path):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            raise _errno_error(path)
+        # a directory moved within the library keeps its watch descriptor
+        self._watches[wd] = parent_dir, path
+
+    def _read_events(self):
+        while not self._stop.is_set():
+            readable, _, _ = select.select([self._fd], [], [], 0.5)
+            if not readable:
+                continue
+
+            data = os.read(self._fd, 64 * 1024)
+            changes = set()
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + _EVENT_HEADER.size : offset + _EVENT_HEADER.size + length].rstrip(b"\0")
+                offset += _EVENT_HEADER.size + length
+
+                if mask & IN_Q_OVERFLOW:
+                    logger.warning("inotify event queue overflowed, rescanning the library")
+                    changes.update((parent_dir, parent_dir) for parent_dir in self.parent_dirs)
+                    continue
+                if mask & IN_IGNORED:
+                    self._watches.pop(wd, None)
+                    continue
+                if wd not in self._watches:
+                    continue
+
+                parent_dir, dir_path = self._watches[wd]
+                path = dir_path / os.fsdecode(name) if name else dir_path
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    try:
+                        self._add_tree(parent_dir, path)
+                    except OSError as e:
+                        logger.warning(f"Failed to watch {path}: {e}")
+                changes.add((parent_dir, path))
+
+            with self._lock:
+                self._changes.update(changes)
+
+
+class PollingWatcher:
+    """Scans parent_dirs every poll_interval seconds in a background thread, and reports volumes which were added,
+    or whose directory or archive mtime changed. Scans use the scan cache, so that only changed directories are
+    listed again.
+    """
+
+    def __init__(self, parent_dirs, recursive=False, poll_interval=60, cache_path=None):
+        self.parent_dirs = list(parent_dirs)
+        self.recursive = recursive
+        self.poll_interval = poll_interval
+        self.cache_path = cache_path
+        self._changes = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._mtimes = self._scan()
+        self._thread = threading.Thread(target=self._poll, name="library-poll", daemon=True)
+        self._thread.start()
+
+    def get_changes(self):
+        """Return (parent_dir, path) of volumes which changed since the last call."""
+        with self._lock:
+            changes, self._changes = self._changes, set()
+        return changes
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _scan(self):
+        """Return (parent_dir, volume path) -> mtime of all volumes."""
+        mtimes = {}
+        for parent_dir in self.parent_dirs:
+            for volume_path in scan_parent_dir(parent_dir, recursive=self.recursive, cache_path=self.cache_path):
+                # volumes removed since the scan are skipped
+                with contextlib.suppress(OSError):
+                    mtimes[parent_dir, volume_path] = volume_path.stat().st_mtime_ns
+        return mtimes
+
+    def _poll(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                mtimes = self._scan()
+            except OSError as e:
+                logger.warning(f"Failed to scan the library: {e}")
+                continue
+
+            changed = {key for key, mtime in mtimes.items() if self._mtimes.get(key) != mtime}
+            self._mtimes = mtimes
+            with self._lock:
+                self._changes.update(changed)
+
+
+def _errno_error(path=None):
+    errno = ctypes.get_errno()
+    if path is None:
+        return OSError(errno, os.strerror(errno))
+    return OSError(errno, os.strerror(errno), str(path))
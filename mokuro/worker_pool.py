@@ -0,0 +1,59 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.util import Finalize
+
+from loguru import logger
+
+from mokuro import tracing
+
+_mpocr = None
+
+
+def create_worker_pool(num_workers, mpocr_kwargs, threads_per_worker=None):
+    """Start `num_workers` processes, each with its own MangaPageOcr and its own share of torch threads.
+
+    Pages are processed with `pool.submit(process_page, img_path)`, which returns (result, timings). Workers take
+    tasks in submission order, so submitting the longest jobs first gives longest-job-first load balancing.
+    """
+    if threads_per_worker is None:
+        threads_per_worker = max(1, (os.cpu_count() or 1) // num_workers)
+
+    logger.info(f"Starting {num_workers} workers, {threads_per_worker} threads each")
+
+    # spawn instead of fork, forking a process with initialized torch/CUDA state is not safe
+    return ProcessPoolExecutor(
+        max_workers=num_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(mpocr_kwargs, threads_per_worker, tracing.get_trace_path(), tracing.get_run_id()),
+    )
+
+
+def _init_worker(mpocr_kwargs, threads_per_worker, trace_path=None, trace_run_id=None):
+    global _mpocr
+
+    from mokuro.manga_page_ocr import MangaPageOcr
+
+    if not mpocr_kwargs.get("disable_ocr"):
+        # torch isn't imported when OCR is disabled
+        import torch
+
+        torch.set_num_threads(threads_per_worker)
+    if mpocr_kwargs.get("detector_threads") is None:
+        mpocr_kwargs = dict(mpocr_kwargs, detector_threads=threads_per_worker)
+    _mpocr = MangaPageOcr(**mpocr_kwargs)
+
+    # each worker has its own page filter and OCR memo stats, reported when the worker exits
+    Finalize(None, _mpocr.report, exitpriority=10)
+    Finalize(None, _mpocr.save, exitpriority=9)
+
+    if trace_path is not None:
+        # spans of each worker are saved when it exits, and merged into the trace by the main process
+        tracing.start_tracing(trace_path, trace_run_id)
+        Finalize(None, tracing.save_worker_trace, exitpriority=5)
+
+
+def process_page(img_path):
+    timings = {}
+    return _mpocr(img_path, timings=timings), timings
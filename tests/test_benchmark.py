@@ -0,0 +1,88 @@
+import time
+
+import numpy as np
+
+from mokuro.benchmark import STAGES, benchmark, compare_results, make_synthetic_page, run_benchmark
+from mokuro.tracing import span
+from mokuro.utils import imdecode, load_json
+
+
+class FakePageOcr:
+    """Records the same spans as MangaPageOcr, each taking 10 ms."""
+
+    reduced_decode = False
+
+    def detect(self, img, name=None):
+        with span("detect"):
+            time.sleep(0.01)
+            with span("refine"):
+                time.sleep(0.01)
+        return img.shape
+
+    def recognize_page(self, img, detection):
+        for name in ["crop_split", "recognize"]:
+            with span(name):
+                time.sleep(0.01)
+        return {"img_width": detection[1], "blocks": []}
+
+
+def test_synthetic_page():
+    data = make_synthetic_page(width=800, height=1200, seed=1)
+    img = imdecode(data)
+    assert img.shape == (1200, 800, 3)
+    assert data == make_synthetic_page(width=800, height=1200, seed=1)
+    assert data != make_synthetic_page(width=800, height=1200, seed=2)
+
+    # denser text covers more of the page
+    ink = [(imdecode(make_synthetic_page(text_density=density)) < 128).mean() for density in [0, 0.3]]
+    assert ink[0] < ink[1]
+    assert not np.array_equal(imdecode(make_synthetic_page(vertical_fraction=0)), imdecode(make_synthetic_page()))
+
+
+def test_compare_results():
+    baseline = {
+        "pages_per_sec": 2.0,
+        "stages_ms_per_page": dict.fromkeys(STAGES, 100.0),
+        "peak_rss_mb": 1000.0,
+    }
+    results = {
+        "pages_per_sec": 1.5,
+        "stages_ms_per_page": dict(baseline["stages_ms_per_page"], detect=50.0, recognize=150.0),
+        "peak_rss_mb": None,
+    }
+
+    comparison = {metric: (change, regressed) for metric, _, _, change, regressed in compare_results(results, baseline)}
+    assert comparison["pages_per_sec"] == (-0.25, True)
+    assert comparison["detect_ms_per_page"] == (-0.5, False)
+    assert comparison["recognize_ms_per_page"] == (0.5, True)
+    assert comparison["decode_ms_per_page"] == (0, False)
+    assert "peak_rss_mb" not in comparison
+
+
+def test_run_benchmark():
+    pages = [(f"page{i}", make_synthetic_page(width=400, height=600, seed=i)) for i in range(3)]
+    results = run_benchmark(pages, FakePageOcr())
+
+    assert results["num_pages"] == 3
+    stages = results["stages_ms_per_page"]
+    assert list(stages) == list(STAGES)
+    assert all(stages[stage] > 0 for stage in STAGES)
+    # refinement is not counted twice, and the warmup page is not counted
+    assert 10 <= stages["detect"] < 20
+    assert 10 <= stages["refine"] < 20
+
+
+def test_benchmark_disable_ocr(tmp_path, input_data_root):
+    output = tmp_path / "benchmark.json"
+    results = benchmark(
+        input_data_root / "test0" / "vol1",
+        num_synthetic_pages=2,
+        width=400,
+        height=600,
+        output=output,
+        disable_ocr=True,
+    )
+
+    assert results["num_pages"] == 8
+    assert results["config"]["mpocr_kwargs"] == {"disable_ocr": True}
+    assert load_json(output)["num_pages"] == 8
@@ -30,14 +30,15 @@ class TestCacheInit:
             instance = CacheClass()
         assert instance.root == tmp_path / "manga-ocr"
 
-    def test_root_dir_created_on_init(self, tmp_path):
+    def test_root_dir_not_created_on_init(self, tmp_path):
         subdir = tmp_path / "cache_dir"
         CacheClass = type(cache_module.cache)
         env = {k: v for k, v in os.environ.items() if k != "XDG_CACHE_HOME"}
         with patch.dict(os.environ, env, clear=True):
             with patch("pathlib.Path.home", return_value=subdir):
                 instance = CacheClass()
-        assert instance.root.is_dir()
+        assert not subdir.exists()
+        assert instance.root == subdir / ".cache" / "manga-ocr"
 
 
 class TestDownloadIfNeeded:
@@ -65,6 +66,20 @@ class TestDownloadIfNeeded:
         mock_get.assert_called_once_with("http://example.com/test.pt", stream=True, verify=True)
         assert file_path.read_bytes() == b"chunk1chunk2"
 
+    def test_download_creates_root_dir(self, tmp_path):
+        instance = _new_instance(tmp_path)
+        instance.root.rmdir()
+        file_path = instance.root / "test.pt"
+
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.iter_content.return_value = [b"chunk"]
+
+        with patch("mokuro.cache.requests.get", return_value=mock_response):
+            instance._download_if_needed(file_path, "http://example.com/test.pt")
+
+        assert file_path.read_bytes() == b"chunk"
+
     def test_raises_on_non_200_response(self, tmp_path):
         instance = _new_instance(tmp_path)
         file_path = instance.root / "test.pt"
@@ -0,0 +1,90 @@
+import json
+
+import pytest
+
+from mokuro.catalog import TitleCatalog, read_mokuro_header
+from mokuro.utils import dump_json, load_json_header
+from mokuro.volume import Title
+
+
+def _write_mokuro(path, title_uuid, num_pages=3, **kwargs):
+    data = {
+        "version": "0.2.5",
+        "title": "title",
+        "title_uuid": title_uuid,
+        "volume": path.stem,
+        "volume_uuid": f"{path.stem}-uuid",
+        **kwargs,
+        "pages": [{"img_path": f"{i}.jpg", "blocks": []} for i in range(num_pages)],
+    }
+    dump_json(data, path)
+    return data
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 65536])
+def test_load_json_header(tmp_path, chunk_size):
+    path = tmp_path / "vol1.mokuro"
+    data = _write_mokuro(path, "title-uuid", num_pages=100, count=12345, nested={"a": [1, "ąę"]})
+    del data["pages"]
+
+    assert load_json_header(path, stop_key="pages", chunk_size=chunk_size) == data
+
+
+def test_load_json_header_without_stop_key(tmp_path):
+    path = tmp_path / "data.json"
+    path.write_text(json.dumps({"a": 1, "b": 2.5}))
+    assert load_json_header(path, stop_key="pages", chunk_size=3) == {"a": 1, "b": 2.5}
+
+    path.write_text('{"a": 1, "b": ')
+    with pytest.raises(ValueError):
+        load_json_header(path, stop_key="pages", chunk_size=3)
+
+
+def test_read_mokuro_header_pages_first(tmp_path):
+    path_mokuro = tmp_path / "vol1.mokuro"
+    data = _write_mokuro(path_mokuro, "uuid-1")
+    path_mokuro.write_text(json.dumps(data, sort_keys=True))
+
+    header = read_mokuro_header(path_mokuro)
+    assert header["volume_uuid"] == "vol1-uuid"
+    assert header["title_uuid"] == "uuid-1"
+    assert "pages" not in header
+
+
+def test_catalog_refresh(tmp_path):
+    path_mokuro = tmp_path / "vol1.mokuro"
+    _write_mokuro(path_mokuro, "uuid-1", partial=True)
+
+    catalog = TitleCatalog(tmp_path / "_ocr" / "catalog.json")
+    catalog.update(path_mokuro, read_mokuro_header(path_mokuro), num_pages=3)
+    catalog.save()
+
+    catalog = TitleCatalog.load(catalog.path)
+    entry = catalog.get(path_mokuro)
+    assert entry["title_uuid"] == "uuid-1"
+    assert entry["num_pages"] == 3
+    assert entry["partial"] is True
+
+    _write_mokuro(path_mokuro, "uuid-2", num_pages=4)
+    entry = catalog.get(path_mokuro)
+    assert entry["title_uuid"] == "uuid-2"
+    assert entry["num_pages"] is None
+    assert entry["partial"] is False
+
+
+def test_title_uuid_from_catalog(tmp_path):
+    _write_mokuro(tmp_path / "vol1.mokuro", "uuid-1")
+    _write_mokuro(tmp_path / "vol2.mokuro", None)
+
+    title = Title(tmp_path)
+    title.set_uuid()
+    assert title.uuid == "uuid-1"
+
+    catalog = TitleCatalog.load(tmp_path / "_ocr" / "catalog.json")
+    assert set(catalog.volumes) == {"vol1.mokuro", "vol2.mokuro"}
+    assert catalog.get(tmp_path / "vol2.mokuro")["title_uuid"] == "uuid-1"
+    assert read_mokuro_header(tmp_path / "vol2.mokuro")["title_uuid"] == "uuid-1"
+
+    (tmp_path / "vol2.mokuro").unlink()
+    Title(tmp_path).set_uuid()
+    assert set(TitleCatalog.load(tmp_path / "_ocr" / "catalog.json").volumes) == {"vol1.mokuro"}
@@ -0,0 +1,70 @@
+import json
+
+from mokuro.events import EventEmitter, JsonlEventSink, ThroughputMeter, combine_callbacks
+
+
+def test_throughput_meter(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("mokuro.events.time.perf_counter", lambda: now[0])
+
+    meter = ThroughputMeter(window=2)
+    meter.add_pages(10)
+    assert meter.get_progress() == {"pages_done": 0, "pages_total": 10, "pages_per_sec": None, "eta_sec": None}
+
+    for dt in [1.0, 1.0, 0.5, 0.5]:
+        now[0] += dt
+        meter.page_done()
+
+    # rate over the last 2 pages only
+    progress = meter.get_progress()
+    assert progress["pages_done"] == 4
+    assert progress["pages_per_sec"] == 2.0
+    assert progress["eta_sec"] == 3.0
+
+
+def test_emitter():
+    events = []
+    emitter = EventEmitter(events.append)
+    emitter.volume_start("vol", num_pages=3, num_cached=1)
+    emitter.page_done("vol", "p1.jpg", ocr_store_hit=True)
+    emitter.page_done("vol", "p2.jpg", error=ValueError("bad page"), ocr_store_hit=False, timings={"detect": 0.1})
+    emitter.volume_finish("vol")
+
+    assert [event["event"] for event in events] == [
+        "volume_start",
+        "page_done",
+        "progress",
+        "page_done",
+        "progress",
+        "volume_finish",
+    ]
+    assert events[0]["num_to_process"] == 2
+    assert events[3]["error"] == "ValueError('bad page')"
+    assert events[3]["timings"] == {"detect": 0.1}
+    assert events[4]["pages_done"] == events[4]["pages_total"] == 2
+
+    finish = events[-1]
+    assert finish["error"] is None
+    assert (finish["num_processed"], finish["num_errors"], finish["num_cached"]) == (2, 1, 1)
+    assert (finish["ocr_store_hits"], finish["ocr_store_misses"]) == (1, 1)
+
+
+def test_callback_errors_are_ignored():
+    def callback(event):
+        raise RuntimeError
+
+    emitter = EventEmitter(callback)
+    emitter.volume_start("vol", num_pages=1, num_cached=0)
+    emitter.page_done("vol", "p1.jpg")
+
+
+def test_jsonl_sink(tmp_path):
+    path = tmp_path / "events" / "events.jsonl"
+    events = []
+    sink = JsonlEventSink(path)
+    emitter = EventEmitter(combine_callbacks(events.append, sink, None))
+    emitter.emit("run_start", num_volumes=1, path=tmp_path)
+
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line) for line in lines] == [{**events[0], "path": str(tmp_path)}]
+    assert combine_callbacks(None) is None
@@ -0,0 +1,48 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+# modules which should be imported only when OCR models are initialized
+HEAVY_MODULES = ["torch", "transformers", "manga_ocr", "comic_text_detector", "cv2", "scipy"]
+
+# generous, importing torch and transformers alone usually takes longer
+MAX_IMPORT_SEC = 5
+
+SCRIPT = """
+import json, sys, time
+
+start = time.perf_counter()
+from mokuro.run import run
+
+run(version=True)
+import_sec = time.perf_counter() - start
+
+# a volume is processed with OCR disabled
+run(sys.argv[1], disable_ocr=True, disable_confirmation=True, legacy_html=False)
+print(json.dumps({"import_sec": import_sec, "modules": sorted(sys.modules)}))
+"""
+
+
+def test_light_imports(tmp_path, input_data_root):
+    path_vol = tmp_path / "vol1"
+    shutil.copytree(input_data_root / "test0" / "vol1", path_vol)
+    env = {**os.environ, "XDG_CACHE_HOME": str(tmp_path / "cache")}
+    out = subprocess.run(
+        [sys.executable, "-c", SCRIPT, str(path_vol)],
+        env=env,
+        cwd=Path(__file__).parents[1],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.splitlines()
+    result = json.loads(out[-1])
+
+    loaded = {name.split(".")[0] for name in result["modules"]}
+    assert loaded.isdisjoint(HEAVY_MODULES)
+    assert result["import_sec"] < MAX_IMPORT_SEC
+    assert (tmp_path / "vol1.mokuro").is_file()
+    # the cache directory is created only when something is saved in it
+    assert not (tmp_path / "cache").exists()
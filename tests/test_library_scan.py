@@ -0,0 +1,62 @@
+import os
+from pathlib import Path
+
+from mokuro.library_scan import scan_parent_dir
+from mokuro.volume import scan_img_files
+
+
+def _touch(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch()
+
+
+def _setup_library(root):
+    _touch(root / "title1" / "vol1" / "001.jpg")
+    _touch(root / "title1" / "vol2" / "ch1" / "001.png")
+    _touch(root / "title1" / "vol3.cbz")
+    _touch(root / "title1" / "_ocr" / "vol1" / "001.json")
+    _touch(root / "title2" / "vol1.zip")
+    _touch(root / "title2" / "notes.txt")
+    (root / "empty").mkdir()
+
+
+def test_scan_parent_dir(tmp_path):
+    _setup_library(tmp_path)
+
+    assert scan_parent_dir(tmp_path / "title1") == [
+        tmp_path / "title1" / "vol1",
+        tmp_path / "title1" / "vol2",
+        tmp_path / "title1" / "vol3.cbz",
+    ]
+
+    assert scan_parent_dir(tmp_path, recursive=True) == [
+        tmp_path / "title1" / "vol1",
+        tmp_path / "title1" / "vol2" / "ch1",
+        tmp_path / "title1" / "vol3.cbz",
+        tmp_path / "title2" / "vol1.zip",
+    ]
+
+
+def test_scan_cache_revalidated_by_mtime(tmp_path):
+    library = tmp_path / "library"
+    cache_path = tmp_path / "cache" / "library_scan.json"
+    _setup_library(library)
+
+    volumes = scan_parent_dir(library, recursive=True, cache_path=cache_path)
+    assert cache_path.is_file()
+    assert scan_parent_dir(library, recursive=True, cache_path=cache_path) == volumes
+
+    # a new volume changes the mtime of its parent directory
+    _touch(library / "title2" / "vol2" / "001.jpg")
+    st = os.stat(library / "title2")
+    os.utime(library / "title2", ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+    assert scan_parent_dir(library, recursive=True, cache_path=cache_path) == [*volumes, library / "title2" / "vol2"]
+
+
+def test_scan_img_files(tmp_path):
+    _touch(tmp_path / "001.jpg")
+    _touch(tmp_path / "sub" / "002.WEBP")
+    _touch(tmp_path / "sub" / "notes.txt")
+
+    assert set(scan_img_files(tmp_path)) == {Path("001.jpg"), Path("sub/002.WEBP")}
@@ -0,0 +1,92 @@
+import cv2
+import numpy as np
+from comic_text_detector.utils.textblock import TextBlock
+from scipy.signal.windows import gaussian
+
+from mokuro.line_geometry import get_density_kernel, get_line_crops
+
+
+def _split_into_chunks(img, mask_refined, blk, line_idx, textheight, max_ratio, anchor_window):
+    """Reference implementation, one line at a time."""
+    line_crop = blk.get_transformed_region(img, line_idx, textheight)
+    h, w, *_ = line_crop.shape
+    ratio = w / h
+    if ratio <= max_ratio:
+        return [line_crop]
+
+    line_mask = blk.get_transformed_region(mask_refined, line_idx, textheight)
+    line_density = np.convolve(line_mask.sum(axis=0), gaussian(textheight * 2, textheight / 8), "same")
+    anchor_window *= textheight
+
+    cut_points = []
+    for anchor in np.linspace(0, w, int(np.ceil(ratio / max_ratio)) + 1)[1:-1]:
+        n0 = np.clip(int(anchor) - anchor_window // 2, 0, w)
+        n1 = np.clip(int(anchor) + anchor_window // 2, 0, w)
+        cut_points.append(n0 + line_density[n0:n1].argmin())
+
+    return np.split(line_crop, cut_points, axis=1)
+
+
+def _make_page(seed=0, num_blocks=20, size=(1600, 1100)):
+    rng = np.random.default_rng(seed)
+    img = cv2.GaussianBlur(rng.integers(0, 256, (*size, 3), dtype=np.uint8), (7, 7), 0)
+    mask = cv2.GaussianBlur((rng.random(size) > 0.7).astype(np.uint8) * 255, (15, 15), 0)
+
+    blk_list = []
+    for _ in range(num_blocks):
+        vertical = bool(rng.random() < 0.6)
+        x0, y0 = rng.integers(50, 800), rng.integers(50, 900)
+        lines = []
+        for i in range(rng.integers(1, 6)):
+            length, thickness = rng.integers(40, 650), 25 + rng.integers(-3, 4)
+            x, y, w, h = (x0 + i * 30, y0, thickness, length) if vertical else (x0, y0 + i * 30, length, thickness)
+            quad = np.array([[x, y], [x + w, y], [x + w, y + h], [x, y + h]]) + rng.integers(-3, 4, (4, 2))
+            lines.append(quad.tolist())
+        blk_list.append(
+            TextBlock(
+                [x0, y0, x0 + 100, y0 + 100],
+                lines=lines,
+                language=["ja", "unknown", "eng"][rng.integers(3)],
+                vertical=vertical,
+                font_size=float(rng.integers(15, 40)),
+            )
+        )
+    return img, mask, blk_list
+
+
+def test_line_crops_match_per_line_reference():
+    img, mask, blk_list = _make_page()
+
+    results = get_line_crops(img, mask, blk_list, textheight=64, max_ratio_vert=16, max_ratio_hor=8)
+    assert [(blk_idx, line_idx) for blk_idx, line_idx, _ in results] == [
+        (blk_idx, line_idx) for blk_idx, blk in enumerate(blk_list) for line_idx in range(len(blk.lines))
+    ]
+    assert any(len(chunks) > 1 for *_, chunks in results)
+
+    for blk_idx, line_idx, chunks in results:
+        blk = blk_list[blk_idx]
+        expected = _split_into_chunks(img, mask, blk, line_idx, 64, 16 if blk.vertical else 8, 2)
+        if blk.vertical:
+            expected = [cv2.rotate(chunk, cv2.ROTATE_90_CLOCKWISE) for chunk in expected]
+
+        assert [chunk.shape for chunk in chunks] == [chunk.shape for chunk in expected]
+        for chunk, expected_chunk in zip(chunks, expected, strict=True):
+            # homographies are computed differently, interpolated pixels can differ by rounding
+            assert np.abs(chunk.astype(int) - expected_chunk.astype(int)).max() <= 1
+
+
+def test_line_crops_reduced_mask():
+    img, mask, blk_list = _make_page(seed=1)
+    mask_reduced = cv2.resize(mask, (mask.shape[1] // 2, mask.shape[0] // 2), interpolation=cv2.INTER_AREA)
+
+    results = get_line_crops(img, mask, blk_list, textheight=64)
+    results_reduced = get_line_crops(img, mask_reduced, blk_list, textheight=64)
+    for (*_, chunks), (*_, chunks_reduced) in zip(results, results_reduced, strict=True):
+        assert len(chunks) == len(chunks_reduced)
+        assert sum(chunk.size for chunk in chunks) == sum(chunk.size for chunk in chunks_reduced)
+
+
+def test_line_crops_empty():
+    img, mask, _ = _make_page(num_blocks=0)
+    assert get_line_crops(img, mask, [], textheight=64) == []
+    assert get_density_kernel(64) is get_density_kernel(64)
@@ -0,0 +1,95 @@
+import shutil
+from unittest import mock
+
+from mokuro.manifest import VolumeManifest
+from mokuro.mokuro_generator import MokuroGenerator
+from mokuro.page_cache import DirPageCache
+from mokuro.run import run
+from mokuro.utils import load_json
+from mokuro.volume import Volume
+
+
+def test_page_state(tmp_path):
+    manifest = VolumeManifest(tmp_path / "vol.manifest.json")
+    manifest.set_page_done("p1", ("file", 100, 1))
+    manifest.set_page_done("sub/p2", ("zip", 200, 123))
+
+    assert manifest.get_page_state("p1", ("file", 100, 1)) == "done"
+    assert manifest.get_page_state("p1", ("file", 100, 2)) == "changed"
+    assert manifest.get_page_state("sub/p2", ("file", 200, 1)) == "unknown"
+    assert manifest.get_page_state("p3", ("file", 100, 1)) == "unknown"
+
+
+def test_save_load(tmp_path):
+    path = tmp_path / "_ocr" / "vol.manifest.json"
+    path_mokuro = tmp_path / "vol.mokuro"
+    path_mokuro.write_text("{}")
+
+    manifest = VolumeManifest(path)
+    manifest.set_page_done("p1", ("file", 100, 1))
+    manifest.set_mokuro_file(path_mokuro, ["p1"])
+    manifest.save()
+
+    manifest = VolumeManifest.load(path)
+    assert manifest.get_page_state("p1", ("file", 100, 1)) == "done"
+    assert manifest.is_mokuro_file_current(path_mokuro)
+    assert manifest.is_mokuro_file_current(path_mokuro, ["p1"])
+    assert not manifest.is_mokuro_file_current(path_mokuro, ["p1", "p2"])
+
+    path_mokuro.write_text("{} ")
+    assert not manifest.is_mokuro_file_current(path_mokuro)
+
+    manifest.set_page_done("p2", ("file", 100, 1))
+    assert manifest.mokuro_file is None
+
+
+def test_load_missing_or_invalid(tmp_path):
+    path = tmp_path / "vol.manifest.json"
+    assert VolumeManifest.load(path).pages == {}
+
+    path.write_text("{not json")
+    assert VolumeManifest.load(path).pages == {}
+
+
+def test_deleted_page_and_cache_entry(tmp_path, input_data_root):
+    path_vol = tmp_path / "test0" / "vol1"
+    shutil.copytree(input_data_root / "test0" / "vol1", path_vol)
+
+    def process():
+        run(path_vol, disable_ocr=True, disable_confirmation=True, legacy_html=False)
+        return [page["img_path"] for page in load_json(tmp_path / "test0" / "vol1.mokuro")["pages"]]
+
+    assert len(process()) == 6
+
+    # a deleted image is removed from the .mokuro file, even though all remaining pages are done
+    (path_vol / "002b.jpg").unlink()
+    assert "002b.jpg" not in process()
+
+    # while the .mokuro file is current, the page cache isn't listed
+    with mock.patch.object(DirPageCache, "keys", autospec=True, return_value=set()) as keys:
+        process()
+    keys.assert_not_called()
+
+    # a deleted page cache entry is generated again, when the .mokuro file needs to be generated
+    path_page_cache = tmp_path / "test0" / "_ocr" / "vol1" / "000a.json"
+    path_page_cache.unlink()
+    (path_vol / "002a.jpg").unlink()
+    assert "002a.jpg" not in process()
+    assert path_page_cache.is_file()
+
+
+def test_dotted_page_names(tmp_path, input_data_root):
+    path_vol = tmp_path / "test0" / "vol1"
+    path_vol.mkdir(parents=True)
+    for i, path in enumerate(sorted((input_data_root / "test0" / "vol1").iterdir())):
+        shutil.copy(path, path_vol / f"Chapter 1.5 p{i:02d}.jpg")
+
+    run(path_vol, disable_ocr=True, disable_confirmation=True, legacy_html=False)
+
+    # pages with the same name up to the dot are cached separately, and are done on the next run
+    (tmp_path / "test0" / "vol1.mokuro").unlink()
+    volume = Volume(path_vol)
+    pages, num_pages = MokuroGenerator._get_pages_to_process(volume)
+    assert pages == []
+    assert num_pages == 6
+    assert len(volume.page_cache.keys()) == 6
@@ -0,0 +1,45 @@
+import pytest
+import torch
+
+from mokuro.cache import cache
+from mokuro.model_snapshot import get_snapshot_path, load_or_create, load_snapshot
+
+
+@pytest.fixture
+def create(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "root", tmp_path)
+    calls = []
+
+    def create():
+        calls.append(1)
+        torch.manual_seed(0)
+        return torch.nn.Linear(4, 2).eval()
+
+    create.calls = calls
+    return create
+
+
+def test_load_or_create(create, tmp_path):
+    model = load_or_create(create, "linear", ["cpu"])
+    snapshot = load_or_create(create, "linear", ["cpu"])
+    assert len(create.calls) == 1
+    assert snapshot is not model
+    assert len(list((tmp_path / "snapshots").iterdir())) == 1
+
+    x = torch.rand(3, 4)
+    with torch.no_grad():
+        assert torch.equal(model(x), snapshot(x))
+
+    # a different key, e.g. another device, has its own snapshot
+    load_or_create(create, "linear", ["cuda"])
+    assert len(create.calls) == 2
+
+
+def test_corrupted_snapshot(create):
+    path = get_snapshot_path("linear", ["cpu"])
+    path.parent.mkdir(parents=True)
+    path.write_bytes(b"partial")
+
+    load_or_create(create, "linear", ["cpu"])
+    assert len(create.calls) == 1
+    assert isinstance(load_snapshot(path), torch.nn.Linear)
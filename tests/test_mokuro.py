@@ -70,8 +70,77 @@ def test_mokuro_zip(input_dir_name, unzip, tmp_path, input_data_root, expected_r
         assert not (input_dir / "vol1").exists()
 
 
+@pytest.mark.parametrize("input_dir_name", ["test0", "test2_zip"])
+def test_mokuro_workers(input_dir_name, tmp_path, input_data_root, expected_results_root):
+    input_dir, expected_results_dir = _setup_and_run(
+        input_dir_name, False, False, True, tmp_path, input_data_root, expected_results_root, False, workers=2
+    )
+
+    json_paths = sorted((input_dir / "_ocr/vol1").iterdir())
+    expected_json_paths = sorted((expected_results_dir / "_ocr/vol1").iterdir())
+    _validate_cache_jsons(json_paths, expected_json_paths)
+
+    mokuro_paths = sorted(input_dir.glob("*.mokuro"))
+    expected_mokuro_paths = sorted(expected_results_dir.glob("*.mokuro"))
+    _validate_mokuro_files(mokuro_paths, expected_mokuro_paths)
+
+
+@pytest.mark.parametrize("input_dir_name", ["test0"])
+def test_mokuro_onnx_detector(input_dir_name, tmp_path, input_data_root, expected_results_root):
+    pytest.importorskip("onnxruntime")
+
+    input_dir, expected_results_dir = _setup_and_run(
+        input_dir_name,
+        False,
+        False,
+        True,
+        tmp_path,
+        input_data_root,
+        expected_results_root,
+        False,
+        detector_backend="onnxruntime",
+    )
+
+    json_paths = sorted((input_dir / "_ocr/vol1").iterdir())
+    expected_json_paths = sorted((expected_results_dir / "_ocr/vol1").iterdir())
+    _validate_cache_jsons(json_paths, expected_json_paths)
+
+
+@pytest.mark.parametrize("input_dir_name", ["test0"])
+def test_mokuro_detector_batch(input_dir_name, tmp_path, input_data_root, expected_results_root):
+    input_dir, expected_results_dir = _setup_and_run(
+        input_dir_name,
+        False,
+        False,
+        True,
+        tmp_path,
+        input_data_root,
+        expected_results_root,
+        False,
+        detector_batch_size=4,
+    )
+
+    json_paths = sorted((input_dir / "_ocr/vol1").iterdir())
+    expected_json_paths = sorted((expected_results_dir / "_ocr/vol1").iterdir())
+    _validate_cache_jsons(json_paths, expected_json_paths)
+
+
+def test_quantized_ocr_accuracy(input_data_root):
+    from mokuro.quantization import check_quantized_ocr
+
+    assert check_quantized_ocr(input_data_root / "test0" / "vol1")
+
+
 def _setup_and_run(
-    input_dir_name, disable_ocr, unzip, disable_html, tmp_path, input_data_root, expected_results_root, regenerate
+    input_dir_name,
+    disable_ocr,
+    unzip,
+    disable_html,
+    tmp_path,
+    input_data_root,
+    expected_results_root,
+    regenerate,
+    **kwargs,
 ):
     input_dir = tmp_path / input_dir_name
     tag = input_dir_name
@@ -91,6 +160,7 @@ def _setup_and_run(
         disable_ocr=disable_ocr,
         unzip=unzip,
         legacy_html=not disable_html,
+        **kwargs,
     )
 
     if regenerate:
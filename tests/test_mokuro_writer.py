@@ -0,0 +1,69 @@
+import json
+from pathlib import Path
+
+from mokuro.mokuro_writer import MokuroFileWriter
+from mokuro.page_cache import DirPageCache
+
+HEADER = {"version": "0.0.0", "title": "title", "volume": "vol1"}
+
+
+def _setup(tmp_path):
+    img_paths = {Path(f"p{i}"): Path(f"p{i}.jpg") for i in [1, 2, 10, 3]}
+    page_cache = DirPageCache(tmp_path / "_ocr" / "vol1")
+    writer = MokuroFileWriter(tmp_path / "vol1.mokuro", HEADER, img_paths, page_cache)
+    return writer, page_cache
+
+
+def _read(path):
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def test_pages_are_appended_in_order(tmp_path):
+    writer, page_cache = _setup(tmp_path)
+
+    page_cache.put(Path("p2"), {"blocks": [2]})
+    writer.add_page(Path("p2"))
+    assert not writer.path.exists()
+
+    page_cache.put(Path("p1"), {"blocks": [1]})
+    writer.add_page(Path("p1"))
+    data = _read(writer.path)
+    assert data["partial"] is True
+    assert data["title"] == "title"
+    assert [page["img_path"] for page in data["pages"]] == ["p1.jpg", "p2.jpg"]
+
+    # a page without a result doesn't block the following pages
+    writer.add_page(Path("p3"))
+    page_cache.put(Path("p10"), {"blocks": [10]})
+    writer.add_page(Path("p10"))
+    data = _read(writer.path)
+    assert [page["img_path"] for page in data["pages"]] == ["p1.jpg", "p2.jpg", "p10.jpg"]
+    assert data["pages"][2]["blocks"] == [10]
+
+    page_cache.put(Path("p3"), {"blocks": [3]})
+    writer.finish()
+    data = _read(writer.path)
+    assert "partial" not in data
+    assert [page["img_path"] for page in data["pages"]] == ["p1.jpg", "p2.jpg", "p3.jpg", "p10.jpg"]
+    assert list(tmp_path.glob("*.tmp")) == []
+
+
+def test_existing_file_is_kept_until_finish(tmp_path):
+    writer, page_cache = _setup(tmp_path)
+    writer.path.write_text('{"pages": ["previous"]}', encoding="utf-8")
+
+    page_cache.put(Path("p1"), {"blocks": [1]})
+    writer.add_page(Path("p1"))
+    assert _read(writer.path) == {"pages": ["previous"]}
+    (path_partial,) = tmp_path.glob("*.tmp")
+    assert [page["img_path"] for page in _read(path_partial)["pages"]] == ["p1.jpg"]
+
+    writer.finish()
+    assert [page["img_path"] for page in _read(writer.path)["pages"]] == ["p1.jpg"]
+    assert list(tmp_path.glob("*.tmp")) == []
+
+
+def test_finish_without_pages(tmp_path):
+    writer, _ = _setup(tmp_path)
+    writer.finish()
+    assert _read(writer.path) == {**HEADER, "pages": []}
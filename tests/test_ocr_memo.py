@@ -0,0 +1,76 @@
+import numpy as np
+
+from mokuro.ocr_memo import LineOcrMemo
+
+
+def _crop(seed, shape=(64, 300, 3)):
+    return np.random.default_rng(seed).integers(0, 256, shape, dtype=np.uint8)
+
+
+def test_key():
+    memo = LineOcrMemo("model")
+    crop = _crop(0)
+
+    assert memo.key(crop) == memo.key(crop.copy())
+    assert memo.key(crop) != memo.key(_crop(1))
+    assert memo.key(crop) != LineOcrMemo("other model").key(crop)
+    # grayscale and BGR versions of a crop are the same to the OCR model
+    assert memo.key(np.dstack([crop[..., 0]] * 3)) == memo.key(crop[..., 0])
+
+
+def test_put_get():
+    memo = LineOcrMemo("model")
+    key = memo.key(_crop(0))
+
+    assert memo.get(key) is None
+    memo.put(key, "")
+    assert memo.get(key) == ""
+    assert (memo.num_hits, memo.num_misses) == (1, 1)
+
+
+def test_lru_eviction():
+    memo = LineOcrMemo("model", max_entries=3)
+    for key in "abc":
+        memo.put(key, key)
+
+    # using an entry makes it the most recently used one
+    assert memo.get("a") == "a"
+    memo.put("d", "d")
+    assert memo.get("b") is None
+    assert [memo.get(key) for key in "acd"] == ["a", "c", "d"]
+
+    memo = LineOcrMemo("model", max_bytes=10)
+    for key in "abcd":
+        memo.put(key, "x" * 3)
+    assert len(memo) == 2
+
+
+def test_persistence(tmp_path):
+    path = tmp_path / "memo.json"
+    memo = LineOcrMemo("model", path=path)
+    memo.put("a", "テキスト")
+    memo.save()
+
+    # another process saves to the same file in the meantime
+    other_memo = LineOcrMemo("model", path=path)
+    other_memo.put("b", "b")
+    other_memo.save()
+
+    memo.put("c", "c")
+    memo.save()
+
+    memo = LineOcrMemo("model", path=path)
+    assert [memo.get(key) for key in "abc"] == ["テキスト", "b", "c"]
+
+
+def test_save_interval(tmp_path):
+    path = tmp_path / "memo.json"
+    memo = LineOcrMemo("model", path=path)
+    memo.put("a", "a")
+
+    # not saved yet, if it's called e.g. after each volume
+    memo.save(min_interval=60)
+    assert not path.exists()
+
+    memo.save()
+    assert path.exists()
@@ -0,0 +1,42 @@
+import os
+
+from mokuro.ocr_store import OcrStore
+
+
+def test_put_get(tmp_path):
+    store = OcrStore(tmp_path, "config")
+
+    key = store.key(b"image")
+    assert store.get(key) is None
+
+    store.put(key, {"blocks": ["a"]})
+    assert store.get(key) == {"blocks": ["a"]}
+    assert (store.num_hits, store.num_misses) == (1, 1)
+
+
+def test_key_depends_on_content_and_config(tmp_path):
+    store = OcrStore(tmp_path, "config")
+
+    assert store.key(b"image") == store.key(b"image")
+    assert store.key(b"image") != store.key(b"other image")
+    assert store.key(b"image") != OcrStore(tmp_path, "other config").key(b"image")
+
+
+def test_lru_eviction(tmp_path):
+    store = OcrStore(tmp_path, "config", max_size=1500)
+    result = {"text": "x" * 90}
+
+    keys = [store.key(str(i).encode()) for i in range(10)]
+    for i, key in enumerate(keys):
+        store.put(key, result)
+        os.utime(store._path(key), (i, i))
+
+    # using a result makes it the most recently used one
+    assert store.get(keys[0]) is not None
+
+    for i in range(10, 15):
+        store.put(store.key(str(i).encode()), result)
+
+    assert store.get(keys[0]) is not None
+    assert store.get(keys[1]) is None
+    assert sum(size for _, size, _ in store._scan()) <= 1500
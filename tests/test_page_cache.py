@@ -0,0 +1,78 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from mokuro.page_cache import DirPageCache, SqlitePageCache, find_page_caches, get_page_cache, open_page_cache
+
+RESULTS = {
+    Path("000a"): {"img_width": 100, "blocks": [{"lines": ["テスト"], "box": np.array([1, 2, 3, 4])}]},
+    Path("sub/001"): {"img_width": 200, "blocks": []},
+}
+
+# page names with dots, which must not be taken for suffixes
+DOTTED_RESULTS = {
+    Path("Chapter 1.5 p01"): {"img_width": 101, "blocks": []},
+    Path("Chapter 1.5 p02"): {"img_width": 102, "blocks": []},
+    Path("v01.ch2/1.5"): {"img_width": 103, "blocks": []},
+    Path("v01.ch2/1"): {"img_width": 104, "blocks": []},
+}
+
+
+@pytest.mark.parametrize("backend", ["dir", "sqlite"])
+def test_put_get(backend, tmp_path):
+    page_cache = get_page_cache(tmp_path / "_ocr" / "vol1", backend)
+    assert not page_cache.exists()
+    assert page_cache.keys() == set()
+
+    page_cache.put(Path("000a"), RESULTS[Path("000a")])
+    page_cache.put_many([(Path("sub/001"), RESULTS[Path("sub/001")])])
+
+    assert page_cache.exists()
+    assert page_cache.keys() == set(RESULTS)
+    assert page_cache.get(Path("000a"))["blocks"][0]["box"] == [1, 2, 3, 4]
+    assert page_cache.get(Path("missing")) is None
+    assert dict(page_cache.items()).keys() == RESULTS.keys()
+
+    page_cache.remove()
+    assert not page_cache.exists()
+
+
+@pytest.mark.parametrize("backend", ["dir", "sqlite"])
+def test_dotted_keys(backend, tmp_path):
+    page_cache = get_page_cache(tmp_path / "_ocr" / "vol1", backend)
+    page_cache.put_many(DOTTED_RESULTS.items())
+
+    assert page_cache.keys() == set(DOTTED_RESULTS)
+    for key, result in DOTTED_RESULTS.items():
+        assert page_cache.get(key) == result
+    assert dict(page_cache.items()) == DOTTED_RESULTS
+
+
+def test_backend_paths(tmp_path):
+    path_ocr_cache = tmp_path / "_ocr" / "vol1"
+
+    dir_page_cache = get_page_cache(path_ocr_cache, "dir")
+    assert isinstance(dir_page_cache, DirPageCache)
+    dir_page_cache.put(Path("000a"), RESULTS[Path("000a")])
+    assert (path_ocr_cache / "000a.json").is_file()
+    dir_page_cache.put(Path("v01.ch2/1.5"), RESULTS[Path("000a")])
+    assert (path_ocr_cache / "v01.ch2" / "1.5.json").is_file()
+
+    sqlite_page_cache = get_page_cache(path_ocr_cache, "sqlite")
+    assert isinstance(sqlite_page_cache, SqlitePageCache)
+    assert sqlite_page_cache.path == tmp_path / "_ocr" / "vol1.sqlite"
+
+    with pytest.raises(ValueError):
+        get_page_cache(path_ocr_cache, "unknown")
+
+
+@pytest.mark.parametrize("src_backend,dst_backend", [("dir", "sqlite"), ("sqlite", "dir")])
+def test_migration(src_backend, dst_backend, tmp_path):
+    path_ocr_cache = tmp_path / "_ocr" / "vol1"
+    get_page_cache(path_ocr_cache, src_backend).put_many(RESULTS.items())
+
+    page_cache = open_page_cache(path_ocr_cache, dst_backend)
+
+    assert page_cache.keys() == set(RESULTS)
+    assert [type(p) for p in find_page_caches(path_ocr_cache)] == [type(page_cache)]
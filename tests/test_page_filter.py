@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from mokuro.page_filter import PageFilter, classify_page
+from mokuro.utils import imread
+
+
+def test_classify_page(input_data_root):
+    page = np.full((1600, 1100, 3), 250, dtype=np.uint8)
+    assert classify_page(page) == "blank"
+
+    # a page number doesn't make a page non-blank
+    page[1550:1570, 540:560] = 0
+    assert classify_page(page) == "blank"
+
+    page[200:1400, 100:1000:20] = 0
+    assert classify_page(page) is None
+
+    # the cover is a full color page, other pages are black and white with text
+    vol_dir = input_data_root / "test0/vol1"
+    assert classify_page(imread(vol_dir / "000a.jpg")) == "color"
+    assert classify_page(imread(vol_dir / "000a.jpg"), max_color_fraction=None) is None
+    assert classify_page(imread(vol_dir / "000a.jpg")[..., 0]) is None
+    for path in ["000b.jpg", "001a.jpg", "002b.jpg"]:
+        assert classify_page(imread(vol_dir / path)) is None
+
+
+def test_page_filter_stats():
+    page_filter = PageFilter("report")
+    blank = np.zeros((100, 100, 3), dtype=np.uint8)
+
+    assert page_filter.check(blank) == "blank"
+    page_filter.report("blank", ["block"], "page.jpg")
+    page_filter.report(None, ["block"], "page.jpg")
+    assert page_filter.num_pages == 1
+    assert page_filter.num_flagged == {"blank": 1}
+    assert page_filter.num_flagged_with_text == 1
+
+    with pytest.raises(ValueError):
+        PageFilter("unknown")
@@ -0,0 +1,148 @@
+import threading
+import time
+
+import pytest
+
+from mokuro.pipeline import run_page_pipeline
+
+
+def _run(pages, **kwargs):
+    written = {}
+
+    stages = {
+        "read": lambda page: page * 10,
+        "detect": lambda img: img + 1,
+        "recognize": lambda img, detection: (img, detection),
+        "write": lambda page, result: written.__setitem__(page, result),
+    }
+    stages.update(kwargs)
+
+    results = list(run_page_pipeline(pages, **stages))
+    return results, written
+
+
+def test_results_in_input_order():
+    pages = list(range(20))
+
+    def slow_read(page):
+        time.sleep(0.001 * (page % 3))
+        return page * 10
+
+    results, written = _run(pages, read=slow_read)
+
+    assert [page for page, error in results] == pages
+    assert all(error is None for page, error in results)
+    assert written == {page: (page * 10, page * 10 + 1) for page in pages}
+
+
+def test_empty():
+    assert _run([]) == ([], {})
+
+
+@pytest.mark.parametrize("stage", ["read", "detect", "recognize", "write"])
+def test_errors_are_reported_per_page(stage):
+    def read(page):
+        if stage == "read" and page == 3:
+            raise ValueError("read failed")
+        return page
+
+    def detect(img):
+        if stage == "detect" and img == 3:
+            raise ValueError("detect failed")
+        return img
+
+    def recognize(img, detection):
+        if stage == "recognize" and img == 3:
+            raise ValueError("recognize failed")
+        return img
+
+    def write(page, result):
+        if stage == "write" and page == 3:
+            raise ValueError("write failed")
+
+    results, _ = _run(list(range(6)), read=read, detect=detect, recognize=recognize, write=write)
+
+    assert [page for page, error in results] == list(range(6))
+    errors = {page: str(error) for page, error in results if error is not None}
+    assert errors == {3: f"{stage} failed"}
+
+
+def test_stages_overlap_with_bounded_buffering():
+    max_pending = 2
+    read_count = 0
+    recognized_count = 0
+    max_ahead = 0
+    detect_started = threading.Event()
+    lock = threading.Lock()
+
+    def read(page):
+        nonlocal read_count, max_ahead
+        with lock:
+            read_count += 1
+            max_ahead = max(max_ahead, read_count - recognized_count)
+        return page
+
+    def detect(img):
+        if img == 1:
+            detect_started.set()
+        return img
+
+    def recognize(img, detection):
+        nonlocal recognized_count
+        if img == 0:
+            # detection of the next page runs while this page is being recognized
+            assert detect_started.wait(timeout=5)
+        time.sleep(0.005)
+        with lock:
+            recognized_count += 1
+        return img
+
+    results, _ = _run(list(range(20)), read=read, detect=detect, recognize=recognize, max_pending=max_pending)
+
+    assert all(error is None for page, error in results)
+    # pages being read + waiting for detection + detected and waiting for recognition + being detected
+    assert max_ahead <= 2 * max_pending + 2
+
+
+def test_stops_early_when_consumer_stops():
+    read_pages = []
+
+    def read(page):
+        read_pages.append(page)
+        return page
+
+    results = run_page_pipeline(
+        list(range(100)),
+        read=read,
+        detect=lambda img: img,
+        recognize=lambda img, detection: img,
+        write=lambda page, result: None,
+        max_pending=2,
+    )
+    assert next(results) == (0, None)
+    results.close()
+
+    assert len(read_pages) < 20
+
+
+def test_batched_detection():
+    batch_sizes = []
+
+    def read(page):
+        if page == 4:
+            raise ValueError("read failed")
+        return page
+
+    def detect(imgs):
+        batch_sizes.append(len(imgs))
+        if 8 in imgs:
+            raise ValueError("detect failed")
+        return [img + 100 for img in imgs]
+
+    results, written = _run(list(range(10)), read=read, detect=detect, detect_batch_size=3)
+
+    assert [page for page, error in results] == list(range(10))
+    errors = {page: str(error) for page, error in results if error is not None}
+    assert errors == {4: "read failed", 6: "detect failed", 7: "detect failed", 8: "detect failed"}
+    assert batch_sizes == [3, 2, 3, 1]
+    assert written[5] == (5, 105)
@@ -0,0 +1,125 @@
+import http.client
+import json
+import threading
+
+import pytest
+
+from mokuro import MokuroGenerator
+from mokuro.client import get_status, submit_job
+from mokuro.server import OcrServer, create_http_server
+
+
+class FakePageOcr:
+    def __init__(self):
+        self.pages = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, img_path, timings=None):
+        self.started.set()
+        self.release.wait()
+        self.pages.append(img_path.name)
+        timings["recognize"] = 0.0
+        return {"img_path": img_path.name, "blocks": []}
+
+    def report(self):
+        pass
+
+    def save(self):
+        pass
+
+
+def _init_fake_models(mg):
+    if mg.mpocr is None:
+        mg.mpocr = FakePageOcr()
+
+
+@pytest.fixture
+def ocr_server(monkeypatch):
+    monkeypatch.setattr(MokuroGenerator, "init_models", _init_fake_models)
+    ocr_server = OcrServer()
+    yield ocr_server
+    ocr_server.stop()
+
+
+@pytest.mark.parametrize("unix_socket", [False, True])
+def test_page_job(ocr_server, tmp_path, input_data_root, unix_socket):
+    httpd, address = create_http_server(
+        ocr_server, port=0, unix_socket=tmp_path / "mokuro.sock" if unix_socket else None
+    )
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    try:
+        img_path = input_data_root / "test0" / "vol1" / "000a.jpg"
+        events = list(submit_job(address, "page", img_path))
+        assert [event["event"] for event in events] == ["job_queued", "job_start", "page_result", "job_finish"]
+        assert events[2]["result"] == {"img_path": "000a.jpg", "blocks": []}
+        assert events[-1]["error"] is None
+
+        events = list(submit_job(address, "page", tmp_path / "missing.jpg"))
+        assert events[-1]["error"] is not None
+
+        with pytest.raises(RuntimeError, match="Unknown job type"):
+            list(submit_job(address, "chapter", img_path))
+
+        assert get_status(address)["done"] == 2
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def test_priority(ocr_server, input_data_root):
+    img_dir = input_data_root / "test0" / "vol1"
+    mpocr = ocr_server.generators[0].mpocr
+
+    # the first job blocks the instance, until all other jobs are queued
+    mpocr.release.clear()
+    jobs = [ocr_server.submit("page", img_dir / "000a.jpg")]
+    mpocr.started.wait()
+    jobs += [
+        ocr_server.submit("page", img_dir / name, priority=priority)
+        for name, priority in [("000b.jpg", 0), ("001a.jpg", 1)]
+    ]
+    mpocr.release.set()
+    for job in jobs:
+        list(job.iter_events())
+
+    assert mpocr.pages == ["000a.jpg", "001a.jpg", "000b.jpg"]
+
+
+def test_ocr_store_hit(monkeypatch, tmp_path, input_data_root):
+    monkeypatch.setattr(MokuroGenerator, "init_models", _init_fake_models)
+    ocr_server = OcrServer(ocr_store=tmp_path / "ocr_store")
+    try:
+        img_path = input_data_root / "test0" / "vol1" / "000a.jpg"
+        for expected_hit in [False, True]:
+            (event,) = [event for event in ocr_server.submit("page", img_path).iter_events() if "result" in event]
+            assert event["ocr_store_hit"] is expected_hit
+    finally:
+        ocr_server.stop()
+
+
+def test_cross_origin_requests(ocr_server, input_data_root):
+    httpd, _ = create_http_server(ocr_server, port=0)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    try:
+        body = json.dumps({"type": "page", "path": str(input_data_root / "test0" / "vol1" / "000a.jpg")})
+        host, port = httpd.server_address[:2]
+
+        def post(headers):
+            conn = http.client.HTTPConnection(host, port, timeout=10)
+            try:
+                conn.request("POST", "/jobs", body=body, headers=headers)
+                return conn.getresponse().status
+            finally:
+                conn.close()
+
+        # a form or a no-cors fetch from a web page can't set a JSON content type
+        assert post({"Content-Type": "text/plain"}) == 415
+        assert post({"Content-Type": "application/json", "Origin": "https://example.com"}) == 403
+        assert post({"Content-Type": "application/json", "Origin": f"http://{host}:{port}"}) == 200
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
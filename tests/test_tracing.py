@@ -0,0 +1,64 @@
+import json
+import threading
+
+import pytest
+
+from mokuro import tracing
+
+
+def test_disabled():
+    assert tracing.get_trace_path() is None
+    with tracing.span("page", path="a.jpg") as span_args:
+        span_args["num_blocks"] = 1
+
+    assert tracing.traced("call", lambda x: x + 1)(1) == 2
+
+
+def test_trace(tmp_path):
+    path = tmp_path / "trace" / "trace.json"
+    tracing.start_tracing(path)
+    try:
+        assert tracing.get_trace_path() == path
+        with tracing.span("page", path=tmp_path / "a.jpg") as span_args:
+            with tracing.span("detect"):
+                pass
+            span_args["num_blocks"] = 3
+
+        with pytest.raises(ValueError), tracing.span("recognize"):
+            raise ValueError("failed")
+
+        thread = threading.Thread(target=tracing.traced("call", lambda: None), name="worker-thread")
+        thread.start()
+        thread.join()
+
+        # events saved by a worker process, and a leftover of an interrupted run
+        run_id = tracing.get_run_id()
+        (tmp_path / "trace" / f"trace.json.{run_id}.123.part").write_text(json.dumps([{"name": "worker", "ph": "X"}]))
+        (tmp_path / "trace" / "trace.json.0123456789ab.456.part").write_text(json.dumps([{"name": "old", "ph": "X"}]))
+    finally:
+        tracing.stop_tracing()
+
+    assert tracing.get_trace_path() is None
+    assert [part_path.name for part_path in path.parent.glob("*.part")] == ["trace.json.0123456789ab.456.part"]
+
+    events = json.loads(path.read_text())["traceEvents"]
+    spans = {event["name"]: event for event in events if event["ph"] == "X"}
+    assert set(spans) == {"page", "detect", "recognize", "call", "worker"}
+    assert spans["page"]["args"] == {"path": str(tmp_path / "a.jpg"), "num_blocks": 3}
+    assert spans["page"]["ts"] <= spans["detect"]["ts"]
+    assert spans["page"]["ts"] + spans["page"]["dur"] >= spans["detect"]["ts"] + spans["detect"]["dur"]
+    assert spans["recognize"]["args"] == {"error": "ValueError('failed')"}
+
+    thread_names = {event["args"]["name"] for event in events if event["name"] == "thread_name"}
+    assert "worker-thread" in thread_names
+
+
+def test_max_events():
+    tracer = tracing.Tracer(max_events=3)
+    for i in range(5):
+        with tracer.span(str(i), {}):
+            pass
+
+    events = tracer.get_events()
+    assert [event["name"] for event in events] == ["thread_name", "2", "3", "4"]
+    assert tracer.num_dropped == 2
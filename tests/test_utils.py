@@ -0,0 +1,176 @@
+import io
+import zipfile
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from mokuro.utils import (
+    ArchiveMember,
+    InvalidImage,
+    PageImage,
+    get_archive_img_members,
+    get_file_size,
+    get_image_format,
+    imdecode,
+    imdecode_pil,
+    imread,
+    read_bytes,
+    unzip,
+)
+
+IMG_SUFFIXES = (".jpg", ".png")
+
+
+def _make_zip(path, names, input_data_root):
+    img_bytes = (input_data_root / "test0/vol1/000a.jpg").read_bytes()
+    with zipfile.ZipFile(path, "w") as zf:
+        for name in names:
+            if name.endswith("/"):
+                zf.writestr(name, "")
+            else:
+                zf.writestr(name, img_bytes)
+
+
+@pytest.mark.parametrize(
+    "names",
+    [
+        ["vol1/", "vol1/001.jpg", "vol1/002.jpg", "vol1/notes.txt"],
+        ["001.jpg", "sub/002.jpg", "sub/"],
+        ["vol1/001.jpg", "001.jpg"],
+        ["other/001.jpg", "other/002.png"],
+    ],
+)
+def test_archive_img_members_match_unzip(names, tmp_path, input_data_root):
+    path_zip = tmp_path / "vol1.cbz"
+    _make_zip(path_zip, names, input_data_root)
+
+    members = get_archive_img_members(path_zip, IMG_SUFFIXES)
+
+    path_dst = tmp_path / "vol1"
+    unzip(path_zip, path_dst)
+    extracted = {p.relative_to(path_dst) for p in path_dst.glob("**/*") if p.suffix in IMG_SUFFIXES}
+
+    assert set(members) == extracted
+    for img_path_rel, name in members.items():
+        assert (path_dst / img_path_rel).read_bytes() == zipfile.ZipFile(path_zip).read(name)
+
+
+def test_imread_archive_member(tmp_path, input_data_root):
+    path_zip = tmp_path / "vol1.zip"
+    _make_zip(path_zip, ["vol1/001.jpg"], input_data_root)
+
+    img = imread(ArchiveMember(path_zip, "vol1/001.jpg"))
+    expected = imread(input_data_root / "test0/vol1/000a.jpg")
+    assert np.array_equal(img, expected)
+
+    with pytest.raises(KeyError):
+        imread(ArchiveMember(path_zip, "vol1/missing.jpg"))
+
+
+def test_replaced_archive(tmp_path, input_data_root):
+    path_zip = tmp_path / "vol1.cbz"
+    _make_zip(path_zip, ["001.jpg"], input_data_root)
+    assert get_archive_img_members(path_zip, IMG_SUFFIXES) == {Path("001.jpg"): "001.jpg"}
+
+    path_new = tmp_path / "new.cbz"
+    with zipfile.ZipFile(path_new, "w") as zf:
+        zf.writestr("001.jpg", b"new")
+        zf.writestr("002.jpg", b"new")
+    path_new.replace(path_zip)
+
+    assert set(get_archive_img_members(path_zip, IMG_SUFFIXES)) == {Path("001.jpg"), Path("002.jpg")}
+    assert read_bytes(ArchiveMember(path_zip, "001.jpg")) == b"new"
+    assert get_file_size(ArchiveMember(path_zip, "002.jpg")) == 3
+
+
+def test_imread_invalid_image(tmp_path):
+    path = tmp_path / "broken.jpg"
+    path.write_bytes(b"not an image")
+
+    with pytest.raises(InvalidImage):
+        imread(path)
+
+    with pytest.raises(FileNotFoundError):
+        imread(Path(tmp_path / "missing.jpg"))
+
+
+def test_page_image_reduced_jpeg(tmp_path):
+    img = np.random.default_rng(0).integers(0, 256, (4000, 2800, 3), dtype=np.uint8)
+    path = tmp_path / "page.jpg"
+    Image.fromarray(img).save(path, quality=90)
+
+    page = PageImage(path.read_bytes(), detection_size=1024, path=path)
+    assert (page.width, page.height) == (2800, 4000)
+    assert page.reduced.shape == (2000, 1400, 3)
+    assert page.scale == 2
+    assert page.full.shape == (4000, 2800)
+
+
+def test_page_image_small_or_not_jpeg(tmp_path, input_data_root):
+    page = PageImage((input_data_root / "test0/vol1/000a.jpg").read_bytes(), detection_size=1024)
+    assert page.scale == 1
+    assert page.full is page.reduced
+
+    path = tmp_path / "page.png"
+    Image.new("RGB", (2000, 3000)).save(path)
+    page = PageImage(path.read_bytes(), detection_size=1024)
+    assert page.scale == 1
+    assert page.reduced.shape == (3000, 2000, 3)
+
+    with pytest.raises(InvalidImage):
+        PageImage(b"not an image", detection_size=1024)
+
+
+def _encode(img, fmt, mode="RGB", **kwargs):
+    buf = io.BytesIO()
+    Image.fromarray(img).convert(mode).save(buf, format=fmt, **kwargs)
+    return buf.getvalue()
+
+
+@pytest.mark.parametrize(
+    "fmt,mode,expected_format",
+    [
+        ("JPEG", "RGB", "jpeg"),
+        ("JPEG", "L", "jpeg"),
+        ("PNG", "RGB", "png"),
+        ("PNG", "L", "png"),
+        ("PNG", "RGBA", "png"),
+        ("PNG", "P", "png"),
+        ("WEBP", "RGB", None),
+    ],
+)
+def test_imdecode_matches_pil(fmt, mode, expected_format):
+    img = np.random.default_rng(0).integers(0, 256, (300, 200, 3), dtype=np.uint8)
+    data = _encode(img, fmt, mode)
+
+    assert get_image_format(data) == expected_format
+    decoded = imdecode(data)
+    expected = imdecode_pil(data)
+    assert decoded.shape == expected.shape == (300, 200, 3)
+    assert decoded.dtype == np.uint8
+    # JPEG decoders may round IDCT results differently
+    assert np.abs(decoded.astype(int) - expected.astype(int)).max() <= (2 if fmt == "JPEG" else 0)
+
+
+def test_imdecode_falls_back_to_pil(input_data_root):
+    data = (input_data_root / "test0/vol1/000a.jpg").read_bytes()
+
+    # zero padding after the end marker is allowed
+    assert get_image_format(data + b"\0" * 100) == "jpeg"
+
+    # truncated JPEGs are decoded by OpenCV without an error, but are invalid
+    assert get_image_format(data[: len(data) // 2]) is None
+    with pytest.raises(InvalidImage):
+        imdecode(data[: len(data) // 2])
+
+    # corrupted data with a valid signature
+    with pytest.raises(InvalidImage):
+        imdecode(data[:100] + b"\0" * 1000 + b"\xff\xd9")
+
+    frames = [Image.new("RGB", (64, 64), color) for color in ["red", "blue"]]
+    buf = io.BytesIO()
+    frames[0].save(buf, format="PNG", save_all=True, append_images=frames[1:])
+    assert get_image_format(buf.getvalue()) is None
+    assert (imdecode(buf.getvalue())[0, 0] == [0, 0, 255]).all()
@@ -0,0 +1,101 @@
+import sys
+import threading
+import zipfile
+
+import pytest
+
+from mokuro import watch
+from mokuro.watch import Debouncer, find_volumes, watch_library
+
+
+def _add_page(path, name="001.jpg"):
+    path.mkdir(parents=True, exist_ok=True)
+    (path / name).write_bytes(b"jpg")
+
+
+def test_find_volumes(tmp_path):
+    _add_page(tmp_path / "title" / "vol1")
+    (tmp_path / "title" / "vol2.cbz").write_bytes(b"")
+    _add_page(tmp_path / "title" / "_ocr" / "vol1")
+
+    assert find_volumes(tmp_path / "title" / "vol1" / "001.jpg", tmp_path) == [tmp_path / "title"]
+    assert find_volumes(tmp_path / "title.mokuro", tmp_path) == []
+
+    assert find_volumes(tmp_path / "title" / "vol1" / "001.jpg", tmp_path, recursive=True) == [
+        tmp_path / "title" / "vol1"
+    ]
+    assert find_volumes(tmp_path / "title" / "vol2.cbz", tmp_path, recursive=True) == [tmp_path / "title" / "vol2.cbz"]
+    assert find_volumes(tmp_path / "title", tmp_path, recursive=True) == [
+        tmp_path / "title" / "vol1",
+        tmp_path / "title" / "vol2.cbz",
+    ]
+    # mokuro's own output
+    assert find_volumes(tmp_path / "title" / "_ocr" / "vol1" / "001.jpg", tmp_path, recursive=True) == []
+    assert find_volumes(tmp_path / "title" / "vol1.mokuro", tmp_path, recursive=True) == []
+
+
+def test_debouncer(tmp_path):
+    volume = tmp_path / "vol1"
+    _add_page(volume)
+    archive = tmp_path / "vol2.zip"
+    archive.write_bytes(b"PK partial copy")
+
+    debouncer = Debouncer(debounce=0)
+    debouncer.touch(volume)
+    debouncer.touch(archive)
+    debouncer.touch(tmp_path / "deleted")
+    # the first check records the state of volumes, they are ready once it doesn't change
+    assert debouncer.pop_ready() == []
+    assert debouncer.pop_ready() == [volume]
+
+    # an incomplete archive is not ready, until it's a valid zip file
+    assert debouncer.pop_ready() == []
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("001.jpg", b"jpg")
+    assert debouncer.pop_ready() == []
+    assert debouncer.pop_ready() == [archive]
+    assert debouncer.pending == {}
+
+
+@pytest.mark.parametrize(
+    "backend",
+    ["poll", pytest.param("inotify", marks=pytest.mark.skipif(sys.platform != "linux", reason="Linux only"))],
+)
+def test_watch_library(tmp_path, monkeypatch, backend):
+    monkeypatch.setattr(watch, "CHECK_INTERVAL", 0.05)
+    _add_page(tmp_path / "title" / "vol1")
+
+    processed = []
+    stop = threading.Event()
+
+    def on_start():
+        # volumes added while the existing ones are processed
+        _add_page(tmp_path / "title" / "vol2")
+        (tmp_path / "title" / "vol2.mokuro").write_text("{}")
+        _add_page(tmp_path / "title" / "extracted")
+
+    def process(volume_paths):
+        processed.extend(volume_paths)
+        stop.set()
+
+    thread = threading.Thread(
+        target=watch_library,
+        args=([tmp_path], process),
+        kwargs={
+            "recursive": True,
+            "backend": backend,
+            "debounce": 0.2,
+            "poll_interval": 0.1,
+            "stop": stop,
+            "on_start": on_start,
+            "is_ignored": lambda path: path.name == "extracted",
+        },
+    )
+    thread.start()
+    try:
+        thread.join(timeout=10)
+    finally:
+        stop.set()
+        thread.join()
+
+    assert processed == [tmp_path / "title" / "vol2"]